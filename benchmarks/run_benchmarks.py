@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+Reproducible benchmark suite for the hot paths of the toolbox.
+
+Times the simulator (sim_lnm.run_sim), the readouts (tasks.run_mem_cap,
+tasks.run_pttn_recog, coding.basic_decoder), the state-space metrics
+(metrics.state_metrics), every generator in
+nulls.construct_null_model and the local/global graph metrics in
+network_properties on synthetic inputs, sweeping the number of nodes (N),
+time steps (T), density and number of alphas, plus the time to import the
+main modules in a fresh interpreter (paid by every worker of a process pool).
+Results are stored as JSON so they can be compared across commits.
+
+Usage
+-----
+    python benchmarks/run_benchmarks.py run [--quick] [--filter NAME] [--output FILE]
+    python benchmarks/run_benchmarks.py compare BASELINE.json NEW.json [--threshold 0.1]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+from itertools import product
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEED = 1234
+
+IMPORTED_MODULES = ['numpy',
+                    'reservoir.simulator.sim_lnm',
+                    'reservoir.tasks.tasks',
+                    'reservoir.tasks.coding',
+                    'reservoir.network.nulls',
+                    'reservoir.network.network_properties',
+                    'reservoir.sweep',
+                    ]
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# SYNTHETIC INPUTS
+# ----------------------------------------------------------------------------------------------------------------------
+def make_network(N, density, seed=SEED):
+    """
+        Random weighted undirected connected network with a ring backbone.
+    """
+    rs = np.random.RandomState(seed)
+
+    conn = rs.uniform(0.01, 1, (N, N)) * (rs.rand(N, N) < density)
+    conn = np.triu(conn, 1)
+
+    ring = np.arange(N)
+    conn[ring, (ring+1) % N] = rs.uniform(0.01, 1, N)
+
+    conn = np.triu(conn, 1) + np.triu(conn, 1).T
+
+    return conn
+
+
+def make_modules(N, n_modules=5):
+    return np.repeat(np.arange(n_modules), int(np.ceil(N/n_modules)))[:N]
+
+
+def make_states(N, T, n_alphas, seed=SEED):
+    rs = np.random.RandomState(seed)
+    return [rs.uniform(-1, 1, (2, T, N)).astype(np.float32) for _ in range(n_alphas)]
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# BENCHMARKS
+# ----------------------------------------------------------------------------------------------------------------------
+# every benchmark is a setup function that receives the parameters of one point
+# of the sweep and returns the callable to be timed
+
+def setup_import(module):
+    """
+        Imports module in a fresh interpreter. The timed call includes the
+        start-up of the interpreter (compare with module='numpy').
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cmd = [sys.executable, '-c', f'import {module}']
+
+    def func():
+        subprocess.run(cmd, cwd=root, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        func()
+    except subprocess.CalledProcessError:
+        raise ImportError(f'{module} cannot be imported')
+
+    return func
+
+
+def setup_run_sim(N, T, n_alphas, density=0.1):
+    from reservoir.simulator import sim_lnm
+
+    conn = make_network(N, density)
+    conn = conn/np.max(np.linalg.eigvalsh(conn))
+    inputs = np.random.RandomState(SEED).uniform(-1, 1, (T, 1))
+    w_in = sim_lnm.get_input_conn(1, N, np.arange(10))
+    alphas = list(np.linspace(0.5, 1.5, n_alphas))
+
+    return lambda: sim_lnm.run_sim(w_in, conn, inputs, alphas=alphas)
+
+
+def setup_run_mem_cap(N, T):
+    from reservoir.tasks import tasks
+
+    rs = np.random.RandomState(SEED)
+    X = (rs.uniform(-1, 1, (T, N)), rs.uniform(-1, 1, (T, N)))
+    Y = (rs.uniform(-1, 1, T), rs.uniform(-1, 1, T))
+
+    return lambda: tasks.run_mem_cap(X, Y)
+
+
+def setup_run_pttn_recog(N, T, n_patterns=10, time_len=50):
+    from reservoir.tasks import tasks
+
+    rs = np.random.RandomState(SEED)
+    n_samples = T//time_len
+    labels = np.repeat(np.arange(n_samples) % n_patterns, time_len)
+    Y = -1*np.ones((n_samples*time_len, n_patterns))
+    Y[np.arange(len(labels)), labels] = 1
+
+    X = (rs.uniform(-1, 1, (len(Y), N)), rs.uniform(-1, 1, (len(Y), N)))
+    time_lens = time_len*np.ones(n_samples, dtype=int)
+
+    return lambda: tasks.run_pttn_recog(X, (Y, Y), time_lens=time_lens)
+
+
+def setup_basic_decoder(N, T, n_alphas, density=0.1):
+    from reservoir.tasks import coding
+
+    conn = make_network(N, density)
+    states = make_states(N, T, n_alphas)
+    target = np.random.RandomState(SEED).uniform(-1, 1, (2, T))
+
+    return lambda: coding.basic_decoder(task='mem_cap',
+                                        target=target,
+                                        reservoir_states=states,
+                                        readout_modules=make_modules(N),
+                                        bin_conn=conn.astype(bool).astype(int),
+                                        alphas=list(range(n_alphas)),
+                                        TAU=np.arange(1, 6),
+                                        seed=SEED
+                                        )
+
+
+def setup_state_metrics(N, T, n_alphas):
+    from reservoir.tasks import metrics
+
+    states = make_states(N, T, n_alphas)
+    return lambda: metrics.state_metrics(states, readout_modules=make_modules(N), alphas=list(range(n_alphas)))
+
+
+def setup_null_model(null_type, N, density):
+    from reservoir.network import nulls
+
+    conn = make_network(N, density)
+    kwargs = {'rand_mio':                {'conn': conn, 'swaps': 1},
+              'watts_and_strogatz':      {'conn': conn, 'p_conn': [0.1]},
+              'randmio_one_unperturbed': {'conn': conn, 'class_mapping': make_modules(N), 'swaps': 1, 'unperturbed': 0},
+              'erdos_renyi':             {'n': N, 'density': density},
+              'strength_preserving':     {'conn': conn, 'swaps': 1, 'n_stages': 10, 'n_iter': 1000},
+              'geometry_preserving':     {'conn': conn, 'coords': np.random.RandomState(SEED).uniform(0, 1, (N, 3)), 'swaps': 1},
+              }[null_type]
+
+    # weight fits are memoized per connectome: clear them so that every
+    # repeat times the fit as well
+    def func():
+        nulls.clear_cache()
+        nulls.construct_null_model(null_type, seed=SEED, **kwargs)
+
+    return func
+
+
+def clear_property_caches():
+    """
+        Properties and shortest paths are memoized per connectome: every
+        repeat of a properties benchmark would otherwise time a cache hit.
+    """
+    from reservoir.network import paths, property_engine
+
+    paths.clear_cache()
+    property_engine.clear_cache()
+
+
+def setup_local_properties(N, density):
+    from reservoir.network import network_properties
+
+    conn = make_network(N, density)
+
+    def func():
+        clear_property_caches()
+        network_properties.get_local_network_properties(conn, np.ones(N), make_modules(N))
+
+    return func
+
+
+def setup_global_properties(N, density):
+    from reservoir.network import network_properties
+
+    conn = make_network(N, density)
+
+    def func():
+        clear_property_caches()
+        network_properties.get_global_network_properties(conn, np.ones(N), make_modules(N))
+
+    return func
+
+
+def get_benchmarks(quick=False):
+    """
+        Returns {name: (setup function, list of parameter dicts)}.
+    """
+    def grid(**params):
+        keys = list(params)
+        return [dict(zip(keys, values)) for values in product(*params.values())]
+
+    if quick:
+        N, T, density, n_alphas = [50], [500], [0.1], [1]
+    else:
+        N, T, density, n_alphas = [100, 250, 500], [1000, 5000], [0.05, 0.2], [1, 5]
+
+    benchmarks = {'sim_lnm.run_sim':             (setup_run_sim,        grid(N=N, T=T, n_alphas=n_alphas)),
+                  'tasks.run_mem_cap':           (setup_run_mem_cap,    grid(N=N, T=T)),
+                  'tasks.run_pttn_recog':        (setup_run_pttn_recog, grid(N=N, T=T)),
+                  'coding.basic_decoder':        (setup_basic_decoder,  grid(N=N[:1], T=T[:1], n_alphas=n_alphas)),
+                  'metrics.state_metrics':       (setup_state_metrics,  grid(N=N, T=T, n_alphas=n_alphas)),
+                  'network_properties.get_local_network_properties':  (setup_local_properties,  grid(N=N, density=density)),
+                  'network_properties.get_global_network_properties': (setup_global_properties, grid(N=N, density=density)),
+                  }
+
+    for null_type in ['rand_mio', 'watts_and_strogatz', 'randmio_one_unperturbed', 'erdos_renyi', 'strength_preserving', 'geometry_preserving']:
+        benchmarks[f'nulls.{null_type}'] = (setup_null_model, grid(null_type=[null_type], N=N, density=density))
+
+    benchmarks['import'] = (setup_import, grid(module=IMPORTED_MODULES))
+
+    return benchmarks
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# RUNNER
+# ----------------------------------------------------------------------------------------------------------------------
+def time_func(func, repeat=3):
+    """
+        Wall time (s) of repeat calls to func. Anything func prints is
+        discarded.
+    """
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t0)
+
+    return times
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(quick=False, name_filter=None, repeat=3):
+
+    results = []
+    for name, (setup, param_list) in get_benchmarks(quick).items():
+        if (name_filter is not None) and (name_filter not in name): continue
+
+        for params in param_list:
+            entry = {'benchmark': name, 'params': params}
+            try:
+                func = setup(**params)
+                times = time_func(func, repeat)
+                entry.update(times=times, min=float(np.min(times)), median=float(np.median(times)))
+
+            except ImportError as e:
+                entry.update(skipped=str(e))
+
+            print(f'{name:<55} {json.dumps(params):<50} ' + (f"{entry['median']:.4f} s" if 'median' in entry else 'skipped'))
+            results.append(entry)
+
+    return {'commit': get_commit(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'quick': quick,
+            'repeat': repeat,
+            'results': results
+            }
+
+
+def compare(baseline, new, threshold=0.1):
+    """
+        Prints the ratio new/baseline of the median time of every benchmark
+        present in both files and flags changes larger than threshold.
+    """
+    def key(entry):
+        return entry['benchmark'], json.dumps(entry['params'], sort_keys=True)
+
+    base_times = {key(e): e['median'] for e in baseline['results'] if 'median' in e}
+
+    print(f"baseline: {baseline['commit']}   new: {new['commit']}")
+    for entry in new['results']:
+        if ('median' not in entry) or (key(entry) not in base_times): continue
+
+        ratio = entry['median']/base_times[key(entry)]
+        flag = 'slower' if ratio > 1+threshold else 'faster' if ratio < 1-threshold else ''
+        print(f"{entry['benchmark']:<55} {key(entry)[1]:<50} {ratio:6.2f}x {flag}")
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('--quick', action='store_true', help='single small point per benchmark')
+    run_parser.add_argument('--filter', default=None, help='only run benchmarks whose name contains FILTER')
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--output', default=None, help='defaults to benchmarks/results/<commit>.json')
+
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run_benchmarks(args.quick, args.filter, args.repeat)
+
+        output = args.output
+        if output is None:
+            output = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', f"{results['commit'] or 'unknown'}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'results saved in {output}')
+
+    elif args.command == 'compare':
+        with open(args.baseline) as f: baseline = json.load(f)
+        with open(args.new) as f: new = json.load(f)
+        compare(baseline, new, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
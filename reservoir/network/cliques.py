@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming clique counting.
+
+Cliques are walked one root node at a time following a degeneracy ordering
+of the nodes: every clique is reached exactly once, from its first node in
+the ordering, by extending it only with neighbors that come later. Node
+neighborhoods are stored as int bitsets, so candidate sets are intersected
+with a single &. Cliques are counted as they are reached and never stored,
+so memory stays O(N * k_max) however many cliques the network has.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# GRAPH
+# ----------------------------------------------------------------------------------------------------------------------
+def get_adjacency_sets(conn):
+    """
+        Neighbors of every node of an undirected network. Self-connections
+        are ignored.
+
+        Parameters
+        ----------
+        conn : (N, N) numpy.ndarray or scipy.sparse matrix
+
+        Returns
+        -------
+        neighbors : list of (k_i,) numpy.ndarray
+    """
+
+    if sparse.issparse(conn):
+        conn = sparse.csr_matrix(conn)
+        conn.eliminate_zeros()
+        rows = np.repeat(np.arange(conn.shape[0]), np.diff(conn.indptr))
+        cols = conn.indices
+    else:
+        rows, cols = np.nonzero(conn)
+
+    keep = rows != cols
+    rows, cols = rows[keep], cols[keep]
+
+    return np.split(cols, np.searchsorted(rows, np.arange(1, conn.shape[0])))
+
+
+def degeneracy_order(neighbors):
+    """
+        Degeneracy ordering: nodes are repeatedly removed in order of
+        minimum remaining degree.
+
+        Returns
+        -------
+        order : (N,) numpy.ndarray
+            Nodes in removal order
+
+        degeneracy : int
+            Largest remaining degree at removal. Cliques have at most
+            degeneracy+1 nodes.
+    """
+
+    N = len(neighbors)
+    degrees = np.array([len(nbrs) for nbrs in neighbors], dtype=float)
+
+    order = np.zeros(N, dtype=int)
+    degeneracy = 0
+    for i in range(N):
+        node = np.argmin(degrees)
+        degeneracy = max(degeneracy, int(degrees[node]))
+
+        order[i] = node
+        degrees[node] = np.inf
+        degrees[neighbors[node]] -= 1
+
+    return order, degeneracy
+
+
+def get_later_bitsets(neighbors, order):
+    """
+        Neighbors of every node that come later in order, as int bitsets
+        (bit j set if node j is a later neighbor).
+    """
+
+    rank = np.empty(len(order), dtype=int)
+    rank[order] = np.arange(len(order))
+
+    bitsets = []
+    for node, nbrs in enumerate(neighbors):
+        bits = 0
+        for nbr in nbrs[rank[nbrs] > rank[node]]: bits |= 1 << int(nbr)
+        bitsets.append(bits)
+
+    return bitsets
+
+
+def iter_bits(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length()-1
+        bits ^= low
+
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# COUNTING
+# ----------------------------------------------------------------------------------------------------------------------
+def count_cliques_roots(later, roots, k_max):
+    """
+        Per-node counts of the cliques whose first node (in the ordering
+        of later) is one of roots.
+
+        Parameters
+        ----------
+        later : list of int
+            Bitsets of later neighbors, see get_later_bitsets
+
+        roots : (n_roots,) numpy.ndarray
+            Root nodes
+
+        k_max : int
+            Maximum clique size
+
+        Returns
+        -------
+        counts : (N, k_max) numpy.ndarray
+            counts[i, k-1] is the number of k-cliques that contain node i
+    """
+
+    counts = np.zeros((len(later), k_max), dtype=np.int64)
+
+    for root in roots:
+        counts[root, 0] += 1
+
+        # depth-first walk: every entry is a clique and the bitset of the
+        # nodes that extend it
+        stack = [([int(root)], later[root])]
+        while stack:
+            clique, candidates = stack.pop()
+            if not candidates: continue
+
+            # one (k+1)-clique per candidate: counted at once for the nodes
+            # of the clique, one by one for the candidates
+            k = len(clique)
+            nodes = list(iter_bits(candidates))
+            counts[clique, k] += len(nodes)
+            counts[nodes, k] += 1
+
+            for node in nodes:
+                next_candidates = candidates & later[node]
+                if next_candidates: stack.append((clique + [node], next_candidates))
+
+    return counts
+
+
+def count_cliques(conn, n_jobs=1):
+    """
+        Number of cliques of every size that contain every node of an
+        undirected network (all cliques, not only maximal ones), without
+        enumerating them into memory.
+
+        Parameters
+        ----------
+        conn : (N, N) numpy.ndarray or scipy.sparse matrix
+            Connectivity matrix (only nonzero entries matter)
+
+        n_jobs : int
+            Number of processes across which root nodes are split
+
+        Returns
+        -------
+        counts : (N, k_max) numpy.ndarray
+            counts[i, k-1] is the number of k-cliques that contain node i.
+            k_max is the size of the largest clique.
+    """
+
+    neighbors = get_adjacency_sets(conn)
+    order, degeneracy = degeneracy_order(neighbors)
+    later = get_later_bitsets(neighbors, order)
+
+    k_max = degeneracy+1
+    roots = np.arange(len(neighbors))
+
+    if n_jobs == 1:
+        counts = count_cliques_roots(later, roots, k_max)
+
+    else:
+        # roots with more later neighbors are more expensive: interleave them
+        roots = roots[np.argsort([-popcount(bits) for bits in later])]
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            counts = sum(executor.map(count_cliques_roots, [later]*n_jobs, [roots[i::n_jobs] for i in range(n_jobs)], [k_max]*n_jobs))
+
+    # drop sizes larger than the largest clique
+    sizes = np.nonzero(counts.any(axis=0))[0]
+    k_max = sizes[-1]+1 if len(sizes) else 0
+
+    return counts[:, :k_max]
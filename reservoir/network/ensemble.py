@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable generation of ensembles of null networks.
+
+generate draws B null networks of one type of nulls.construct_null_model
+across a local process pool. Null b always uses the b-th child stream of the
+base seed, so the ensemble does not depend on the number of workers or on the
+order in which nulls finish. Every worker writes its null straight to disk:
+
+    'memmap' : a (B, N, N) networks.npy stack opened with memory mapping
+               (plus a completed.npy flag per null)
+    'edges'  : one compressed edge list (i, j, w) per null in edges/, for
+               sparse networks
+
+A manifest.json with the parameters of the ensemble is written first.
+Calling generate again with the same parameters only draws the nulls that
+are not completed yet, so interrupted runs are resumed.
+"""
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from scipy import sparse
+
+from . import nulls
+from . import paths
+from .. import profiling
+from ..rng import spawn
+
+OUTPUTS = ['memmap', 'edges']
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# MANIFEST
+# ----------------------------------------------------------------------------------------------------------------------
+def get_params(null_type, n_nulls, seed, output, dtype, **kwargs):
+    """
+        Returns the json-serializable parameters that identify an ensemble.
+        Array arguments (e.g., conn) are identified by their content hash.
+    """
+
+    if seed is None:
+        raise ValueError('A seed is required to generate a resumable ensemble')
+
+    if output not in OUTPUTS:
+        raise ValueError(f'Unknown output: {output}. Options are {OUTPUTS}')
+
+    kwargs = {key: (paths.get_hash(value) if (isinstance(value, np.ndarray) or sparse.issparse(value)) else value)
+              for key, value in kwargs.items()}
+
+    return json.loads(json.dumps({'null_type': null_type,
+                                  'n_nulls': int(n_nulls),
+                                  'seed': int(seed),
+                                  'output': output,
+                                  'dtype': np.dtype(dtype).str,
+                                  'kwargs': kwargs
+                                  }, sort_keys=True, default=repr))
+
+
+def read_manifest(out_dir):
+    with open(os.path.join(out_dir, 'manifest.json')) as f:
+        return json.load(f)
+
+
+def write_manifest(out_dir, manifest):
+    tmp_file = os.path.join(out_dir, '.manifest.json.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, os.path.join(out_dir, 'manifest.json'))
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# WORKERS
+# ----------------------------------------------------------------------------------------------------------------------
+def get_null(null_type, seed, **kwargs):
+    """
+        One null network as an (N, N) matrix. Stacks with a single network
+        (e.g., watts_and_strogatz with a single p_conn) are squeezed.
+    """
+
+    network = nulls.construct_null_model(null_type, seed=seed, **kwargs)
+
+    if network.ndim == 3:
+        if network.shape[2] != 1:
+            raise ValueError('Ensembles take a single network per null (e.g., a single p_conn)')
+        network = network[:,:,0]
+
+    return network
+
+
+def get_edge_file(out_dir, index):
+    return os.path.join(out_dir, 'edges', f'{index:06d}.npz')
+
+
+def save_edges(out_dir, index, network):
+    """
+        Saves the nonzero entries of network (numpy.ndarray or scipy.sparse
+        matrix; upper triangle if symmetric) as edges/<index>.npz,
+        atomically.
+    """
+
+    if sparse.issparse(network):
+        symmetric = (abs(network - network.T) > 1e-16).nnz == 0
+        edges = sparse.triu(network, format='coo') if symmetric else network.tocoo()
+        edges.eliminate_zeros()
+        i, j, w = edges.row, edges.col, edges.data
+
+    else:
+        symmetric = nulls.check_symmetric(network)
+        i, j = np.nonzero(np.triu(network) if symmetric else network)
+        w = network[i, j]
+
+    tmp_file = os.path.join(out_dir, 'edges', f'.{index:06d}.tmp.npz')
+    np.savez_compressed(tmp_file, i=i, j=j, w=w, shape=network.shape, symmetric=symmetric)
+    os.replace(tmp_file, get_edge_file(out_dir, index))
+
+
+def load_edges(out_dir, index, dtype=float):
+    """
+        Returns
+        -------
+        network : (N, N) scipy.sparse.csr_matrix
+    """
+
+    with np.load(get_edge_file(out_dir, index)) as f:
+        i, j, w = f['i'], f['j'], f['w'].astype(dtype)
+        if f['symmetric']:
+            offdiag = i != j
+            i, j, w = np.concatenate([i, j[offdiag]]), np.concatenate([j, i[offdiag]]), np.concatenate([w, w[offdiag]])
+
+        return sparse.csr_matrix((w, (i, j)), shape=tuple(f['shape']))
+
+
+def generate_null(out_dir, index, null_type, seed, output, dtype, kwargs):
+    """
+        Draws null index and writes it to the ensemble in out_dir.
+    """
+
+    network = get_null(null_type, seed, **kwargs)
+
+    if output == 'memmap':
+        stack = np.load(os.path.join(out_dir, 'networks.npy'), mmap_mode='r+')
+        stack[index] = network.toarray() if sparse.issparse(network) else network
+        stack.flush()
+        del stack
+
+    elif output == 'edges':
+        save_edges(out_dir, index, network.astype(dtype))
+
+    return index
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# ENSEMBLE
+# ----------------------------------------------------------------------------------------------------------------------
+def get_completed(out_dir):
+    """
+        Returns
+        -------
+        completed : (B,) numpy.ndarray of bool
+            Whether every null of the ensemble in out_dir is already on disk
+    """
+
+    manifest = read_manifest(out_dir)
+    n_nulls = manifest['params']['n_nulls']
+
+    if manifest['params']['output'] == 'memmap':
+        completed_file = os.path.join(out_dir, 'completed.npy')
+        if not os.path.isfile(completed_file): return np.zeros(n_nulls, dtype=bool)
+        return np.load(completed_file).astype(bool)
+
+    return np.array([os.path.isfile(get_edge_file(out_dir, index)) for index in range(n_nulls)])
+
+
+def generate(out_dir, null_type, n_nulls, seed=0, output='memmap', dtype=float, n_jobs=1, **kwargs):
+    """
+        Generates (or resumes) an ensemble of n_nulls null networks.
+
+        Parameters
+        ----------
+        out_dir : str
+            Directory of the ensemble
+
+        null_type : str
+            Null model type accepted by nulls.construct_null_model
+
+        n_nulls : int
+            Number of null networks (B)
+
+        seed : int
+            Base seed. Null b is drawn with the b-th child of seed.
+
+        output : {'memmap', 'edges'}
+            Memory-mapped (B, N, N) stack or one edge list per null
+
+        dtype : numpy dtype
+            Data type of the stored weights
+
+        n_jobs : int
+            Number of worker processes
+
+        kwargs :
+            Arguments of the null model (e.g., conn, swaps)
+
+        Returns
+        -------
+        out_dir : str
+    """
+
+    params = get_params(null_type, n_nulls, seed, output, dtype, **kwargs)
+
+    os.makedirs(out_dir, exist_ok=True)
+    if os.path.isfile(os.path.join(out_dir, 'manifest.json')):
+        if read_manifest(out_dir)['params'] != params:
+            raise ValueError(f'{out_dir} already holds an ensemble with different parameters')
+    else:
+        write_manifest(out_dir, {'params': params})
+
+    seeds = spawn(seed, n_nulls)
+
+    completed = get_completed(out_dir)
+    pending = np.nonzero(~completed)[0].tolist()
+    profiling.progress('ensemble.completed', n_completed=n_nulls-len(pending), n_nulls=n_nulls)
+    if not pending: return out_dir
+
+    if output == 'memmap':
+        completed = np.lib.format.open_memmap(os.path.join(out_dir, 'completed.npy'), mode='r+' if completed.any() else 'w+',
+                                              dtype=bool, shape=(n_nulls,))
+
+        # the first null gives the shape of the stack
+        stack_file = os.path.join(out_dir, 'networks.npy')
+        if not os.path.isfile(stack_file):
+            index = pending.pop(0)
+            network = get_null(null_type, seeds[index], **kwargs)
+
+            stack = np.lib.format.open_memmap(stack_file, mode='w+', dtype=dtype, shape=(n_nulls,)+network.shape)
+            stack[index] = network.toarray() if sparse.issparse(network) else network
+            stack.flush()
+            del stack
+
+            completed[index] = True
+            completed.flush()
+
+    elif output == 'edges':
+        os.makedirs(os.path.join(out_dir, 'edges'), exist_ok=True)
+
+    def on_completed(index):
+        if output == 'memmap':
+            completed[index] = True
+            completed.flush()
+        profiling.progress('ensemble.null', index=index, n_nulls=n_nulls)
+
+    jobs = [dict(out_dir=out_dir, index=index, null_type=null_type, seed=seeds[index], output=output, dtype=dtype, kwargs=kwargs)
+            for index in pending]
+
+    if n_jobs == 1:
+        for job in jobs: on_completed(generate_null(**job))
+
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(generate_null, **job) for job in jobs]
+            for future in as_completed(futures): on_completed(future.result())
+
+    return out_dir
+
+
+def load(out_dir, mmap_mode='r'):
+    """
+        Opens a complete ensemble.
+
+        Returns
+        -------
+        networks : (B, N, N) numpy.memmap ('memmap' output) or list of
+                   scipy.sparse.csr_matrix ('edges' output)
+    """
+
+    params = read_manifest(out_dir)['params']
+    if not get_completed(out_dir).all():
+        raise ValueError(f'The ensemble in {out_dir} is not complete. Resume it with generate.')
+
+    if params['output'] == 'memmap':
+        return np.load(os.path.join(out_dir, 'networks.npy'), mmap_mode=mmap_mode)
+
+    return list(iter_networks(out_dir))
+
+
+def iter_networks(out_dir):
+    """
+        Lazily yields the completed null networks of the ensemble in out_dir
+        in order (e.g., as input of network_properties ensemble functions).
+    """
+
+    params = read_manifest(out_dir)['params']
+    completed = get_completed(out_dir)
+
+    if params['output'] == 'memmap':
+        stack = np.load(os.path.join(out_dir, 'networks.npy'), mmap_mode='r')
+        for index in np.nonzero(completed)[0]: yield stack[index]
+
+    else:
+        for index in np.nonzero(completed)[0]: yield load_edges(out_dir, index, np.dtype(params['dtype']))
@@ -5,86 +5,47 @@ Created on Tue Oct 29 16:27:07 2019
 @author: Estefany Suarez
 """
 
-import os
-import scipy.io as sio
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-from bct.algorithms import(centrality, clustering, degree, distance, modularity, core, similarity)
-from scipy.spatial.distance import cdist
-
-import networkx as nx
-from networkx.algorithms import clique
-
-from netneurotools import modularity as lmodularity
+from scipy import sparse
+
+from . import cliques
+from . import property_engine
+
+# default properties
+LOCAL_PROPERTY_LIST = ['node_strength',
+                       'node_degree',
+                       'wei_clustering_coeff',
+                       # 'bin_clustering_coeff',
+                       'wei_centrality',
+                       # 'bin_centrality',
+                       'wei_participation_coeff',
+                       # 'bin_participation_coeff',
+                       'wei_diversity_coeff',
+                       ]
+
+GLOBAL_PROPERTY_LIST = ['path_length',
+                        'clustering',
+                        'modularity',
+                        'assortativity_wei',
+                        'assortativity_bin'
+                        ]
 
 #%% --------------------------------------------------------------------------------------------------------------------
 # NETWORKS PROPERTIES
 # ----------------------------------------------------------------------------------------------------------------------
-def get_local_network_properties(conn, cortical, class_mapping, property_list=None, include_subctx=True):
+def get_local_network_properties(conn, cortical, class_mapping, property_list=None, include_subctx=True, n_jobs=1):
     """
         Given a weighted connectivity matrix, this methods estimates the local
-        properties given by property_list.
+        properties given by property_list. n_jobs is the number of processes
+        used to compute betweenness centrality. conn can be a numpy.ndarray or
+        a scipy.sparse matrix (e.g., for high-resolution parcellations).
     """
-    def get_default_property_list():
-        return ['node_strength',
-                'node_degree',
-                'wei_clustering_coeff',
-                # 'bin_clustering_coeff',
-                'wei_centrality',
-                # 'bin_centrality',
-                'wei_participation_coeff',
-                # 'bin_participation_coeff',
-                'wei_diversity_coeff',
-                ]
-    if property_list is None: property_list = get_default_property_list()
-
-    #REMOVE SUBCTX AD HOC
-    # if include_subctx:
-    #     conn_wei = conn.copy()
-    #     conn_bin = conn_wei.copy().astype(bool).astype(int)
-    #
-    # else:
-    #     ctx = np.where(cortical==1)[0]
-    #     conn_wei = conn.copy()[np.ix_(ctx, ctx)]
-    #     conn_bin = conn_wei.copy().astype(bool).astype(int)
-
-    conn_wei = conn.copy()
-    conn_bin = conn_wei.copy().astype(bool).astype(int)
-
-    properties = []
-    if 'node_strength' in property_list: #***
-        properties.append(degree.strengths_und(conn_wei))
-
-    if 'node_degree' in property_list: #***
-        properties.append(degree.degrees_und(conn_bin))
-
-    if 'wei_clustering_coeff' in property_list: #***
-        properties.append(clustering.clustering_coef_wu(conn_wei))
-
-    if 'bin_clustering_coeff' in property_list: #***
-        properties.append(clustering.clustering_coef_bu(conn_bin))
-
-    if 'wei_centrality' in property_list:
-        N = len(conn)
-        properties.append(centrality.betweenness_wei(1/conn_wei)/((N-1)*(N-2)))
-
-    if 'bin_centrality' in property_list:
-        N = len(conn)
-        properties.append(centrality.betweenness_bin(conn_bin)/((N-1)*(N-2)))
-
-    if 'wei_participation_coeff' in property_list: #***
-        properties.append(centrality.participation_coef(conn_wei, ci=class_mapping))
-
-    if 'bin_participation_coeff' in property_list: #***
-        properties.append(centrality.participation_coef(conn_bin, ci=class_mapping))
-
-    if 'wei_diversity_coeff' in property_list: #***
-        pos, _ = centrality.diversity_coef_sign(conn_wei, ci=class_mapping)
-        properties.append(pos)
+    if property_list is None: property_list = LOCAL_PROPERTY_LIST
 
+    properties = property_engine.compute(conn, property_list, 'local', class_mapping=class_mapping, n_jobs=n_jobs)
+    properties = list(properties.values())
 
     #REMOVE SUBCTX POST-HOC
     if not include_subctx: properties = [prop[cortical==1] for prop in properties]
@@ -97,107 +58,162 @@ def get_local_network_properties(conn, cortical, class_mapping, property_list=No
 
 def get_global_network_properties(conn, cortical, class_mapping, property_list=None):
 
+    if property_list is None: property_list = GLOBAL_PROPERTY_LIST
+
+    properties = property_engine.compute(conn, property_list, 'global', class_mapping=class_mapping)
+
+    return list(properties.values()), property_list
+
+
+def get_modular_network_properties(conn, class_mapping, classes_sorted=None, property_list=None):
+
     if property_list is None: property_list = [
-                                               'path_length',
-                                               'clustering',
                                                'modularity',
-                                               'assortativity_wei',
-                                               'assortativity_bin'
+                                               # 'rel_density',
+                                               'segregation'
                                                ]
 
-    conn_wei = conn.copy()
+    properties = property_engine.compute(conn, property_list, 'modular', class_mapping=class_mapping, classes_sorted=classes_sorted)
 
-    properties = []
-    if 'path_length' in property_list:
-        dist, _ = distance.distance_wei(1/conn_wei)
-        char_path, _, _, _, _, = distance.charpath(dist, include_infinite=False)
-        properties.append(char_path)
+    return list(properties.values()), property_list
 
-    if 'clustering' in property_list:
-        properties.append(clustering.transitivity_wu(conn_wei))
 
-    if 'modularity' in property_list:
-        _, q = modularity.modularity_und(conn_wei, kci=class_mapping)
-        properties.append(q)
+#%% --------------------------------------------------------------------------------------------------------------------
+# ENSEMBLES OF NETWORKS
+# ----------------------------------------------------------------------------------------------------------------------
+def iter_batches(networks, axis=0, batch_size=32):
+    """
+        Yields (B, N, N) stacks of at most batch_size networks from a
+        numpy.ndarray stack (networks along axis) or from an iterable of
+        (N, N) networks, which is consumed lazily. Batches with
+        scipy.sparse networks are yielded as lists.
+    """
 
-    if 'assortativity_wei' in property_list:
-        properties.append(core.assortativity_wei(conn_wei, flag=0))
+    if isinstance(networks, np.ndarray) and networks.ndim == 3:
+        networks = np.moveaxis(networks, axis, 0)
+        for start in range(0, len(networks), batch_size):
+            yield networks[start:start+batch_size]
+        return
 
-    if 'assortativity_bin' in property_list:
-        properties.append(core.assortativity_bin(conn_wei.astype(bool).astype(int), flag=0))
+    if isinstance(networks, np.ndarray): networks = [networks]
 
-    return properties, property_list
+    def stack(batch):
+        # sparse networks are passed as a list
+        if any(sparse.issparse(conn) for conn in batch): return batch
+        return np.stack(batch)
 
+    batch = []
+    for conn in networks:
+        batch.append(conn)
+        if len(batch) == batch_size:
+            yield stack(batch)
+            batch = []
 
-def get_modular_network_properties(conn, class_mapping, classes_sorted=None, property_list=None):
+    if batch: yield stack(batch)
 
-    if property_list is None: property_list = [
-                                               'modularity',
-                                               # 'rel_density',
-                                               'segregation'
-                                               ]
 
-    conn_wei = conn.copy()
+def get_ensemble_network_properties(networks, scope, class_mapping=None, classes_sorted=None, property_list=None, axis=0, batch_size=32, n_jobs=1):
+    """
+        Properties of every network of an ensemble (e.g., the nulls of
+        construct_null_model), batch by batch. See
+        property_engine.compute_batch.
+
+        Parameters
+        ----------
+        networks : (B, N, N) numpy.ndarray or iterable of (N, N) numpy.ndarray or scipy.sparse matrices
+            Stack of networks along axis (e.g., axis=2 for watts_and_strogatz)
+            or a (lazy) iterable of networks
+
+        scope : {'local', 'global'}
+
+        batch_size : int
+            Number of networks held in memory at once
+
+        n_jobs : int
+            Number of processes for the properties that do not vectorize
+            across networks
+
+        Yields
+        ------
+        properties : dict
+            {property: (B, ...) numpy.ndarray} of every batch
+    """
+
+    executor = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+    try:
+        for stack in iter_batches(networks, axis, batch_size):
+            yield property_engine.compute_batch(stack, property_list, scope, class_mapping=class_mapping,
+                                                classes_sorted=classes_sorted, executor=executor)
+    finally:
+        if executor is not None: executor.shutdown()
 
-    properties = []
-    if 'modularity' in property_list:
-        if type(class_mapping) != int:
-            class_mapping_int = np.array([np.where(classes_sorted == mapp)[0][0] for mapp in class_mapping]).astype(int)
-        else:
-            class_mapping_int = class_mapping
-        q = lmodularity.get_modularity(conn_wei, class_mapping_int)
-        properties.append(q)
 
-    if 'rel_density' in property_list:
-        pass
+def get_local_ensemble_properties(networks, cortical, class_mapping, property_list=None, include_subctx=True, axis=0, batch_size=32, n_jobs=1):
+    """
+        Ensemble version of get_local_network_properties.
 
-    if 'segregation' in property_list:
+        Returns
+        -------
+        df : pandas.DataFrame
+            One row per node of every network, indexed by (network, node)
+    """
 
-        def segregation(conn, clase):
+    if property_list is None: property_list = LOCAL_PROPERTY_LIST
 
-           within = conn.copy()[np.ix_(np.where(class_mapping == clase)[0], np.where(class_mapping == clase)[0])]
-           within = within[np.tril_indices_from(within, -1)]
+    dfs = []
+    n_networks = 0
+    for properties in get_ensemble_network_properties(networks, 'local', class_mapping, None, property_list, axis, batch_size, n_jobs):
+        B, N = properties[property_list[0]].shape
 
-           between = conn.copy()[np.ix_(np.where(class_mapping == clase)[0], np.where(class_mapping != clase)[0])]
+        nodes = np.arange(N)
+        if not include_subctx:
+            nodes = nodes[cortical==1]
+            properties = {prop: values[:,cortical==1] for prop, values in properties.items()}
 
-           z_within = (within-np.mean(within[np.nonzero(within)]))/np.std(within[np.nonzero(within)])
-           z_between = (between-np.mean(between[np.nonzero(between)]))/np.std(between[np.nonzero(between)])
+        index = pd.MultiIndex.from_product([np.arange(n_networks, n_networks+B), nodes], names=['network', 'node'])
+        dfs.append(pd.DataFrame({prop: values.ravel() for prop, values in properties.items()}, index=index))
+        n_networks += B
 
-           return (np.mean(z_within[np.nonzero(z_within)])-np.mean(z_between[np.nonzero(z_between)]))/np.mean(z_within[np.nonzero(z_within)])
-        s = np.array([segregation(conn, clase) for clase in classes_sorted])
-        properties.append(s)
+    return pd.concat(dfs)
 
-    return properties, property_list
 
+def get_global_ensemble_properties(networks, cortical, class_mapping, property_list=None, axis=0, batch_size=32, n_jobs=1):
+    """
+        Ensemble version of get_global_network_properties.
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            One row per network, indexed by network
+    """
 
-def get_cliques_local(conn):
+    if property_list is None: property_list = GLOBAL_PROPERTY_LIST
 
-    # convert to Graph
-    G = nx.from_numpy_array(conn)
+    dfs = [pd.DataFrame(properties) for properties in get_ensemble_network_properties(networks, 'global', class_mapping, None, property_list, axis, batch_size, n_jobs)]
 
-    # find cliques
-    cliques = list(clique.enumerate_all_cliques(G))
-    max_degree = len(cliques[-1])
+    df = pd.concat(dfs, ignore_index=True)
+    df.index.name = 'network'
 
-    v_counts = []
-    for degree in range(3, max_degree+1):
+    return df
 
-        cliques_ = [clique for clique in cliques if len(clique) == degree]
-        v, counts = np.unique(np.row_stack(cliques_), return_counts=True)
 
-        if len(v) != len(conn):
-            new_counts = np.zeros(len(conn))
-            new_counts[v] = counts
-        else: new_counts = counts
+def get_cliques_local(conn, n_jobs=1):
+    """
+        Number of k-cliques (k >= 3) that contain every node. Cliques are
+        counted without being enumerated into memory (see cliques.py); n_jobs
+        is the number of processes they are counted across.
+    """
 
-        v_counts.append(new_counts)
+    counts = cliques.count_cliques(conn, n_jobs=n_jobs)
+    max_degree = counts.shape[1]
 
+    v_counts = [counts[:,degree-1] for degree in range(3, max_degree+1)]
     clique_names = [f'{k}-clique' for k in range(3, max_degree+1)]
 
     return v_counts, clique_names
 
 
-def get_cliques_modular(conn, class_mapping, classes_sorted):
+def get_cliques_modular(conn, class_mapping, classes_sorted, n_jobs=1):
 
     degree_frequency = []
     max_degree = 0
@@ -205,19 +221,16 @@ def get_cliques_modular(conn, class_mapping, classes_sorted):
 
         # select rsn
         idx = np.where(class_mapping == clase)[0]
-        tmp_conn = conn.copy()[np.ix_(idx, idx)]
-
-        # convert to Graph
-        G = nx.from_numpy_array(tmp_conn)
-
-        # find cliques
-        cliques = list(clique.enumerate_all_cliques(G))
-        clique_degrees = [len(clique) for clique in cliques]
+        if sparse.issparse(conn): tmp_conn = sparse.csr_matrix(conn)[idx][:,idx]
+        else: tmp_conn = conn[np.ix_(idx, idx)]
 
-        degrees, counts = np.unique(clique_degrees, return_counts=True)
-        degree_frequency.append(counts)
+        # number of cliques of every size: every k-clique is counted once
+        # per node
+        counts = cliques.count_cliques(tmp_conn, n_jobs=n_jobs)
+        degrees = np.arange(1, counts.shape[1]+1)
+        degree_frequency.append(counts.sum(axis=0)//degrees)
 
-        if np.max(degrees) > max_degree: max_degree = np.max(degrees)
+        if len(degrees) > max_degree: max_degree = len(degrees)
 
     # all frequencies of the same size
     ext_degree_frequency = []
@@ -5,15 +5,27 @@ Created on Tue Oct 29 16:27:07 2019
 @author: Estefany Suarez
 """
 
-import os
+import math
+import warnings
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
-import networkx as nx
 
-from bct import (clustering, reference)
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from . import paths
+from . import rewiring
+from .. import profiling
+from ..rng import (get_rng, get_int_seed, spawn)
+
+# distribution fits of the last connectomes, keyed by content hash
+CACHE_SIZE = 4
+_fit_cache = OrderedDict()
 
-from scipy.spatial.distance import cdist
-import scipy.stats as st
 
 #%% --------------------------------------------------------------------------------------------------------------------
 # GENERAL METHODS
@@ -36,112 +48,627 @@ def construct_null_model(type, **kwargs):
     elif type == 'erdos_renyi':
         new_conn = erdos_renyi(**kwargs)
 
+    elif type == 'strength_preserving':
+        new_conn = strength_preserving_rand_sa(**kwargs)
+
+    elif type == 'geometry_preserving':
+        new_conn = geometry_preserving(**kwargs)
+
     return new_conn
 
 
 #%% --------------------------------------------------------------------------------------------------------------------
 # NULL NETWORK MODELS
 # ----------------------------------------------------------------------------------------------------------------------
-def erdos_renyi(conn=None, density=0.025, **kwargs):
+def erdos_renyi(conn=None, density=0.025, seed=None, n=None, as_sparse=False, n_networks=None):
+    """
+        Undirected Erdos-Renyi G(n, p) networks with uniform(-1, 1) weights.
+
+        Edges are sampled directly on the upper triangle (see
+        get_erdos_renyi_edges), so no N x N temporaries are created (and none
+        at all with as_sparse).
+
+        Parameters
+        ----------
+        conn : (N, N) numpy.ndarray
+            If given, n and density are taken from it
 
-    if conn is not None: density = np.sum(conn.astype(bool).astype(int))/(len(conn)**2)
+        density : float
+            Connection probability p
 
-    new_conn = nx.to_numpy_array(nx.fast_gnp_random_graph(p=density, directed=False, **kwargs))
-    new_conn = new_conn*np.random.uniform(-1, 1, new_conn.shape)
-    new_conn[np.where(abs(new_conn) <= 0.00001)] = 0
+        seed : None, int, numpy.random.SeedSequence or numpy.random.Generator
 
-    upper_diag = new_conn.copy()[np.triu_indices_from(new_conn, 1)]
-    new_conn = new_conn.T
-    new_conn[np.triu_indices_from(new_conn, 1)] = upper_diag
-    np.fill_diagonal(new_conn,0)
+        n : int
+            Number of nodes
 
-    return new_conn
+        as_sparse : bool
+            If True, networks are returned as scipy.sparse.csr_matrix
+
+        n_networks : int
+            If given, n_networks networks are drawn and returned stacked along
+            the last axis, (N, N, n_networks) (list of csr matrices with
+            as_sparse). Otherwise a single (N, N) network is returned.
+
+        Returns
+        -------
+        new_conn : (N, N) or (N, N, n_networks) numpy.ndarray, or
+                   scipy.sparse.csr_matrix or list of them
+    """
+
+    rng = get_rng(seed)
+
+    if conn is not None:
+        n = len(conn)
+        density = np.count_nonzero(conn)/(n**2)
+
+    networks = [get_erdos_renyi_edges(n, density, rng) for _ in range(1 if n_networks is None else n_networks)]
+
+    if as_sparse:
+        networks = [sparse.csr_matrix((np.concatenate([w, w]), (np.concatenate([i, j]), np.concatenate([j, i]))), shape=(n, n))
+                    for i, j, w in networks]
+
+        return networks[0] if n_networks is None else networks
+
+    new_conn = np.zeros((n, n, len(networks)))
+    for b, (i, j, w) in enumerate(networks):
+        new_conn[i, j, b] = w
+        new_conn[j, i, b] = w
+
+    return new_conn[:,:,0] if n_networks is None else new_conn
+
+
+def get_erdos_renyi_edges(n, density, rng):
+    """
+        Upper-triangle edges (i < j) and weights of an undirected G(n, p)
+        network with uniform(-1, 1) weights (weights with absolute value
+        below 1e-5 are removed).
+
+        Every pair is an edge with probability p, so the gaps between
+        consecutive edges (in linear upper-triangle order) are geometric: the
+        edges are drawn as cumulative sums of geometric gaps, in O(n_edges)
+        memory.
+    """
+
+    n_pairs = n*(n-1)//2
+
+    k = [np.zeros(0, dtype=np.int64)]
+    if (density > 0) and (n_pairs > 0):
+        # a few standard deviations above the expected number of edges: one
+        # batch of gaps is almost always enough
+        batch_size = int(n_pairs*density + 5*np.sqrt(n_pairs*density) + 10)
+
+        last = -1
+        while last < n_pairs:
+            k.append(last + np.cumsum(rng.geometric(min(density, 1), batch_size)))
+            last = k[-1][-1]
+
+    k = np.concatenate(k)
+    k = k[k < n_pairs]
 
+    i, j = get_triu_pairs(n, k)
 
-def watts_and_strogatz(conn, p_conn=[0.1], bin=False):
+    w = rng.uniform(-1, 1, len(k))
+    keep = abs(w) > 0.00001
+
+    return i[keep], j[keep], w[keep]
+
+
+def get_triu_pairs(n, k):
+    """
+        Pairs (i, j), i < j, of the linear indices k of the upper triangle of
+        an (n, n) matrix (row-major order, as np.triu_indices(n, 1)).
+    """
+
+    k = np.asarray(k, dtype=np.int64)
+
+    # first linear index of every row
+    def get_row_start(i): return i*(2*n-i-1)//2
+
+    i = n - 2 - np.floor(np.sqrt(4*n*(n-1) - 8*k - 7)/2 - 0.5).astype(np.int64)
+    i[k < get_row_start(i)] -= 1   # floating point corrections
+    i[k >= get_row_start(i+1)] += 1
+    j = k - get_row_start(i) + i + 1
+
+    return i, j
+
+
+def get_weight_fit(conn, dist=None):
+    """
+        Parameters of dist (scipy.stats.powerlognorm if None) fitted (maximum
+        likelihood) to the nonzero weights of the lower triangle of conn.
+        Fits are cached per connectome content and distribution, for the last
+        CACHE_SIZE connectomes.
+    """
+    if dist is None:
+        import scipy.stats as st
+        dist = st.powerlognorm
+
+    key = (paths.get_hash(conn), dist.name)
+    if key in _fit_cache:
+        _fit_cache.move_to_end(key)
+        return _fit_cache[key]
 
-    # scale conn data
     conn_vec = conn[np.tril_indices_from(conn, -1)]
-    data = pd.Series(conn_vec[np.nonzero(conn_vec)])
+    params = dist.fit(pd.Series(conn_vec[np.nonzero(conn_vec)]))
+
+    _fit_cache[key] = params
+    while len(_fit_cache) > CACHE_SIZE: _fit_cache.popitem(last=False)
 
-    # generate data given a distribution
-    def get_pdf(data, dist, size):
+    return params
 
-        # fit dist to data
-        params = dist.fit(data)
 
-        # separate parts of parameters
-        arg = params[:-2]
-        loc = params[-2]
-        scale = params[-1]
+def clear_cache():
+    _fit_cache.clear()
 
-        # get same start and end points of distribution
-        start = dist.ppf(0.01, *arg, loc=loc, scale=scale) if arg else dist.ppf(0.01, loc=loc, scale=scale)
-        end   = dist.ppf(0.99, *arg, loc=loc, scale=scale) if arg else dist.ppf(0.99, loc=loc, scale=scale)
 
-        # build PDF and turn into pandas Series
-        x = np.linspace(start, end, size)
-        pdf = dist.pdf(x, loc=loc, scale=scale, *arg)
+def get_pdf(params, dist, size):
+    """
+        pdf of dist (with fitted params) on size points evenly spaced between
+        its 1st and 99th percentiles.
+    """
+
+    # separate parts of parameters
+    arg = params[:-2]
+    loc = params[-2]
+    scale = params[-1]
+
+    # get same start and end points of distribution
+    start = dist.ppf(0.01, *arg, loc=loc, scale=scale)
+    end   = dist.ppf(0.99, *arg, loc=loc, scale=scale)
 
-        return pdf
+    x = np.linspace(start, end, size)
+    return dist.pdf(x, *arg, loc=loc, scale=scale)
+
+
+def get_ring_lattice(n, k):
+    """
+        Edges (u, v) of a ring lattice where every node is connected to its
+        k//2 nearest neighbors on each side (in the order of networkx
+        watts_strogatz_graph).
+    """
+
+    u = np.tile(np.arange(n), k//2)
+    v = (u + np.repeat(np.arange(1, k//2+1), n)) % n
+
+    return u, v
+
+
+def rewire_lattice(n, u, v, p_conn, rng, max_rounds=100):
+    """
+        Watts-Strogatz rewiring of the lattice edges (u, v) for all the
+        probabilities in p_conn at once: every edge is rewired with
+        probability p to (u, w), with w drawn uniformly among the nodes that
+        are not u, v or a neighbor of u. Proposals that clash (with existing
+        edges, including the edges still waiting to be rewired, or with each
+        other) are redrawn, for all networks together, until none is left
+        (or max_rounds, in which case the edge is kept).
+
+        Returns
+        -------
+        targets : (len(p_conn), n_edges) numpy.ndarray
+            New v of every edge in every network
+    """
+
+    n_networks, n_edges = len(p_conn), len(u)
+    targets = np.tile(v, (n_networks, 1))
+
+    def get_keys(b, x, y): return (b*n + np.minimum(x, y))*n + np.maximum(x, y)
+
+    rewire = rng.random((n_networks, n_edges)) < np.asarray(p_conn)[:,None]
+    b_idx, e_idx = np.nonzero(rewire)
+
+    # edges waiting to be rewired keep their place until they are rewired,
+    # so that an edge kept after max_rounds never clashes with a new one
+    b_all = np.repeat(np.arange(n_networks), n_edges)
+    existing = np.unique(get_keys(b_all, np.tile(u, n_networks), np.tile(v, n_networks)))
+
+    for _ in range(max_rounds):
+        if not len(b_idx): break
+
+        uu = u[e_idx]
+        w = rng.integers(n, size=len(b_idx))
+        keys = get_keys(b_idx, uu, w)
+
+        ok = (w != uu) & (w != v[e_idx]) & ~np.isin(keys, existing)
+
+        # only the first of several identical proposals is accepted
+        ok_idx = np.nonzero(ok)[0]
+        _, first = np.unique(keys[ok_idx], return_index=True)
+        ok[:] = False
+        ok[ok_idx[first]] = True
+
+        targets[b_idx[ok], e_idx[ok]] = w[ok]
+        existing = np.union1d(np.setdiff1d(existing, get_keys(b_idx[ok], uu[ok], v[e_idx[ok]]), assume_unique=True), keys[ok])
+
+        b_idx, e_idx = b_idx[~ok], e_idx[~ok]
+
+    return targets
+
+
+def watts_and_strogatz(conn, p_conn=[0.1], bin=False, seed=None):
+    """
+        Watts-Strogatz small-world networks with the same number of nodes and
+        mean degree as conn, one per rewiring probability in p_conn. Weights
+        follow a powerlognorm distribution fitted to the weights of conn.
+
+        The lattice and its rewiring are generated with numpy for all the
+        probabilities at once (see rewire_lattice), and the distribution fit
+        is cached per connectome, so sweeping many probabilities (or calling
+        the function repeatedly on the same connectome) fits it once.
+
+        Returns
+        -------
+        networks : (N, N, len(p_conn)) numpy.ndarray
+    """
+
+    import scipy.stats as st
+
+    rng = get_rng(seed)
 
     # binarize conn data
     conn_bin = conn.astype(bool).astype(int)
     deg = int(np.mean(np.sum(conn_bin, axis=0)))
     N = len(conn_bin)
 
-    # create networks
-    networks = []
-    for p in p_conn:
+    if not bin: params = get_weight_fit(conn, st.powerlognorm)
 
-        # create watts_strogatz graph
-        G = nx.watts_strogatz_graph(N, deg, p)
-        network = nx.to_numpy_array(G)
+    # create watts_strogatz graphs
+    u, v = get_ring_lattice(N, deg)
+    targets = rewire_lattice(N, u, v, p_conn, rng)
+
+    networks = np.zeros((N, N, len(p_conn)))
+    for b in range(len(p_conn)):
+        network = networks[:,:,b]
+        network[u, targets[b]] = 1
+        network[targets[b], u] = 1
 
         if not bin:
             # assign weights to conns
             mask = np.nonzero(network)
             actual_conns = conn[mask]
-            new_conns = get_pdf(data, st.powerlognorm, len(mask[0]))
+            new_conns = get_pdf(params, st.powerlognorm, len(mask[0]))
             network[mask] = new_conns[np.argsort(actual_conns)]
 
-        # save weighted network
-        networks.append(network)
-
-    return np.dstack(networks)
+    return networks
 
 
-def rand_mio(conn, swaps=10):
+def rand_mio(conn, swaps=10, seed=None):
     """
         Parameters
         ----------
         directed binary/weighted connectome: nodes x nodes binary connectivity
         matrix
 
+        seed : None, int, numpy.random.SeedSequence or numpy.random.Generator
+
         Returns
         -------
         conn_mat: network model
     """
 
+    from bct import reference
+
+    seed = get_int_seed(get_rng(seed))
+
     if check_symmetric(conn):
-        conn_mat, _ = reference.randmio_und_connected(conn, swaps)
+        conn_mat, _ = reference.randmio_und_connected(conn, swaps, seed=seed)
 
     else:
-        conn_mat, _ = reference.randmio_dir_connected(conn, swaps)
+        conn_mat, _ = reference.randmio_dir_connected(conn, swaps, seed=seed)
 
     return conn_mat
 
 
+def anneal_weights(i, j, w, target, n_stages=100, n_iter=10000, temp=1000, frac=0.5, energy_type='sse', rng=None):
+    """
+        Simulated annealing of the permutation of the weights w of the edges
+        (i, j) of an undirected network towards the node strengths target.
+
+        Every proposal swaps the weights of two random edges. Only the
+        strengths of their (at most 4) nodes change, so the energy change is
+        computed in O(1) from them, instead of recomputing the strength
+        vector. Proposals are accepted with the Metropolis criterion;
+        temperature starts at temp and is multiplied by frac after each of
+        the n_stages stages of n_iter proposals.
+
+        Parameters
+        ----------
+        i, j : (n_edges,) numpy.ndarray
+            Nodes of every edge (i != j, each edge once)
+
+        w : (n_edges,) numpy.ndarray
+            Initial weights
+
+        target : (N,) numpy.ndarray
+            Target node strengths
+
+        energy_type : {'sse', 'sae'}
+            Sum of squared or of absolute strength errors
+
+        Returns
+        -------
+        w : (n_edges,) numpy.ndarray
+            Annealed weights
+
+        energy : float
+            Final energy
+    """
+
+    if energy_type == 'sse': cost = lambda x: x*x
+    elif energy_type == 'sae': cost = abs
+    else: raise ValueError(f'Unknown energy_type: {energy_type}')
+
+    if not (0 < frac <= 1): raise ValueError(f'frac must be in (0, 1], got {frac}')
+    if not (temp > 0): raise ValueError(f'temp must be positive, got {temp}')
+
+    rng = get_rng(rng)
+
+    i, j, w = i.tolist(), j.tolist(), list(w)
+    N = len(target)
+
+    # strength errors
+    strengths = np.bincount(i, weights=w, minlength=N) + np.bincount(j, weights=w, minlength=N)
+    errors = (strengths - target).tolist()
+    energy = sum(cost(error) for error in errors)
+
+    n_edges = len(w)
+    for stage in range(n_stages):
+
+        # random numbers of the whole stage
+        pairs = rng.integers(n_edges, size=(n_iter, 2)).tolist()
+        rand = rng.random(n_iter).tolist()
+
+        for (e1, e2), r in zip(pairs, rand):
+            dw = w[e2] - w[e1]
+            if dw == 0: continue
+
+            delta = {}
+            for node, dx in [(i[e1], dw), (j[e1], dw), (i[e2], -dw), (j[e2], -dw)]:
+                delta[node] = delta.get(node, 0) + dx
+
+            dE = sum(cost(errors[node]+dx) - cost(errors[node]) for node, dx in delta.items())
+
+            if (dE < 0) or (r < math.exp(-dE/temp)):
+                for node, dx in delta.items(): errors[node] += dx
+                w[e1], w[e2] = w[e2], w[e1]
+                energy += dE
+
+        temp *= frac
+
+    return np.array(w), energy
+
+
+def strength_preserving_chain(conn, seed=None, swaps=10, **kwargs):
+    """
+        One annealing chain of strength_preserving_rand_sa.
+
+        Returns
+        -------
+        new_conn : (N, N) numpy.ndarray
+
+        energy : float
+    """
+
+    rng = get_rng(seed)
+
+    # degree-preserving randomization of the topology
+    new_conn = rand_mio(conn, swaps, seed=rng)
+
+    i, j = np.nonzero(np.triu(new_conn, 1))
+    w, energy = anneal_weights(i, j, new_conn[i, j], np.sum(conn, axis=0), rng=rng, **kwargs)
+
+    new_conn = np.zeros_like(conn, dtype=float)
+    new_conn[i, j] = w
+    new_conn[j, i] = w
+
+    return new_conn, energy
+
+
+def strength_preserving_rand_sa(conn, swaps=10, n_stages=100, n_iter=10000, temp=1000, frac=0.5, energy_type='sse', n_chains=1, n_jobs=1, seed=None):
+    """
+        Degree- and strength-preserving randomization of an undirected
+        weighted network. The topology is randomized with rand_mio and the
+        weights are then permuted across edges by simulated annealing (see
+        anneal_weights) so that node strengths approximate those of conn.
+
+        Parameters
+        ----------
+        conn : (N, N) numpy.ndarray
+            Undirected weighted connectivity matrix
+
+        swaps : int
+            Rewiring parameter of rand_mio
+
+        n_stages, n_iter, temp, frac, energy_type :
+            Annealing schedule and energy, see anneal_weights
+
+        n_chains : int
+            Number of independent chains (each with its own topology and seed
+            stream). The network with the lowest energy is returned.
+
+        n_jobs : int
+            Number of processes across which chains are run
+
+        seed : None, int, numpy.random.SeedSequence or numpy.random.Generator
+
+        Returns
+        -------
+        new_conn : (N, N) numpy.ndarray
+    """
+
+    seeds = spawn(seed, n_chains)
+    kwargs = dict(swaps=swaps, n_stages=n_stages, n_iter=n_iter, temp=temp, frac=frac, energy_type=energy_type)
+
+    if n_jobs == 1:
+        chains = [strength_preserving_chain(conn, seed=chain_seed, **kwargs) for chain_seed in seeds]
+
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            chains = list(executor.map(partial(strength_preserving_chain, conn, **kwargs), seeds))
+
+    new_conn, _ = min(chains, key=lambda chain: chain[1])
+
+    return new_conn
+
+
+def get_distance_bins(coords, n_bins=10):
+    """
+        Equal-frequency bins of the Euclidean distance between every pair
+        of nodes.
+
+        Parameters
+        ----------
+        coords : (N, D) numpy.ndarray
+            Coordinates of the nodes
+
+        n_bins : int
+            Number of distance bins
+
+        Returns
+        -------
+        bins : (N, N) numpy.ndarray of numpy.uint8 (numpy.uint16 if n_bins > 256)
+            Distance bin of every pair of nodes
+    """
+    from scipy.spatial.distance import cdist
+
+    dist = cdist(coords, coords).astype(np.float32)
+    edges = np.quantile(dist[np.triu_indices(len(dist), 1)], np.linspace(0, 1, n_bins+1)[1:-1])
+
+    return np.digitize(dist, edges).astype(np.uint8 if n_bins <= 256 else np.uint16)
+
+
+def geometry_preserving(conn, coords, n_bins=10, swaps=10, max_attempts=50, seed=None):
+    """
+        Degree- and geometry-preserving randomization of an undirected
+        connected network. Pairs of edges a-b and c-d are swapped for a-d
+        and c-b (as in rand_mio) only if a-d falls in the distance bin of a-b
+        and c-b in the distance bin of c-d, so node degrees and the number
+        of edges (and the weights) in every bin of the Euclidean distance
+        between nodes, and hence the wiring cost, are preserved.
+
+        Distances are binned once from coords. Edges keep their bin through
+        swaps, so the edges of every bin are a fixed pool of edge indices:
+        the first edge of a proposal is drawn uniformly, the second from the
+        pool of the bin of the first one, and proposals whose new edges fall
+        in other bins are rejected. Swaps that disconnect the network are
+        rejected as well.
+
+        Parameters
+        ----------
+        conn : (N, N) numpy.ndarray
+            Undirected connectivity matrix
+
+        coords : (N, D) numpy.ndarray
+            Coordinates of the nodes
+
+        n_bins : int
+            Number of equal-frequency distance bins
+
+        swaps : int
+            Number of swaps per edge
+
+        max_attempts : int
+            Maximum number of proposals per swap. A swap with no valid
+            proposal is skipped, and a warning reports the number of swaps
+            done if some were skipped.
+
+        seed : None, int, numpy.random.SeedSequence or numpy.random.Generator
+
+        Returns
+        -------
+        new_conn : (N, N) numpy.ndarray
+    """
+
+    rng = get_rng(seed)
+
+    new_conn = conn.copy()
+    bins = get_distance_bins(coords, n_bins)
+
+    neighbors = rewiring.get_neighbor_sets(new_conn)
+    connected = csgraph.connected_components(new_conn, directed=False)[0] == 1
+
+    # edges (upper triangle) and pools of edge indices per distance bin
+    i, j = np.nonzero(np.triu(new_conn, 1))
+    edge_bins = bins[i, j]
+    order = np.argsort(edge_bins, kind='stable')
+    bounds = np.searchsorted(edge_bins[order], np.arange(n_bins+1))
+    pools = [order[bounds[b]:bounds[b+1]] for b in range(n_bins)]
+
+    n_edges = len(i)
+    i, j, edge_bins = i.tolist(), j.tolist(), edge_bins.tolist()
+
+    def iter_candidates(batch_size=rewiring.CANDIDATE_BATCH_SIZE):
+        # (e1, e2, flip): e1 uniform, e2 uniform in the pool of the bin of e1
+        while True:
+            e1s = rng.integers(n_edges, size=batch_size)
+            picks = rng.random(batch_size)
+            flips = rng.random(batch_size)
+            for e1, pick, flip in zip(e1s.tolist(), picks.tolist(), flips.tolist()):
+                pool = pools[edge_bins[e1]]
+                yield e1, int(pool[int(pick*len(pool))]), flip
+
+    n_swaps = swaps*n_edges
+    candidates = iter_candidates()
+
+    eff = 0
+    for swap in range(n_swaps):
+        for attempt in range(max_attempts):
+            e1, e2, flip = next(candidates)
+
+            a, b, c, d = i[e1], j[e1], i[e2], j[e2]
+            if flip > .5: c, d = d, c  # flip edge c-d with 50% probability to explore all potential rewirings
+
+            # all 4 vertices must be different, and new edges must be in the bins of the old ones
+            if not (a != c and a != d and b != c and b != d): continue
+            if (bins[a, d] != bins[a, b]) or (bins[c, b] != bins[c, d]): continue
+
+            # rewiring condition
+            if (d in neighbors[a]) or (b in neighbors[c]): continue
+
+            # connectedness condition
+            if connected and not ((c in neighbors[a]) or (d in neighbors[b])):
+                if not rewiring.stays_connected(neighbors, a, b, c, d): continue
+
+            rewiring.swap_edges(new_conn, neighbors, [(a, b), (c, d)], [(a, d), (c, b)])
+            i[e1], j[e1] = a, d
+            i[e2], j[e2] = c, b
+            eff += 1
+            break
+
+    if eff < n_swaps:
+        warnings.warn(f'geometry_preserving: {eff} of {n_swaps} swaps done, the others found no valid proposal '
+                      f'in max_attempts={max_attempts} attempts', stacklevel=2)
+
+    return new_conn
+
+
 #%% --------------------------------------------------------------------------------------------------------------------
 # NULL NETWORK MODELS
 # ----------------------------------------------------------------------------------------------------------------------
-def randmio_but_unperturbed(conn, class_mapping, swaps=10, unperturbed=None): #max_attempts=3,
+def randmio_but_unperturbed(conn, class_mapping, swaps=10, unperturbed=None, seed=None): #max_attempts=3,
+    """
+        Degree-preserving randomization of an undirected connected network
+        (as bct randmio_und_connected) that leaves the connections within
+        the unperturbed module untouched: edge pairs with a node in the
+        unperturbed module on both edges are never swapped.
+
+        The network is kept as an edge array plus adjacency sets (see
+        rewiring.py): candidate edge pairs are drawn in batches and the
+        connectedness of every swap is tested locally around the swapped
+        edges.
+    """
 
+    rng = get_rng(seed)
     conn = conn.copy()
     n = len(conn)
     i, j = np.where(np.tril(conn))
 
-    k = [e for e, (i,j) in enumerate(zip(i,j)) if not (class_mapping[i] == unperturbed and class_mapping[j] == unperturbed)]
+    unperturbed_nodes = (np.asarray(class_mapping) == unperturbed).tolist()
+    k = [e for e, (u, v) in enumerate(zip(i, j)) if not (unperturbed_nodes[u] and unperturbed_nodes[v])]
+
+    i, j = i.tolist(), j.tolist()
+    neighbors = rewiring.get_neighbor_sets(conn)
+    candidates = rewiring.iter_candidates(rng, k)
 
     swaps *= len(k)
 
@@ -156,47 +683,21 @@ def randmio_but_unperturbed(conn, class_mapping, swaps=10, unperturbed=None): #m
         while att <= max_attempts:  # while not rewired
             rewire = True
 
-            while True:
-                e1, e2 = np.random.choice(k, size=2, replace=False)
+            for e1, e2, flip in candidates:
+                a, b, c, d = i[e1], j[e1], i[e2], j[e2]
 
-                a = i[e1]
-                b = j[e1]
-                c = i[e2]
-                d = j[e2]
-
-                if (a != c and a != d and b != c and b != d) and not((unperturbed in class_mapping[[a,b]]) and (unperturbed in class_mapping[[c,d]])):
+                if (a != c and a != d and b != c and b != d) and not ((unperturbed_nodes[a] or unperturbed_nodes[b]) and (unperturbed_nodes[c] or unperturbed_nodes[d])):
                     break  # all 4 vertices must be different and edges must not belong both to unperturbed
 
-            if np.random.rand() > .5:
-
-                i.setflags(write=True)
-                j.setflags(write=True)
-                i[e2] = d
-                j[e2] = c  # flip edge c-d with 50% probability
-                c = i[e2]
-                d = j[e2]  # to explore all potential rewirings
+            if flip > .5:
+                i[e2], j[e2] = d, c  # flip edge c-d with 50% probability
+                c, d = d, c          # to explore all potential rewirings
 
             # rewiring condition
-            if not (conn[a, d] or conn[c, b]):
+            if not ((d in neighbors[a]) or (b in neighbors[c])):
                 # connectedness condition
-                if not (conn[a, c] or conn[b, d]):
-                    P = conn[(a, d), :].copy()
-                    P[0, b] = 0
-                    P[1, c] = 0
-                    PN = P.copy()
-                    PN[:, d] = 1
-                    PN[:, a] = 1
-                    while True:
-                        P[0, :] = np.any(conn[P[0, :] != 0, :], axis=0)
-                        P[1, :] = np.any(conn[P[1, :] != 0, :], axis=0)
-                        P *= np.logical_not(PN)
-                        if not np.all(np.any(P, axis=1)):
-                            rewire = False
-                            break
-                        elif np.any(P[:, (b, c)]):
-                            break
-                        PN += P
-                # end connectedness testing
+                if not ((c in neighbors[a]) or (d in neighbors[b])):
+                    rewire = rewiring.stays_connected(neighbors, a, b, c, d)
 
                 if rewire:
                     conn[a, d] = conn[a, b]
@@ -208,7 +709,13 @@ def randmio_but_unperturbed(conn, class_mapping, swaps=10, unperturbed=None): #m
                     conn[b, c] = conn[d, c]
                     conn[d, c] = 0
 
-                    j.setflags(write=True)
+                    for u, v in [(a, b), (c, d)]:
+                        neighbors[u].discard(v)
+                        neighbors[v].discard(u)
+                    for u, v in [(a, d), (c, b)]:
+                        neighbors[u].add(v)
+                        neighbors[v].add(u)
+
                     j[e1] = d
                     j[e2] = b  # reassign edge indices
                     eff += 1
@@ -219,182 +726,182 @@ def randmio_but_unperturbed(conn, class_mapping, swaps=10, unperturbed=None): #m
     return conn#, eff
 
 
-def increase_modularity(conn, class_mapping, swaps=10, max_attempts=10):
+def increase_modularity(conn, class_mapping, swaps=10, max_attempts=10, seed=None, track=False):
+    """
+        Increases the modularity of conn by swapping pairs of edges from a
+        module to two other modules, with weights in the same weight bin, for
+        an edge within the module and an edge between the other two modules.
+
+        Swaps are applied in place and rolled back if they disconnect the
+        network. The eligible edges of every module and their weight bins are
+        computed once per module and updated as edges are swapped (see
+        rewiring.py).
+
+        If track, the metrics of the network (see rewiring.get_tracker) are
+        updated after every accepted swap and their trajectory is returned
+        as a third output (pandas.DataFrame, one row per swap).
+    """
+
+    rng = get_rng(seed)
 
     new_conn = (conn.copy()-conn.min())/(conn.max()-conn.min())
-    n = len(new_conn)
+    class_mapping = np.asarray(class_mapping)
+
+    neighbors = rewiring.get_neighbor_sets(new_conn)
+    connected = csgraph.connected_components(new_conn, directed=False)[0] == 1
+
+    if track: tracker = rewiring.get_tracker(new_conn, class_mapping)
 
     eff = 0
     for clase in np.unique(class_mapping):
-        print(f'\n-------------------{clase}---------------------------------')
-
         swaps = int((swaps/100)*len(np.where(class_mapping == clase)[0]))
-        print(f'\t number of swaps: {swaps}')
+        profiling.progress('increase_modularity.class', clase=clase, n_swaps=swaps)
+        if swaps == 0: continue
 
-        for swap in range(swaps):
-            print(f'\t------------------- swap: {swap}---------------------------------')
-
-            # get pairs of nodes of existent edges across all the network
-            i,j = np.where(new_conn)
+        # edges from the module to other modules, binned by weight
+        i, j = np.where(new_conn)
+        edges = [(u, v) for u, v in zip(i.tolist(), j.tolist()) if ((class_mapping[u] == clase) and (class_mapping[u] != class_mapping[v]))]
 
-            # filter edges
-            k = [e for e, (i,j) in enumerate(zip(i,j)) if ((class_mapping[i] == clase) and (class_mapping[i] != class_mapping[j]))]
-#            k = [e for e, (i,j) in enumerate(zip(i,j)) if ((class_mapping[i] == clase) and (class_mapping[j] != clase))]
+        pool = rewiring.get_pool(edges)
+        buckets, bins = rewiring.get_weight_buckets(new_conn, edges, q=50)
+        max_size = max(len(bucket['items']) for bucket in buckets.values())
 
-            # get and bin edges' weights
-            weights = new_conn[(i[k], j[k])]
-            categories = pd.qcut(pd.Series(weights),
-                                 q=50,
-                                 labels=False,
-                                 retbins=False,
-                                 precision=8
-                                )
-
-            categories = np.array(categories).astype(int)
+        for swap in range(swaps):
+            profiling.progress('increase_modularity.swap', clase=clase, swap=swap)
 
             # rewiring
             att = 0
             while att <= max_attempts:
-                print(f'\t\t-------------------attempt: {att}')
+                profiling.progress('increase_modularity.attempt', clase=clase, swap=swap, attempt=att)
 
                 while True:
-                    # select 2 random different conenctions
-                    e1, e2 = np.random.choice(k, size=2, replace=False)
+                    # select 2 random different connections of the same weight bin
+                    (a, b), (c, d) = rewiring.sample_pair(rng, pool, buckets, bins, max_size)
 
-                    # nodes of e1 and e1
-                    a = i[e1]
-                    b = j[e1]
-                    c = i[e2]
-                    d = j[e2]
-
-                    if (a != c and a != d and b != c and b != d) and (class_mapping[b] != class_mapping[d]) and (categories[k == e1][0] == categories[k == e2][0]):
+                    if (a != c and a != d and b != c and b != d) and (class_mapping[b] != class_mapping[d]):
                         break  # all 4 vertices must be different
 
                 # rewiring condition
-                rewire = True
-                if not (new_conn[a, c] or new_conn[b, d]):
-
-                   # connectedness condition
-                   R = new_conn.copy()
-
-                   # e1
-                   R[a, c] = R[a, b]
-                   R[a, b] = 0
-                   R[c, a] = R[b, a]
-                   R[b, a] = 0
-
-                   # e2
-                   R[b, d] = R[c, d]
-                   R[c, d] = 0
-                   R[d, b] = R[d, c]
-                   R[d, c] = 0
-
-                   _, n_comp = clustering.get_components(R, no_depend=False)
-                   if n_comp[0] != n:
-                       rewire = False
-                   # end of connectedness condition
-
-                   if rewire:
-                       new_conn = R.copy()
-                       eff += 1
-                       break
+                if not ((c in neighbors[a]) or (d in neighbors[b])):
+
+                    w_ab, w_cd = new_conn[a, b], new_conn[c, d]
+                    rewiring.swap_edges(new_conn, neighbors, [(a, b), (c, d)], [(a, c), (b, d)])
+
+                    # connectedness condition: the ends of the removed edges
+                    # must still be connected
+                    if connected and rewiring.are_connected(neighbors, a, b) and rewiring.are_connected(neighbors, c, d):
+                        for edge in [(a, b), (c, d)]:
+                            rewiring.pool_remove(pool, edge)
+                            rewiring.pool_remove(buckets[bins[edge]], edge)
+
+                        if track:
+                            rewiring.update(tracker, [(a, b, w_ab, 0), (a, c, 0, w_ab), (c, d, w_cd, 0), (b, d, 0, w_cd)])
+                            rewiring.record(tracker, clase=clase)
+
+                        eff += 1
+                        break
+
+                    # roll back
+                    rewiring.swap_edges(new_conn, neighbors, [(a, c), (b, d)], [(a, b), (c, d)])
 
                 att += 1
 
+    if track: return new_conn, eff, rewiring.get_trajectory(tracker)
+
     return new_conn, eff
 
 
-def decrease_modularity(conn, class_mapping, swaps=50, max_attempts=10):
+def decrease_modularity(conn, class_mapping, swaps=50, max_attempts=10, seed=None, track=False):
+    """
+        Decreases the modularity of conn by swapping pairs of edges, one
+        within a module and one between two other modules, with weights in
+        the same weight bin, for two edges between the module and the other
+        two modules.
+
+        Swaps are applied in place and rolled back if they disconnect the
+        network. The eligible edges of every module and their weight bins are
+        computed once per module and updated as edges are swapped (see
+        rewiring.py).
+
+        If track, the metrics of the network (see rewiring.get_tracker) are
+        updated after every accepted swap and their trajectory is returned
+        as a third output (pandas.DataFrame, one row per swap).
+    """
+
+    rng = get_rng(seed)
 
     new_conn = (conn.copy()-conn.min())/(conn.max()-conn.min())
-    n = len(new_conn)
+    class_mapping = np.asarray(class_mapping)
+
+    neighbors = rewiring.get_neighbor_sets(new_conn)
+    connected = csgraph.connected_components(new_conn, directed=False)[0] == 1
+
+    if track: tracker = rewiring.get_tracker(new_conn, class_mapping)
 
     eff = 0
     for clase in np.unique(class_mapping):
-        print(f'\n-------------------{clase}---------------------------------')
-
         swaps = int((swaps/100)*len(np.where(class_mapping == clase)[0]))
-        print(f'\t number of swaps: {swaps}')
-
-        for swap in range(swaps):
-            print(f'\t------------------- swap: {swap}---------------------------------')
+        profiling.progress('decrease_modularity.class', clase=clase, n_swaps=swaps)
+        if swaps == 0: continue
 
-            # get pairs of nodes of existent edges across all the network
-            i,j = np.where(new_conn)
+        # edges within the module (k1) and between two other modules (k2),
+        # binned by weight
+        i, j = np.where(new_conn)
+        edges = list(zip(i.tolist(), j.tolist()))
+        k1 = [(u, v) for u, v in edges if (class_mapping[u] == class_mapping[v] == clase)]
+        k2 = [(u, v) for u, v in edges if ((class_mapping[u] != clase) and (class_mapping[v] != clase) and (class_mapping[u] != class_mapping[v]))]
 
-            # filter edges
-            k1 = [e for e, (i,j) in enumerate(zip(i,j)) if (class_mapping[i] == class_mapping[j] == clase)]
-            k2 = [e for e, (i,j) in enumerate(zip(i,j)) if ((class_mapping[i] != clase) and (class_mapping[j] != clase) and (class_mapping[i] != class_mapping[j]))]
+        pool = rewiring.get_pool(k1)
+        buckets, bins = rewiring.get_weight_buckets(new_conn, k1 + k2, q=50)
+        for edge in k1: rewiring.pool_remove(buckets[bins[edge]], edge)
+        max_size = max(len(bucket['items']) for bucket in buckets.values())
 
-            k = k1 + k2
-
-            # get and bin edges' weights
-            weights = new_conn[(i[k], j[k])]
-            categories = pd.qcut(pd.Series(weights),
-                                 q=50,
-                                 labels=False,
-                                 retbins=False,
-                                 precision=8
-                                )
-
-            categories = np.array(categories).astype(int)
+        for swap in range(swaps):
+            profiling.progress('decrease_modularity.swap', clase=clase, swap=swap)
 
             # rewiring
             att = 0
             while att <= max_attempts:
 
-                print(f'\t\t-------------------attempt: {att}')
+                profiling.progress('decrease_modularity.attempt', clase=clase, swap=swap, attempt=att)
 
                 while True:
-                    # select 2 random different conenctions
-                    e1 = np.random.choice(k1, size=1, replace=False)
-                    e2 = np.random.choice(k2, size=1, replace=False)
-
-                    # nodes of e1 and e1
-                    a = i[e1]
-                    b = j[e1]
-                    c = i[e2]
-                    d = j[e2]
+                    # select 2 random different connections of the same weight bin
+                    (a, b), (c, d) = rewiring.sample_pair(rng, pool, buckets, bins, max_size)
 
-                    if (a != c and a != d and b != c and b != d) and (categories[k == e1][0] == categories[k == e2][0]):
+                    if (a != c and a != d and b != c and b != d):
                         break  # all 4 vertices must be different
 
-                if np.random.rand() > .5:
-                    i[e2] = d
-                    j[e2] = c  # flip edge c-d with 50% probability
-                    c = i[e2]
-                    d = j[e2]  # to explore all potential rewirings
+                if rng.random() > .5:
+                    c, d = d, c  # flip edge c-d with 50% probability to explore all potential rewirings
 
                 # rewiring condition
-                rewire = True
-                if not (new_conn[a, d] or new_conn[c, b]):
-                    if not (new_conn[a, c] or new_conn[b, d]):
-
-                       # connectedness condition
-                       R = new_conn.copy()
-
-                       # e1
-                       R[a, d] = R[a, b]
-                       R[a, b] = 0
-                       R[d, a] = R[b, a]
-                       R[b, a] = 0
-
-                       # e2
-                       R[c, b] = R[c, d]
-                       R[c, d] = 0
-                       R[b, c] = R[d, c]
-                       R[d, c] = 0
-
-                       _, n_comp = clustering.get_components(R, no_depend=False)
-                       if n_comp[0] != n:
-                           rewire = False
-                       # end of connectedness condition
-
-                       if rewire:
-                           new_conn = R.copy()
-                           eff += 1
-                           break
+                if not ((d in neighbors[a]) or (b in neighbors[c])):
+                    if not ((c in neighbors[a]) or (d in neighbors[b])):
+
+                        w_ab, w_cd = new_conn[a, b], new_conn[c, d]
+                        rewiring.swap_edges(new_conn, neighbors, [(a, b), (c, d)], [(a, d), (c, b)])
+
+                        # connectedness condition: the ends of the removed
+                        # edges must still be connected
+                        if connected and rewiring.are_connected(neighbors, a, b) and rewiring.are_connected(neighbors, c, d):
+                            for edge in [(a, b), (b, a)]:
+                                rewiring.pool_remove(pool, edge)
+                            for edge in [(c, d), (d, c)]:
+                                rewiring.pool_remove(buckets[bins[edge]], edge)
+
+                            if track:
+                                rewiring.update(tracker, [(a, b, w_ab, 0), (a, d, 0, w_ab), (c, d, w_cd, 0), (c, b, 0, w_cd)])
+                                rewiring.record(tracker, clase=clase)
+
+                            eff += 1
+                            break
+
+                        # roll back
+                        rewiring.swap_edges(new_conn, neighbors, [(a, d), (c, b)], [(a, b), (c, d)])
 
                 att += 1
 
+    if track: return new_conn, eff, rewiring.get_trajectory(tracker)
+
     return new_conn, eff
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Shortest-path based network measures on top of scipy.sparse.csgraph.
+"""
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+# maximum number of (source, edge) pairs processed at once
+MAX_BATCH_ELEMENTS = 2**22
+
+# shortest paths of the last connectomes, keyed by content hash
+CACHE_SIZE = 4
+_cache = OrderedDict()
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# LENGTHS
+# ----------------------------------------------------------------------------------------------------------------------
+def get_lengths(conn):
+    """
+        Maps weights to lengths (1/w) keeping only the existing connections.
+
+        Parameters
+        ----------
+        conn : (N, N) numpy.ndarray or scipy.sparse matrix
+            Weighted connectivity matrix
+
+        Returns
+        -------
+        L : (N, N) scipy.sparse.csr_matrix
+            Connection-length matrix. Absent connections are not stored
+            (rather than stored as inf as in 1/conn).
+    """
+
+    conn = sparse.coo_matrix(conn, dtype=float)
+    keep = (conn.row != conn.col) & (conn.data != 0)
+
+    L = sparse.csr_matrix((1/conn.data[keep], (conn.row[keep], conn.col[keep])), shape=conn.shape)
+
+    return L
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# SHORTEST PATHS
+# ----------------------------------------------------------------------------------------------------------------------
+def get_shortest_paths(conn, cache=True, return_predecessors=True):
+    """
+        Weighted shortest paths between all pairs of nodes, with lengths 1/w.
+        Computed once per connectome: results for the last CACHE_SIZE
+        connectomes are cached by content, so path length, efficiency and
+        betweenness of the same network share a single all-pairs computation.
+
+        Parameters
+        ----------
+        conn : (N, N) numpy.ndarray or scipy.sparse matrix
+            Weighted connectivity matrix
+
+        cache : bool
+            If False, results are neither read from nor stored in the cache
+
+        return_predecessors : bool
+            If False, the (N, N) predecessor matrix is neither computed nor
+            kept
+
+        Returns
+        -------
+        shortest_paths : dict
+            'lengths' : (N, N) scipy.sparse.csr_matrix, see get_lengths
+            'distance' : (N, N) numpy.ndarray, distance matrix (same as
+                         bct.distance_wei(1/conn)[0])
+            'predecessors' : (N, N) numpy.ndarray, predecessor of node j in
+                             a shortest path from node i (-9999 if none).
+                             Only if return_predecessors.
+    """
+
+    key = get_hash(conn) if cache else None
+    if (key in _cache) and ((not return_predecessors) or ('predecessors' in _cache[key])):
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    L = get_lengths(conn)
+    if return_predecessors:
+        D, P = csgraph.shortest_path(L, method='D', directed=True, return_predecessors=True)
+        shortest_paths = {'lengths': L, 'distance': D, 'predecessors': P}
+    else:
+        D = csgraph.shortest_path(L, method='D', directed=True)
+        shortest_paths = {'lengths': L, 'distance': D}
+
+    if cache:
+        _cache[key] = shortest_paths
+        while len(_cache) > CACHE_SIZE: _cache.popitem(last=False)
+
+    return shortest_paths
+
+
+def get_hash(conn):
+    """
+        Content hash of a dense or sparse connectivity matrix.
+    """
+
+    h = hashlib.sha1()
+    if sparse.issparse(conn):
+        conn = sparse.csr_matrix(conn)
+        conn.sort_indices()
+        arrays = [conn.indptr, conn.indices, conn.data]
+    else:
+        arrays = [np.ascontiguousarray(conn)]
+
+    h.update(str(conn.shape).encode())
+    for array in arrays:
+        h.update(str(array.dtype).encode())
+        h.update(array.tobytes())
+
+    return h.hexdigest()
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def get_path(predecessors, source, target):
+    """
+        Nodes of the shortest path from source to target, retrieved from the
+        predecessor matrix. Empty if target is not reachable.
+    """
+
+    path = [target]
+    while path[-1] != source:
+        node = predecessors[source, path[-1]]
+        if node < 0: return []
+        path.append(node)
+
+    return path[::-1]
+
+
+def charpath(D, include_infinite=False):
+    """
+        Characteristic path length and global efficiency from a distance
+        matrix, as in bct.charpath. The diagonal is excluded. Infinite
+        distances are excluded from the path length unless include_infinite,
+        and always count as zero efficiency.
+
+        Returns
+        -------
+        char_path : float
+        efficiency : float
+    """
+
+    offdiag = ~np.eye(len(D), dtype=bool)
+    Dv = D[offdiag]
+
+    if include_infinite: char_path = np.mean(Dv)
+    else: char_path = np.mean(Dv[np.isfinite(Dv)])
+
+    efficiency = np.mean(1/Dv)
+
+    return char_path, efficiency
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# BETWEENNESS
+# ----------------------------------------------------------------------------------------------------------------------
+def betweenness_wei(L, n_jobs=1, D=None):
+    """
+        Node betweenness centrality of a weighted directed/undirected network
+        (Brandes' algorithm). Same output as bct.betweenness_wei (i.e., not
+        normalized; divide by (N-1)*(N-2) to normalize), for connected
+        networks.
+
+        Shortest-path distances are computed with Dijkstra's algorithm in
+        scipy.sparse.csgraph for batches of source nodes, and path counts and
+        dependencies are accumulated over the shortest-path DAG of every
+        source with sparse matrix products (one product per hop).
+
+        Parameters
+        ----------
+        L : (N, N) numpy.ndarray or scipy.sparse matrix
+            Connection-length matrix (e.g., get_lengths(conn)). Zero and inf
+            entries are absent connections.
+
+        n_jobs : int
+            Number of processes across which source nodes are split
+
+        D : (N, N) numpy.ndarray
+            Distance matrix of L (e.g., get_shortest_paths(conn)['distance']).
+            If None, distances are computed from every source.
+
+        Returns
+        -------
+        BC : (N,) numpy.ndarray
+            Node betweenness centrality
+    """
+
+    if not sparse.issparse(L):
+        L = np.where(np.isinf(L), 0, L)
+    L = sparse.csr_matrix(L, dtype=float)
+
+    sources = np.arange(L.shape[0])
+
+    if n_jobs == 1:
+        return betweenness_sources(L, sources, D)
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        BC = list(executor.map(betweenness_sources, [L]*n_jobs, np.array_split(sources, n_jobs), [D]*n_jobs))
+
+    return np.sum(BC, axis=0)
+
+
+def betweenness_sources(L, sources, D=None):
+    """
+        Dependencies of all nodes accumulated over the shortest paths starting
+        at sources.
+
+        Parameters
+        ----------
+        L : (N, N) scipy.sparse.csr_matrix
+            Connection-length matrix
+
+        sources : (n_sources,) numpy.ndarray
+            Source nodes
+
+        D : (N, N) numpy.ndarray
+            Distance matrix. If None, distances from sources are computed in
+            batches.
+
+        Returns
+        -------
+        BC : (N,) numpy.ndarray
+    """
+
+    N = L.shape[0]
+    coo = L.tocoo()
+    u, v, lengths = coo.row, coo.col, coo.data
+
+    BC = np.zeros(N)
+
+    batch_size = max(1, MAX_BATCH_ELEMENTS//max(1, len(lengths)))
+    for start in range(0, len(sources), batch_size):
+        batch = sources[start:start+batch_size]
+        S = len(batch)
+
+        if D is None: D_batch = csgraph.dijkstra(L, directed=True, indices=batch)
+        else: D_batch = D[batch]
+
+        # edges (u, v) of the shortest-path DAG of every source
+        with np.errstate(invalid='ignore'):
+            Du = D_batch[:, u]
+            tight = np.isfinite(Du) & np.isclose(Du + lengths, D_batch[:, v], rtol=1e-12, atol=0)
+
+        s_idx, e_idx = np.nonzero(tight)
+        src = s_idx*N + u[e_idx]
+        dst = s_idx*N + v[e_idx]
+
+        # number of shortest paths from the source: sum of paths of every
+        # number of hops
+        A = sparse.csr_matrix((np.ones(len(src)), (dst, src)), shape=(S*N, S*N))
+
+        paths = np.zeros(S*N)
+        paths[np.arange(S)*N + batch] = 1
+        sigma = paths.copy()
+        while paths.any():
+            paths = A @ paths
+            sigma += paths
+
+        # dependencies delta = B(1 + delta), with B[u, v] = sigma[u]/sigma[v]
+        B = sparse.csr_matrix((sigma[src]/sigma[dst], (src, dst)), shape=(S*N, S*N))
+
+        delta = np.zeros(S*N)
+        dep = B @ np.ones(S*N)
+        while dep.any():
+            delta += dep
+            dep = B @ dep
+
+        delta = delta.reshape(S, N)
+        delta[np.arange(S), batch] = 0
+
+        BC += delta.sum(axis=0)
+
+    return BC
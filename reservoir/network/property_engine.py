@@ -0,0 +1,532 @@
+# -*- coding: utf-8 -*-
+"""
+Memoized engine for network properties.
+
+Every property is a node of a small DAG whose other nodes are intermediates
+shared by several properties (binary adjacency, 1/w lengths, shortest-path
+distances, one-hot module memberships, node-by-module strengths and module
+block statistics). compute resolves the dependencies of the requested
+properties and evaluates every node once.
+Evaluated nodes are memoized per connectome (and partition) content hash, so
+calls for local, global and modular properties of the same network share
+their intermediates.
+
+Networks can be dense arrays or scipy.sparse matrices. Sparse networks are
+kept sparse (binary adjacency as bool) and every property has a sparse
+implementation, so high-resolution parcellations are never densified except
+for the all-pairs distance matrix of the path-based properties.
+
+compute_batch does the same for a stack of networks: the properties in
+BATCHED are computed for the whole stack at once with array operations, and
+the rest network by network, optionally across a process pool.
+"""
+import hashlib
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from . import paths
+
+# bct is imported by the dense implementations that use it, so that importing
+# the engine (e.g., through nulls in every worker of a sweep) stays cheap
+
+# inputs given by the caller, not computed by the engine
+INPUTS = ['conn', 'class_mapping', 'classes_sorted', 'n_jobs']
+
+# evaluated nodes of the last connectomes, keyed by content hash. Nodes include
+# dense (N, N) intermediates (e.g., the distance matrix), so by default only
+# those of the last connectome are kept
+CACHE_SIZE = 1
+_cache = OrderedDict()
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# INTERMEDIATES
+# ----------------------------------------------------------------------------------------------------------------------
+def get_conn_bin(conn):
+    if sparse.issparse(conn):
+        conn_bin = sparse.csr_matrix(conn != 0)
+        conn_bin.eliminate_zeros()
+        return conn_bin
+
+    return (conn != 0).astype(np.int8)
+
+
+def square(w):
+    return w.power(2) if sparse.issparse(w) else np.square(w)
+
+
+def tril(w, k=0):
+    return sparse.tril(w, k, format='csr') if sparse.issparse(w) else np.tril(w, k)
+
+
+def sum_axis(w, axis):
+    return np.asarray(w.sum(axis=axis)).ravel()
+
+
+def get_module_onehot(class_mapping, classes_sorted):
+    """
+        (N, n_modules) one-hot module membership, with modules in the order
+        of classes_sorted (sorted labels if None).
+    """
+
+    if classes_sorted is None: classes_sorted = np.unique(class_mapping)
+    return (np.asarray(class_mapping)[:,None] == np.asarray(classes_sorted)[None,:]).astype(float)
+
+
+def get_module_strengths_pos(conn, module_strengths, onehot):
+    # strengths of the positive weights only (same as module_strengths for
+    # non-negative networks)
+    if conn.min() >= 0: return module_strengths
+
+    if sparse.issparse(conn): return conn.multiply(conn > 0) @ onehot
+    return (conn*(conn > 0)) @ onehot
+
+
+def get_block_moments(conn, onehot):
+    """
+        Sum, sum of squares and number of nonzero weights of the within-module
+        block (lower triangle) and of the between-module block (rows of the
+        module, columns of the other modules) of every module, from a few
+        products with the one-hot module matrix.
+
+        Returns
+        -------
+        moments : dict
+            'within', 'between' : (3, n_modules) numpy.ndarray, rows are the
+                                  sum, sum of squares and nonzero count
+            'n_within', 'n_between' : (n_modules,) numpy.ndarray, number of
+                                      entries of every block
+            'blocks' : (n_modules, n_modules) numpy.ndarray, sum of the
+                       weights between every pair of modules
+    """
+
+    sizes = onehot.sum(axis=0)
+    lower = tril(conn, -1)
+
+    # weights, squared weights and nonzero indicators
+    blocks, within = [], []
+    for w, w_lower in [(conn, lower), (square(conn), square(lower)), (get_conn_bin(conn), get_conn_bin(lower))]:
+        blocks.append(onehot.T @ (w @ onehot))
+        within.append(np.sum(onehot*(w_lower @ onehot), axis=0))
+
+    blocks = np.array(blocks)
+    between = blocks.sum(axis=2) - np.diagonal(blocks, axis1=1, axis2=2)
+
+    return {'within': np.array(within),
+            'between': between,
+            'n_within': sizes*(sizes-1)/2,
+            'n_between': sizes*(conn.shape[0]-sizes),
+            'blocks': blocks[0]
+            }
+
+
+INTERMEDIATES = {
+    'conn_bin':          (['conn'], get_conn_bin),
+    'shortest_paths':    (['conn'], lambda conn: paths.get_shortest_paths(conn, cache=False, return_predecessors=False)),
+    'lengths':           (['shortest_paths'], lambda sp: sp['lengths']),
+    'distance':          (['shortest_paths'], lambda sp: sp['distance']),
+    'module_onehot':     (['class_mapping', 'classes_sorted'], get_module_onehot),
+    'module_strengths':  (['conn', 'module_onehot'], lambda conn, onehot: conn @ onehot),
+    'module_strengths_pos': (['conn', 'module_strengths', 'module_onehot'], get_module_strengths_pos),
+    'module_degrees':    (['conn_bin', 'module_onehot'], lambda conn_bin, onehot: conn_bin @ onehot),
+    'block_moments':     (['conn', 'module_onehot'], get_block_moments),
+}
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# PROPERTIES
+# ----------------------------------------------------------------------------------------------------------------------
+def strengths(conn):
+    if sparse.issparse(conn): return sum_axis(conn, 0)
+
+    from bct.algorithms import degree
+    return degree.strengths_und(conn)
+
+
+def degrees(conn_bin):
+    if sparse.issparse(conn_bin): return sum_axis(conn_bin, 0)
+
+    from bct.algorithms import degree
+    return degree.degrees_und(conn_bin)
+
+
+def cycles(conn):
+    # intensity of the 3-cycles of every node of a sparse network, as in bct
+    # clustering_coef_wu
+    ws = sparse.csr_matrix(conn, dtype=float, copy=True)
+    ws.data = np.cbrt(ws.data)
+    return sum_axis((ws @ ws).multiply(ws.T), 1)
+
+
+def clustering_coef_wu(conn, conn_bin):
+    if not sparse.issparse(conn):
+        from bct.algorithms import clustering
+        return clustering.clustering_coef_wu(conn)
+
+    K = sum_axis(conn_bin, 1).astype(float)
+    cyc3 = cycles(conn)
+    K[cyc3 == 0] = np.inf
+
+    return cyc3/(K*(K-1))
+
+
+def clustering_coef_bu(conn_bin):
+    if not sparse.issparse(conn_bin):
+        from bct.algorithms import clustering
+        return clustering.clustering_coef_bu(conn_bin)
+
+    G = sparse.coo_matrix(conn_bin, dtype=float)
+    offdiag = G.row != G.col
+    G = sparse.csr_matrix((G.data[offdiag], (G.row[offdiag], G.col[offdiag])), shape=G.shape)
+
+    K = sum_axis(G, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        C = cycles(G)/(K*(K-1))
+    C[K < 2] = 0
+
+    return C
+
+
+def transitivity_wu(conn, conn_bin):
+    if not sparse.issparse(conn):
+        from bct.algorithms import clustering
+        return clustering.transitivity_wu(conn)
+
+    K = sum_axis(conn_bin, 1)
+    return np.sum(cycles(conn))/np.sum(K*(K-1))
+
+
+def assortativity(conn, node_values):
+    # as bct assortativity_wei/bin with flag=0, for a sparse network
+    edges = sparse.triu(conn, 1, format='coo')
+    i, j = edges.row[edges.data > 0], edges.col[edges.data > 0]
+
+    K = len(i)
+    vi, vj = node_values[i], node_values[j]
+    term1 = np.sum(vi*vj)/K
+    term2 = np.square(np.sum(0.5*(vi+vj))/K)
+    term3 = np.sum(0.5*(vi*vi+vj*vj))/K
+
+    return (term1-term2)/(term3-term2)
+
+
+def assortativity_wei(conn):
+    if sparse.issparse(conn): return assortativity(conn, strengths(conn))
+
+    from bct.algorithms import core
+    return core.assortativity_wei(conn, flag=0)
+
+
+def assortativity_bin(conn_bin):
+    if sparse.issparse(conn_bin): return assortativity(conn_bin, degrees(conn_bin))
+
+    from bct.algorithms import core
+    return core.assortativity_bin(conn_bin, flag=0)
+
+
+def wei_centrality(lengths, D, n_jobs=1):
+    N = len(D)
+    return paths.betweenness_wei(lengths, n_jobs=n_jobs, D=D)/((N-1)*(N-2))
+
+
+def bin_centrality(conn_bin, n_jobs=1):
+    N = conn_bin.shape[0]
+
+    # unit lengths: same as bct betweenness_bin
+    if sparse.issparse(conn_bin): BC = paths.betweenness_wei(paths.get_lengths(conn_bin), n_jobs=n_jobs)
+    else:
+        from bct.algorithms import centrality
+        BC = centrality.betweenness_bin(conn_bin.astype(int))
+
+    return BC/((N-1)*(N-2))
+
+
+def participation_coef(conn, module_strengths):
+    # same as bct participation_coef
+    Ko = sum_axis(conn, 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        P = 1 - np.sum(np.square(module_strengths), axis=1)/np.square(Ko)
+    P[Ko == 0] = 0
+
+    return P
+
+
+def diversity_coef(module_strengths_pos):
+    # same as the positive output of bct diversity_coef_sign
+    n_modules = module_strengths_pos.shape[1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pnm = module_strengths_pos/np.sum(module_strengths_pos, axis=1, keepdims=True)
+    pnm[np.isnan(pnm)] = 0
+    pnm[pnm == 0] = 1
+
+    return -np.sum(pnm*np.log(pnm), axis=1)/np.log(n_modules)
+
+
+def module_modularity(conn, moments):
+    # modularity of every module, as in netneurotools get_modularity
+    s = conn.sum()
+    k_out = np.sum(moments['blocks'], axis=1)
+    k_in = np.sum(moments['blocks'], axis=0)
+
+    return (np.diag(moments['blocks']) - k_out*k_in/s)/s
+
+
+def segregation(moments):
+    """
+        Segregation of every module: difference between the mean z-scored
+        weight of the within- and the between-module blocks, relative to the
+        within one. Weights are z-scored with the mean and std of the nonzero
+        weights of their block, and averaged over all the entries of the
+        block.
+    """
+    def mean_z(moments, n):
+        total, total_sq, nnz = moments
+        mu = total/nnz
+        sd = np.sqrt(total_sq/nnz - np.square(mu))
+        return (total/n - mu)/sd
+
+    z_within = mean_z(moments['within'], moments['n_within'])
+    z_between = mean_z(moments['between'], moments['n_between'])
+
+    return (z_within - z_between)/z_within
+
+
+PROPERTIES = {
+    # local
+    ('local', 'node_strength'):           (['conn'], strengths),
+    ('local', 'node_degree'):             (['conn_bin'], degrees),
+    ('local', 'wei_clustering_coeff'):    (['conn', 'conn_bin'], clustering_coef_wu),
+    ('local', 'bin_clustering_coeff'):    (['conn_bin'], clustering_coef_bu),
+    ('local', 'wei_centrality'):          (['lengths', 'distance', 'n_jobs'], wei_centrality),
+    ('local', 'bin_centrality'):          (['conn_bin', 'n_jobs'], bin_centrality),
+    ('local', 'wei_participation_coeff'): (['conn', 'module_strengths'], participation_coef),
+    ('local', 'bin_participation_coeff'): (['conn_bin', 'module_degrees'], participation_coef),
+    ('local', 'wei_diversity_coeff'):     (['module_strengths_pos'], diversity_coef),
+
+    # global
+    ('global', 'path_length'):            (['distance'], lambda D: paths.charpath(D, include_infinite=False)[0]),
+    ('global', 'efficiency'):             (['distance'], lambda D: paths.charpath(D)[1]),
+    ('global', 'clustering'):             (['conn', 'conn_bin'], transitivity_wu),
+    ('global', 'modularity'):             (['conn', 'block_moments'], lambda conn, moments: np.sum(module_modularity(conn, moments))),
+    ('global', 'assortativity_wei'):      (['conn'], assortativity_wei),
+    ('global', 'assortativity_bin'):      (['conn_bin'], assortativity_bin),
+
+    # modular
+    ('modular', 'modularity'):            (['conn', 'block_moments'], module_modularity),
+    ('modular', 'rel_density'):           ([], lambda: None), # not implemented
+    ('modular', 'segregation'):           (['block_moments'], segregation),
+}
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# BATCHED PROPERTIES
+# ----------------------------------------------------------------------------------------------------------------------
+# functions of a (B, N, N) stack of undirected networks, same output as the
+# bct function of every network along the first axis
+
+def strengths_batch(stack):
+    return stack.sum(axis=1)
+
+
+def degrees_batch(stack):
+    return (stack != 0).sum(axis=1)
+
+
+def cycles_batch(stack):
+    # intensity of the 3-cycles of every node, as in bct clustering_coef_wu
+    ws = np.cbrt(stack)
+    return np.einsum('bij,bji->bi', ws @ ws, ws)
+
+
+def clustering_coef_wu_batch(stack):
+    K = degrees_batch(stack).astype(float)
+    cyc3 = cycles_batch(stack)
+    K[cyc3 == 0] = np.inf
+
+    return cyc3/(K*(K-1))
+
+
+def transitivity_wu_batch(stack):
+    K = degrees_batch(stack)
+    return cycles_batch(stack).sum(axis=1)/(K*(K-1)).sum(axis=1)
+
+
+def assortativity_batch(stack, node_values):
+    # correlation of node_values across the ends of every edge, as in bct
+    # assortativity_wei/bin with flag=0
+    edges = np.triu(stack, 1) > 0
+    K = edges.sum(axis=(1,2))
+
+    vi = node_values[:,:,None]
+    vj = node_values[:,None,:]
+    term1 = np.sum(edges*(vi*vj), axis=(1,2))/K
+    term2 = np.square(np.sum(edges*(0.5*(vi+vj)), axis=(1,2))/K)
+    term3 = np.sum(edges*(0.5*(vi*vi+vj*vj)), axis=(1,2))/K
+
+    return (term1-term2)/(term3-term2)
+
+
+BATCHED = {
+    ('local', 'node_strength'):        strengths_batch,
+    ('local', 'node_degree'):          degrees_batch,
+    ('local', 'wei_clustering_coeff'): clustering_coef_wu_batch,
+    ('global', 'clustering'):          transitivity_wu_batch,
+    ('global', 'assortativity_wei'):   lambda stack: assortativity_batch(stack, strengths_batch(stack)),
+    ('global', 'assortativity_bin'):   lambda stack: assortativity_batch(stack, degrees_batch(stack)),
+}
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# ENGINE
+# ----------------------------------------------------------------------------------------------------------------------
+def get_key(conn, class_mapping=None, classes_sorted=None):
+    """
+        Content hash of the connectome and the partition.
+    """
+
+    h = hashlib.sha1(paths.get_hash(conn).encode())
+    for labels in [class_mapping, classes_sorted]:
+        if labels is None: h.update(b'None')
+        else: h.update(np.asarray(labels).astype(str).tobytes())
+
+    return h.hexdigest()
+
+
+def compute(conn, property_list, scope='local', class_mapping=None, classes_sorted=None, n_jobs=1, cache=True, cache_size=CACHE_SIZE):
+    """
+        Computes the properties in property_list, evaluating every shared
+        intermediate once.
+
+        Parameters
+        ----------
+        conn : (N, N) numpy.ndarray
+            Weighted connectivity matrix
+
+        property_list : list of str
+            Names of the properties (see PROPERTIES)
+
+        scope : {'local', 'global', 'modular'}
+            Scope of the properties in property_list
+
+        class_mapping : (N,) numpy.ndarray
+            Module of every node. Required by partition-based properties.
+
+        classes_sorted : (n_modules,) numpy.ndarray
+            Order of the modules in modular properties
+
+        n_jobs : int
+            Number of processes for the properties that support them
+
+        cache : bool
+            If True, evaluated nodes are memoized per content hash of conn,
+            class_mapping and classes_sorted
+
+        cache_size : int
+            Number of connectomes (and partitions) whose evaluated nodes are
+            kept in the cache
+
+        Returns
+        -------
+        properties : dict
+            {property: value}, in the order of property_list
+    """
+
+    for prop in property_list:
+        if (scope, prop) not in PROPERTIES:
+            raise ValueError(f'Unknown {scope} property: {prop}')
+
+    if cache and (cache_size > 0):
+        key = get_key(conn, class_mapping, classes_sorted)
+        if key not in _cache: _cache[key] = {}
+        _cache.move_to_end(key)
+        while len(_cache) > cache_size: _cache.popitem(last=False)
+        values = _cache[key]
+    else:
+        values = {}
+
+    inputs = {'conn': conn, 'class_mapping': class_mapping, 'classes_sorted': classes_sorted, 'n_jobs': n_jobs}
+
+    def evaluate(node):
+        if node in INPUTS: return inputs[node]
+        if node in values: return values[node]
+
+        deps, func = INTERMEDIATES[node] if node in INTERMEDIATES else PROPERTIES[node]
+        values[node] = func(*[evaluate(dep) for dep in deps])
+
+        return values[node]
+
+    properties = {}
+    for prop in property_list:
+        value = evaluate((scope, prop))
+        properties[prop] = value.copy() if isinstance(value, np.ndarray) else value
+
+    return properties
+
+
+def compute_batch(stack, property_list, scope='local', class_mapping=None, classes_sorted=None, n_jobs=1, executor=None):
+    """
+        Computes the properties in property_list for every network of a
+        stack. Properties in BATCHED are computed for the whole stack with
+        array operations, the rest with compute, network by network.
+
+        Parameters
+        ----------
+        stack : (B, N, N) numpy.ndarray or list of scipy.sparse matrices
+            Weighted connectivity matrices
+
+        property_list, scope, class_mapping, classes_sorted :
+            See compute
+
+        n_jobs : int
+            Number of processes across which networks are split for the
+            properties not in BATCHED
+
+        executor : concurrent.futures.Executor
+            Pool to use instead of creating one (e.g., to share it across
+            several stacks)
+
+        Returns
+        -------
+        properties : dict
+            {property: (B, ...) numpy.ndarray}, in the order of property_list
+    """
+
+    for prop in property_list:
+        if (scope, prop) not in PROPERTIES:
+            raise ValueError(f'Unknown {scope} property: {prop}')
+
+    # sparse networks are not stacked: all their properties are computed
+    # network by network
+    if any(sparse.issparse(conn) for conn in stack):
+        batched = {}
+    else:
+        stack = np.asarray(stack)
+        batched = {prop: BATCHED[(scope, prop)](stack) for prop in property_list if (scope, prop) in BATCHED}
+
+    remaining = [prop for prop in property_list if prop not in batched]
+    if remaining:
+        func = partial(compute, property_list=remaining, scope=scope, class_mapping=class_mapping,
+                       classes_sorted=classes_sorted, cache=False)
+
+        if executor is not None:
+            results = list(executor.map(func, stack))
+        elif n_jobs == 1:
+            results = [func(conn) for conn in stack]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                results = list(executor.map(func, stack))
+
+        for prop in remaining:
+            batched[prop] = np.array([res[prop] for res in results])
+
+    return {prop: batched[prop] for prop in property_list}
+
+
+def clear_cache():
+    _cache.clear()
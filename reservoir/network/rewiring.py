@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Tools for the edge-rewiring null models in nulls.py.
+
+A tracker follows the metrics of a network while its edges are rewired:
+node strengths and degrees, the weight between every pair of modules of a
+fixed partition and the modularity Q of that partition are updated from the
+connections changed by every accepted swap, in O(1) per connection (O(n_modules)
+for Q), instead of being recomputed from the connectivity matrix. Recording
+the tracker after every swap gives the trajectory of the metrics along a
+single rewiring run.
+
+The edge-list engine keeps a network as an edge array plus adjacency sets,
+so that degree-preserving swaps and their connectedness test do not touch
+dense rows of the connectivity matrix. Swaps are applied in place and rolled
+back if they disconnect the network, and the edges eligible for a swap are
+kept in pools (by weight bin) that are updated as edges are swapped, instead
+of being recomputed from the matrix.
+"""
+import numpy as np
+import pandas as pd
+
+from . import property_engine
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# METRIC TRACKER
+# ----------------------------------------------------------------------------------------------------------------------
+def get_tracker(conn, class_mapping, classes_sorted=None):
+    """
+        Parameters
+        ----------
+        conn : (N, N) numpy.ndarray
+            Undirected weighted connectivity matrix before rewiring
+
+        class_mapping : (N,) numpy.ndarray
+            Module of every node
+
+        classes_sorted : (n_modules,) numpy.ndarray
+            Order of the modules. Sorted labels if None.
+
+        Returns
+        -------
+        tracker : dict
+            'modules' : (n_modules,) labels of the modules
+            'module' : (N,) index of the module of every node
+            'strengths', 'degrees' : (N,) node strengths and degrees
+            'blocks' : (n_modules, n_modules) sum of the weights between
+                       every pair of modules (both directions)
+            'module_strengths' : (n_modules,) sum of the strengths of the
+                                 nodes of every module
+            'total' : sum of all the weights
+            'n_swaps' : number of swaps applied
+            'trajectory' : list of recorded rows, see record
+    """
+
+    if classes_sorted is None: classes_sorted = np.unique(class_mapping)
+    onehot = property_engine.get_module_onehot(class_mapping, classes_sorted)
+
+    blocks = onehot.T @ conn @ onehot
+
+    tracker = {'modules': np.asarray(classes_sorted),
+               'module': np.argmax(onehot, axis=1),
+               'strengths': np.sum(conn, axis=0).astype(float),
+               'degrees': np.sum(conn != 0, axis=0),
+               'blocks': blocks,
+               'module_strengths': np.sum(blocks, axis=1),
+               'total': float(np.sum(conn)),
+               'n_swaps': 0,
+               'trajectory': []
+               }
+
+    record(tracker)
+
+    return tracker
+
+
+def update(tracker, changes):
+    """
+        Updates the tracker with the connections changed by one swap.
+
+        Parameters
+        ----------
+        tracker : dict
+            See get_tracker
+
+        changes : list of (u, v, old_weight, new_weight)
+            Undirected connections (u != v) whose weight changed. Both (u, v)
+            and (v, u) are assumed to have changed.
+    """
+
+    module = tracker['module']
+    for u, v, old, new in changes:
+        dw = new-old
+        mu, mv = module[u], module[v]
+
+        tracker['strengths'][[u, v]] += dw
+        tracker['degrees'][[u, v]] += int(new != 0) - int(old != 0)
+
+        tracker['blocks'][mu, mv] += dw
+        tracker['blocks'][mv, mu] += dw
+        tracker['module_strengths'][mu] += dw
+        tracker['module_strengths'][mv] += dw
+        tracker['total'] += 2*dw
+
+    tracker['n_swaps'] += 1
+
+
+def get_modularity(tracker):
+    """
+        Modularity of every module of the partition (as in
+        property_engine.module_modularity). Q is their sum.
+    """
+
+    total = tracker['total']
+    return (np.diag(tracker['blocks']) - np.square(tracker['module_strengths'])/total)/total
+
+
+def record(tracker, **info):
+    """
+        Appends the current metrics (plus any info) to the trajectory of the
+        tracker: number of swaps, modularity Q, fraction of the weight within
+        modules and the modularity of every module.
+    """
+
+    q = get_modularity(tracker)
+
+    row = {'swap': tracker['n_swaps'],
+           'modularity': np.sum(q),
+           'within_weight': np.trace(tracker['blocks'])/tracker['total'],
+           **{f'q_{module}': q_module for module, q_module in zip(tracker['modules'], q)},
+           **info
+           }
+
+    tracker['trajectory'].append(row)
+
+
+def get_trajectory(tracker):
+    """
+        Returns
+        -------
+        trajectory : pandas.DataFrame
+            One row per recorded state of the tracker
+    """
+    return pd.DataFrame(tracker['trajectory'])
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# EDGE-LIST ENGINE
+# ----------------------------------------------------------------------------------------------------------------------
+# degree-preserving swaps on an edge array plus adjacency sets: candidate edge
+# pairs are drawn in batches, and the connectedness test only explores the
+# neighborhood of the swapped edges
+
+CANDIDATE_BATCH_SIZE = 4096
+
+
+def get_neighbor_sets(conn):
+    """
+        Returns
+        -------
+        neighbors : list of set
+            Neighbors of every node (nonzero entries of every row of conn)
+    """
+
+    rows, cols = np.nonzero(conn)
+    neighbors = [set() for _ in range(len(conn))]
+    for u, v in zip(rows.tolist(), cols.tolist()): neighbors[u].add(v)
+
+    return neighbors
+
+
+def iter_candidates(rng, edges, batch_size=CANDIDATE_BATCH_SIZE):
+    """
+        Infinite stream of candidate swaps (e1, e2, flip): two edges drawn
+        uniformly (with replacement) from edges, and a uniform [0, 1)
+        number for flipping the orientation of e2. Random numbers are drawn
+        batch_size candidates at a time.
+    """
+
+    edges = np.asarray(edges)
+    while True:
+        pairs = edges[rng.integers(len(edges), size=(batch_size, 2))]
+        flips = rng.random(batch_size)
+        yield from zip(pairs[:,0].tolist(), pairs[:,1].tolist(), flips.tolist())
+
+
+def stays_connected(neighbors, a, b, c, d):
+    """
+        Whether a connected undirected network stays connected when edges
+        a-b and c-d are replaced by a-d and c-b (same test as bct
+        randmio_und_connected). Two breadth-first searches grow level by
+        level from a (without edge a-b) and from d (without edge d-c), and
+        stop as soon as one of them reaches b or c, or one of them cannot
+        grow anymore.
+    """
+
+    visited = [{a, d}, {a, d}]
+    frontiers = [neighbors[a] - {b}, neighbors[d] - {c}]
+    for visit, frontier in zip(visited, frontiers): visit |= frontier
+
+    while True:
+        for n, frontier in enumerate(frontiers):
+            frontiers[n] = set().union(*[neighbors[node] for node in frontier]) - visited[n]
+
+        if not all(frontiers): return False
+        if any((b in frontier) or (c in frontier) for frontier in frontiers): return True
+
+        for visit, frontier in zip(visited, frontiers): visit |= frontier
+
+
+def swap_edges(conn, neighbors, old_edges, new_edges):
+    """
+        Moves, in place, the weight of every edge (u, v) in old_edges (and of
+        (v, u)) to the edge (x, y) (and (y, x)) at the same position in
+        new_edges. Calling it again with old_edges and new_edges exchanged
+        rolls the swap back.
+    """
+
+    for (u, v), (x, y) in zip(old_edges, new_edges):
+        conn[x, y], conn[y, x] = conn[u, v], conn[v, u]
+        conn[u, v], conn[v, u] = 0, 0
+
+        neighbors[u].discard(v)
+        neighbors[v].discard(u)
+        neighbors[x].add(y)
+        neighbors[y].add(x)
+
+
+def are_connected(neighbors, u, v):
+    """
+        Whether there is a path between u and v. Breadth-first searches
+        grow from both ends, always expanding the smaller frontier, until
+        they meet.
+    """
+
+    if u == v: return True
+
+    visited = [{u}, {v}]
+    frontiers = [{u}, {v}]
+    while frontiers[0] and frontiers[1]:
+        n = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+
+        frontier = set().union(*[neighbors[node] for node in frontiers[n]]) - visited[n]
+        if not frontier.isdisjoint(visited[1-n]): return True
+
+        visited[n] |= frontier
+        frontiers[n] = frontier
+
+    return False
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# EDGE POOLS
+# ----------------------------------------------------------------------------------------------------------------------
+# sets of edges with O(1) insertion, removal and uniform sampling (list of
+# items plus position of every item), and equal-frequency weight buckets of
+# pools
+
+def get_pool(items=()):
+    pool = {'items': [], 'pos': {}}
+    for item in items: pool_add(pool, item)
+
+    return pool
+
+
+def pool_add(pool, item):
+    if item in pool['pos']: return
+
+    pool['pos'][item] = len(pool['items'])
+    pool['items'].append(item)
+
+
+def pool_remove(pool, item):
+    if item not in pool['pos']: return
+
+    # move the last item into the position of the removed one
+    pos = pool['pos'].pop(item)
+    last = pool['items'].pop()
+    if pos < len(pool['items']):
+        pool['items'][pos] = last
+        pool['pos'][last] = pos
+
+
+def pool_sample(rng, pool):
+    return pool['items'][rng.integers(len(pool['items']))]
+
+
+def get_weight_buckets(conn, edges, q=50):
+    """
+        Bins edges in q equal-frequency bins of their weight (as pd.qcut).
+        Bins with the same edges (tied weights, e.g., binary networks) are
+        merged.
+
+        Returns
+        -------
+        buckets : dict
+            {bin: pool of the edges of the bin}
+
+        bins : dict
+            {edge: bin}
+    """
+
+    weights = [conn[u, v] for u, v in edges]
+    categories = pd.qcut(pd.Series(weights), q=q, labels=False, retbins=False, precision=8, duplicates='drop')
+
+    # a single distinct weight leaves no bin edges: all edges share bin 0
+    bins = dict(zip(edges, np.nan_to_num(np.array(categories, dtype=float)).astype(int).tolist()))
+
+    buckets = {}
+    for edge, b in bins.items():
+        if b not in buckets: buckets[b] = get_pool()
+        pool_add(buckets[b], edge)
+
+    return buckets, bins
+
+
+def sample_pair(rng, pool, buckets, bins, max_size):
+    """
+        Draws an edge e1 from pool and an edge e2 from the bucket of the bin
+        of e1, uniformly over all such pairs: e1 is accepted with probability
+        proportional to the size of its bucket (max_size is an upper bound
+        of the bucket sizes).
+    """
+
+    while True:
+        e1 = pool_sample(rng, pool)
+        bucket = buckets.get(bins[e1])
+        if bucket is None: continue
+
+        if rng.random()*max_size < len(bucket['items']):
+            return e1, pool_sample(rng, bucket)
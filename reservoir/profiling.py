@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in stage-level instrumentation and progress reporting.
+
+Stages are named blocks of code (`with profiling.stage('fit', alpha=alpha):`)
+for which wall time, number of calls and peak allocated memory are recorded.
+Labels set with `profiling.labels(module=module)` are inherited by every stage
+opened inside them, so results can be broken down per module and per alpha.
+When profiling is disabled (default) `stage` and `labels` return a shared
+no-op context manager.
+
+Progress messages are sent to a user defined callback (silent by default)
+through `progress`.
+"""
+import time
+import tracemalloc
+import contextlib
+
+import pandas as pd
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+_enabled = False
+_trace_memory = False
+_started_tracemalloc = False
+
+_records = {}   # {(stage, labels): [calls, wall_time, peak_memory]}
+_labels  = []   # stack of label dicts
+_frames  = []   # stack of memory frames of the open stages
+
+_progress_callback = None
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# PROFILING
+# ----------------------------------------------------------------------------------------------------------------------
+def enable(trace_memory=True):
+    """
+        Enables the recording of stages. If trace_memory is True, peak
+        allocated memory is recorded with tracemalloc (which slows down
+        allocation-heavy code).
+    """
+    global _enabled, _trace_memory, _started_tracemalloc
+
+    _enabled = True
+    _trace_memory = trace_memory
+
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+
+
+def disable():
+
+    global _enabled, _started_tracemalloc
+
+    _enabled = False
+
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    _records.clear()
+
+
+@contextlib.contextmanager
+def profile(trace_memory=True):
+    """
+        Records all stages run within the context from a clean state.
+
+        >>> with profiling.profile():
+        ...     coding.decoder(**kwargs)
+        >>> df = profiling.get_report()
+    """
+    reset()
+    enable(trace_memory)
+    try:
+        yield
+    finally:
+        disable()
+
+
+def stage(name, **labels):
+    """
+        Context manager that records wall time, calls and peak memory of the
+        enclosed block under name and the current labels.
+    """
+    if not _enabled: return _NULL_CONTEXT
+    return _stage(name, labels)
+
+
+def labels(**labels):
+    """
+        Context manager that attaches labels (e.g., module, alpha) to every
+        stage opened inside it.
+    """
+    if not _enabled: return _NULL_CONTEXT
+    return _label(labels)
+
+
+@contextlib.contextmanager
+def _label(labels):
+    _labels.append(labels)
+    try:
+        yield
+    finally:
+        _labels.pop()
+
+
+@contextlib.contextmanager
+def _stage(name, labels):
+
+    current_labels = {}
+    for tmp_labels in _labels: current_labels.update(tmp_labels)
+    current_labels.update(labels)
+
+    trace_memory = _trace_memory and tracemalloc.is_tracing()
+    if trace_memory:
+        # the peak reached so far belongs to the enclosing stage
+        current, peak = tracemalloc.get_traced_memory()
+        if _frames: _frames[-1]['peak'] = max(_frames[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        _frames.append({'start': current, 'peak': current})
+
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall_time = time.perf_counter() - t0
+
+        peak_memory = 0
+        if trace_memory:
+            frame = _frames.pop()
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            if _frames: _frames[-1]['peak'] = max(_frames[-1]['peak'], frame['peak'])
+            peak_memory = frame['peak'] - frame['start']
+
+        key = (name, tuple(sorted(current_labels.items())))
+        record = _records.setdefault(key, [0, 0.0, 0])
+        record[0] += 1
+        record[1] += wall_time
+        record[2] = max(record[2], peak_memory)
+
+
+def get_report():
+    """
+        Returns
+        -------
+        df : pandas.DataFrame
+            One row per stage and combination of labels, with columns stage,
+            <labels>, calls, wall_time (s) and peak_memory (bytes above the
+            memory allocated when the stage started).
+    """
+
+    rows = []
+    for (name, labels), (calls, wall_time, peak_memory) in _records.items():
+        rows.append({'stage': name, **dict(labels), 'calls': calls, 'wall_time': wall_time, 'peak_memory': peak_memory})
+
+    df = pd.DataFrame(rows, columns=None if rows else ['stage', 'calls', 'wall_time', 'peak_memory'])
+    columns = ['stage'] + [c for c in df.columns if c not in ('stage', 'calls', 'wall_time', 'peak_memory')] + ['calls', 'wall_time', 'peak_memory']
+
+    return df[columns]
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# PROGRESS
+# ----------------------------------------------------------------------------------------------------------------------
+def set_progress_callback(callback):
+    """
+        Sets the function called as callback(event, **info) by progress. Use
+        None to silence progress messages, or print_progress to print them.
+    """
+    global _progress_callback
+    _progress_callback = callback
+
+
+def progress(event, **info):
+    if _progress_callback is not None: _progress_callback(event, **info)
+
+
+def print_progress(event, **info):
+    print(f'{event} : ' + ', '.join(f'{key} = {value}' for key, value in info.items()))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Random number generation.
+
+Every stochastic function in the toolbox takes a `seed` argument that can be
+None, an int, a numpy.random.SeedSequence or a numpy.random.Generator, and
+draws its random numbers from get_rng(seed) instead of the global numpy/python
+random state. Independent streams for parallel workers are obtained with
+spawn, so results do not depend on the number of workers or on the order in
+which jobs are scheduled.
+"""
+import numpy as np
+
+
+def get_rng(seed=None):
+    """
+        Parameters
+        ----------
+        seed : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            If a Generator is given it is returned as is, so that a single
+            stream can be shared by consecutive calls.
+
+        Returns
+        -------
+        rng : numpy.random.Generator
+    """
+    return np.random.default_rng(seed)
+
+
+def spawn(seed, n_children):
+    """
+        Returns n_children independent child SeedSequences of seed. The
+        children of a Generator are those of the SeedSequence it was created
+        from, so spawn(get_rng(s), n) gives the same streams as spawn(s, n).
+
+        Parameters
+        ----------
+        seed : None, int, numpy.random.SeedSequence or numpy.random.Generator
+
+        n_children : int
+
+        Returns
+        -------
+        children : list of numpy.random.SeedSequence
+    """
+    if isinstance(seed, np.random.Generator):
+        # public since numpy 1.25
+        seed = seed.bit_generator.seed_seq
+
+    elif not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+
+    return seed.spawn(n_children)
+
+
+def get_int_seed(rng):
+    """
+        Draws an int seed from rng for third party functions (networkx, bct)
+        that do not accept a numpy.random.Generator.
+    """
+    return int(rng.integers(2**31 - 1))
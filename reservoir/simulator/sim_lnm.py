@@ -6,18 +6,51 @@ Created on Fri Mar  1 09:40:33 2019
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 
-# import Oger
-import mdp
-from scipy.linalg import eigh
-
-from ..tasks import tasks
+from ..rng import (get_rng, spawn)
 
 #%% --------------------------------------------------------------------------------------------------------------------
 # NETWORK SIMULATION
 # ----------------------------------------------------------------------------------------------------------------------
-def sim(w_in, w, stimulus, ic=None, activation='tanh', threshold=0.5, add_perturb=False, t_perturb=200):
+def get_input_conn(n_inputs, n_nodes, input_nodes, factor=1.0):
+    """
+        Builds the input connectivity matrix w_in.
+
+        Parameters
+        ----------
+        n_inputs : int
+            Number of external input nodes (columns of the stimulus)
+
+        n_nodes : int
+            Number of nodes in the network
+
+        input_nodes : (n_input_nodes,) numpy.ndarray
+            Indexes of the network nodes that receive the external input. If
+            n_inputs == len(input_nodes) every external input is wired to a
+            single input node (one-to-one), otherwise every external input is
+            wired to all input nodes.
+
+        factor : float
+            Input scaling factor
+
+        Returns
+        -------
+        w_in : (n_inputs, n_nodes) numpy.ndarray
+            Input connectivity matrix
+    """
+
+    input_nodes = np.asarray(input_nodes)
+
+    w_in = np.zeros((n_inputs, n_nodes))
+    if (n_inputs > 1) and (n_inputs == len(input_nodes)):
+        w_in[np.arange(n_inputs), input_nodes] = factor
+    else:
+        w_in[:, input_nodes] = factor
+
+    return w_in
+
+
+def sim(w_in, w, stimulus, ic=None, activation='tanh', threshold=0.5, add_perturb=False, t_perturb=200, seed=None):
     """
         Simulates the dynamics of the network for provided inputs.
 
@@ -52,6 +85,9 @@ def sim(w_in, w, stimulus, ic=None, activation='tanh', threshold=0.5, add_pertur
             If True, adds a perturbation in network states at the time indicated
             by the parameter t_perturb
 
+        seed : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Seed of the random number generator used for the perturbation
+
         Returns
         -------
         x : (t, N) numpy.darray
@@ -72,25 +108,79 @@ def sim(w_in, w, stimulus, ic=None, activation='tanh', threshold=0.5, add_pertur
     # set initial conditions
     if ic is not None: x[0,:] = ic
 
+    if add_perturb: rng = get_rng(seed)
+
     # simulation of the dynamics
     if activation == 'tanh':
         for t in timesteps:
             synap_input = np.dot(x[t-1,:], w) + np.dot(stimulus[t-1,:], w_in)
             x[t,:] = np.tanh(synap_input)
 
-            if add_perturb and (t == t_perturb): x[t, np.random.choice(N, 1)] = np.random.uniform(-1,1,1)[0] #np.random.rand(1)[0]
+            if add_perturb and (t == t_perturb): x[t, rng.choice(N, 1)] = rng.uniform(-1,1,1)[0] #np.random.rand(1)[0]
 
     elif activation == 'piecewise':
         for t in timesteps:
             synap_input = np.dot(x[t-1,:], w) + np.dot(stimulus[t-1,:], w_in)
             x[t,:] = np.piecewise(synap_input, [synap_input<threshold, synap_input>=threshold], [0, 1]).astype(int)
 
-            if add_perturb and (t == t_perturb): x[t, np.random.choice(N, 1)] = np.random.uniform(0,2,1)[0] #np.random.rand(1)[0]
+            if add_perturb and (t == t_perturb): x[t, rng.choice(N, 1)] = rng.uniform(0,2,1)[0] #np.random.rand(1)[0]
 
     return x
 
 
-def run_sim(w_in, w, inputs, alphas=None, **kwargs):
+def sim_stream(w_in, w, stimulus_chunks, ic=None, t_perturb=200, seed=None, **kwargs):
+    """
+        Simulates the dynamics of the network for an input signal provided in
+        chunks (e.g., by io.iter_sgnl_recon_IO), carrying the network state
+        across chunk boundaries. Concatenating the yielded chunks gives the
+        same states as sim on the concatenated stimulus, while only one chunk
+        is held in memory at a time.
+
+        Parameters
+        ----------
+        w_in, w, ic, t_perturb, seed
+            See sim. t_perturb refers to the time step in the whole signal.
+
+        stimulus_chunks : iterable of (t_chunk, N_inputs) numpy.ndarray
+            External input signal in chunks. Chunks may also be (inputs,
+            targets) tuples, in which case targets are ignored.
+
+        **kwargs
+            Other parameters of sim (activation, threshold, add_perturb)
+
+        Yields
+        ------
+        x : (t_chunk, N) numpy.ndarray
+            Reservoir states of the chunk
+    """
+
+    rng = get_rng(seed)
+    add_perturb = kwargs.pop('add_perturb', False)
+
+    offset = 0
+    x_last, u_last = None, None
+    for stimulus in stimulus_chunks:
+        if isinstance(stimulus, tuple): stimulus = stimulus[0]
+
+        if x_last is None:
+            # first chunk: states start at the initial conditions
+            x = sim(w_in, w, stimulus, ic=ic, seed=rng, t_perturb=t_perturb,
+                    add_perturb=add_perturb and (t_perturb < len(stimulus)), **kwargs)
+
+        else:
+            # the first state of the chunk is driven by the last state and
+            # input of the previous chunk
+            t_local = t_perturb - offset + 1
+            x = sim(w_in, w, np.vstack((u_last, stimulus)), ic=x_last, seed=rng, t_perturb=t_local,
+                    add_perturb=add_perturb and (1 <= t_local <= len(stimulus)), **kwargs)[1:]
+
+        x_last, u_last = x[-1], stimulus[-1:]
+        offset += len(x)
+
+        yield x
+
+
+def run_sim(w_in, w, inputs, alphas=None, seed=None, **kwargs):
     """
         Simulates the dynamics of the network for a range of alpha values.
 
@@ -115,6 +205,9 @@ def run_sim(w_in, w, inputs, alphas=None, **kwargs):
             List of alpha values to scale the connectivity matrix
             (equivalent to the spectral radii)
 
+        seed : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Seed from which an independent stream is spawned for every alpha
+
         Returns
         -------
         x : (n_alphas, t, N) numpy.darray
@@ -127,10 +220,11 @@ def run_sim(w_in, w, inputs, alphas=None, **kwargs):
     if alphas is None: alphas = [1.0]
 
     res_states = []
-    for alpha in alphas:
+    for alpha, seed_alpha in zip(alphas, spawn(seed, len(alphas))):
             x = sim(w_in=w_in,
                     w=alpha*w.copy(),
                     stimulus=inputs,
+                    seed=seed_alpha,
                     **kwargs
                     )
 
@@ -5,14 +5,10 @@ Created on Thu Feb 01 13:47:40 2018
 @author: labuser
 """
 
-import os
-import random
 import time
 import numpy as np
-from scipy.linalg import eigh
 
-from tvb.simulator import (simulator, models, coupling, integrators, monitors, noise)
-from tvb.datatypes import (connectivity, surfaces, equations, patterns, region_mapping, sensors, cortex, local_connectivity, time_series)
+# TVB takes seconds to import: every function imports the TVB modules it uses
 
 
 def get_connectome(path, scaling_mode=None, eigen_scaling=True, alpha=1.0, normalize_weights=True):
@@ -31,6 +27,8 @@ def get_connectome(path, scaling_mode=None, eigen_scaling=True, alpha=1.0, norma
         -------
 
     """
+    from scipy.linalg import eigh
+    from tvb.datatypes import connectivity
 
 
     def eigen_scale(connectome, alpha):
@@ -85,6 +83,7 @@ def get_stimulus(connectome, input_nodes, inputs, intensity=1.0):
         -------
 
     """
+    from tvb.datatypes import (equations, patterns)
 
     # function that creates a (spatio-temporal) stimulation pattern
     def create_stimuli(n_nodes, node_idx, node_weights, **params):
@@ -118,6 +117,7 @@ def get_stimulus(connectome, input_nodes, inputs, intensity=1.0):
 
 
 def get_NMM(nmm, **nmm_params):
+    from tvb.simulator import models
 
     if nmm == '2d_oscillator':
         model = models.oscillator.Generic2dOscillator(**nmm_params)
@@ -148,6 +148,7 @@ def run_sim(connectome, model, coupling, integrator, monitors, stimulus=None, si
         -------
 
     """
+    from tvb.simulator import simulator
 
     #create simulator object
     sim = simulator.Simulator(model = model,
@@ -177,6 +178,7 @@ def run_sim(connectome, model, coupling, integrator, monitors, stimulus=None, si
 
 
 def call_run_sim(connectome, input_nodes, inputs, global_params, integrator_params, **nmm_params):
+    from tvb.simulator import (coupling, integrators, monitors)
 
 
     # # neural mass model
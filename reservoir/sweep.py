@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable experiment grid runner.
+
+Expands a grid of networks x null models x samples x tasks x alphas x coding
+methods, schedules it on a local process pool and checkpoints every finished
+cell to a parquet results directory.
+"""
+import os
+import json
+import zlib
+import hashlib
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from . import profiling
+from .network import nulls
+from .simulator import sim_lnm
+from .tasks import (io, tasks, coding, store)
+from .rng import spawn
+
+# task used by the readout for every io dataset
+CODING_TASK = {'sgnl_recon': 'mem_cap',
+               'pttn_recog': 'pttn_recog'
+               }
+
+# columns that identify a cell of the grid
+CELL_KEYS = ['network', 'null_model', 'sample', 'task', 'task_ref', 'alpha', 'method']
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# GRID
+# ----------------------------------------------------------------------------------------------------------------------
+def expand_grid(networks, null_models=None, n_samples=1, task_list=None, alphas=None, methods=None):
+    """
+        Expands the experimental grid into a list of cells.
+
+        Parameters
+        ----------
+        networks : list of str
+            Names of the empirical networks
+
+        null_models : list of str
+            Null model types accepted by nulls.construct_null_model. The
+            empirical network itself is 'empirical'.
+
+        n_samples : int
+            Number of independent realizations (null networks and io data)
+            per network and null model
+
+        task_list : list of (task, task_ref) tuples
+            io datasets as accepted by io.get_io_data
+
+        alphas : list of float
+            Alpha values (spectral radii)
+
+        methods : list of str
+            Coding methods accepted by coding.encoder
+
+        Returns
+        -------
+        cells : list of dict
+            One dict per cell with keys given by CELL_KEYS
+    """
+    from sklearn.model_selection import ParameterGrid
+
+    if null_models is None: null_models = ['empirical']
+    if task_list is None: task_list = [('sgnl_recon', 'T1')]
+    if alphas is None: alphas = tasks.get_default_alpha_values()
+    if methods is None: methods = ['basic']
+
+    grid = ParameterGrid({'network': list(networks),
+                          'null_model': list(null_models),
+                          'sample': list(range(n_samples)),
+                          'task': [tuple(task) for task in task_list],
+                          'alpha': [float(alpha) for alpha in alphas],
+                          'method': list(methods)
+                          })
+
+    cells = []
+    for params in grid:
+        task, task_ref = params.pop('task')
+        params.update(task=task, task_ref=task_ref)
+        cells.append({key: params[key] for key in CELL_KEYS})
+
+    return cells
+
+
+def get_cell_id(cell):
+    """
+        Returns a stable identifier (also used as file name) for a cell.
+    """
+    key = json.dumps({key: cell[key] for key in CELL_KEYS}, sort_keys=True)
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def get_seed(seed, *keys):
+    """
+        Derives an independent child SeedSequence of the base seed from a set
+        of keys, so that every upstream product is reproducible regardless of
+        which cells are still pending or of the order in which they are
+        scheduled.
+    """
+    return np.random.SeedSequence(seed, spawn_key=(zlib.crc32(json.dumps(keys).encode()),))
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# CHECKPOINTS
+# ----------------------------------------------------------------------------------------------------------------------
+def check_parquet_engine():
+    """
+        Cells are checkpointed as parquet files, which pandas writes with
+        pyarrow or fastparquet. Fails before any cell is run if neither is
+        installed.
+    """
+
+    for engine in ['pyarrow', 'fastparquet']:
+        if importlib.util.find_spec(engine) is not None: return engine
+
+    raise ImportError('Checkpoints are saved as parquet files, which requires pyarrow or fastparquet '
+                      '(e.g., pip install pyarrow)')
+
+
+def get_completed_cells(out_dir):
+
+    if not os.path.isdir(out_dir): return set()
+
+    return set(f[:-len('.parquet')] for f in os.listdir(out_dir) if f.endswith('.parquet'))
+
+
+def save_cell(df, out_dir, cell):
+    """
+        Writes the results of a cell atomically: the temporary file is hidden
+        so it is never picked up as a finished cell.
+    """
+    cell_id = get_cell_id(cell)
+
+    tmp_file = os.path.join(out_dir, f'.{cell_id}.parquet.tmp')
+    df.to_parquet(tmp_file, index=False)
+    os.replace(tmp_file, os.path.join(out_dir, f'{cell_id}.parquet'))
+
+
+def load_results(out_dir):
+
+    files = sorted(f for f in os.listdir(out_dir) if f.endswith('.parquet'))
+    if len(files) == 0: return pd.DataFrame(columns=CELL_KEYS)
+
+    return pd.concat([pd.read_parquet(os.path.join(out_dir, f)) for f in files],
+                     ignore_index=True)
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# UPSTREAM PRODUCTS
+# ----------------------------------------------------------------------------------------------------------------------
+def get_network(conn, null_model='empirical', seed=None, **kwargs):
+    """
+        Returns the empirical network or a null network built from it, scaled
+        to have unit spectral radius.
+    """
+    from scipy.linalg import eigh
+
+    if null_model == 'empirical':
+        w = conn.copy()
+    else:
+        w = nulls.construct_null_model(null_model, conn=conn, seed=seed, **kwargs)
+        if w.ndim == 3: w = w[:, :, 0]
+
+    ew, _ = eigh(w)
+
+    return w/np.max(ew)
+
+
+def simulate(w, inputs, input_nodes, alphas, factor=1.0, seeds=None, **kwargs):
+    """
+        Simulates train and test inputs for all alphas.
+
+        Parameters
+        ----------
+        seeds : list
+            One seed per alpha. Train and test simulations use independent
+            child streams of it.
+
+        Returns
+        -------
+        states : dict
+            {alpha: (x_train, x_test)} with the (t, N) train and test states.
+            Kept as a pair since both sets need not have the same length
+            (e.g., pttn_recog with an odd number of repeats).
+    """
+
+    if seeds is None: seeds = [None]*len(alphas)
+
+    x_train, x_test = [np.asarray(x)[:, np.newaxis] if np.ndim(x) == 1 else np.asarray(x) for x in inputs]
+
+    w_in = sim_lnm.get_input_conn(x_train.shape[1], len(w), input_nodes, factor)
+
+    states = {}
+    for alpha, seed in zip(alphas, seeds):
+        seed_train, seed_test = spawn(seed, 2)
+        states_train = sim_lnm.run_sim(w_in, w, x_train, alphas=[alpha], seed=seed_train, **kwargs)
+        states_test  = sim_lnm.run_sim(w_in, w, x_test, alphas=[alpha], seed=seed_test, **kwargs)
+
+        states[alpha] = (states_train[0], states_test[0])
+
+    return states
+
+
+def get_io_data(task, task_ref, sample, seed=0, store_dir=None, **kwargs):
+    """
+        io dataset of a sample. The same dataset is shared by all networks and
+        null models, so they are compared on the same inputs.
+    """
+
+    seed = get_seed(seed, sample, task, task_ref)
+
+    if store_dir is None:
+        return io.get_io_data(task, task_ref, seed=seed, **kwargs)
+
+    return store.get_io_data(store_dir, task, task_ref, seed, **kwargs)
+
+
+def run_group(cells, network, out_dir, factor=1.0, null_kwargs=None, io_kwargs=None, sim_kwargs=None, coding_kwargs=None, seed=0, store_dir=None):
+    """
+        Runs all the cells that share the same network, null model and sample.
+        The (null) network is built once and every io dataset is simulated once
+        for all the pending alphas; all coding methods then read from the same
+        reservoir states.
+
+        Parameters
+        ----------
+        cells : list of dict
+            Cells of a single (network, null_model, sample) group
+
+        network : dict
+            {'conn': (N, N) numpy.ndarray, 'input_nodes': array-like,
+             'readout_modules': (N,) numpy.ndarray}
+
+        store_dir : str
+            If given, io datasets are memory mapped from this dataset store
+            (see tasks.store) instead of being generated in the worker.
+    """
+
+    if null_kwargs is None: null_kwargs = {}
+    if io_kwargs is None: io_kwargs = {}
+    if sim_kwargs is None: sim_kwargs = {}
+    if coding_kwargs is None: coding_kwargs = {}
+
+    network_name, null_model, sample = [cells[0][key] for key in ('network', 'null_model', 'sample')]
+
+    w = get_network(network['conn'],
+                    null_model,
+                    seed=get_seed(seed, network_name, null_model, sample),
+                    **null_kwargs.get(null_model, {})
+                    )
+
+    # group cells by io dataset
+    datasets = {}
+    for cell in cells:
+        datasets.setdefault((cell['task'], cell['task_ref']), []).append(cell)
+
+    for (task, task_ref), task_cells in datasets.items():
+
+        kwargs = io_kwargs.get(task, {})
+        inputs, target = get_io_data(task, task_ref, sample, seed, store_dir, **kwargs)
+
+        key = (network_name, null_model, sample, task, task_ref)
+
+        kwargs_coding = dict(coding_kwargs)
+        if task == 'pttn_recog':
+            time_len = kwargs.get('time_len', 50)
+            kwargs_coding['time_lens'] = time_len*np.ones(len(target[1])//time_len, dtype=int)
+
+        alphas = sorted(set(cell['alpha'] for cell in task_cells))
+        states = simulate(w,
+                          inputs,
+                          network['input_nodes'],
+                          alphas,
+                          factor,
+                          seeds=[get_seed(seed, *key, alpha) for alpha in alphas],
+                          **sim_kwargs
+                          )
+
+        for cell in task_cells:
+
+            df = coding.encoder(method=cell['method'],
+                                task=CODING_TASK[task],
+                                target=target,
+                                reservoir_states=[states[cell['alpha']]],
+                                readout_modules=network['readout_modules'],
+                                alphas=[cell['alpha']],
+                                **kwargs_coding
+                                )
+
+            for key in CELL_KEYS: df[key] = cell[key]
+            save_cell(df, out_dir, cell)
+
+    return len(cells)
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# ORCHESTRATOR
+# ----------------------------------------------------------------------------------------------------------------------
+def run_experiment(networks, out_dir, null_models=None, n_samples=1, task_list=None, alphas=None, methods=None, \
+                   factor=1.0, null_kwargs=None, io_kwargs=None, sim_kwargs=None, coding_kwargs=None, n_jobs=1, seed=0, \
+                   store_dir=None):
+    """
+        Expands the experimental grid, skips the cells already checkpointed in
+        out_dir and runs the remaining ones on a local process pool. Cells are
+        scheduled in groups sharing the same (null) network so that upstream
+        products are computed once per group.
+
+        Parameters
+        ----------
+        networks : dict
+            {name: {'conn': (N, N) numpy.ndarray,
+                    'input_nodes': array-like,
+                    'readout_modules': (N,) numpy.ndarray}}
+
+        out_dir : str
+            Directory where every finished cell is saved as a parquet file
+
+        null_models, n_samples, task_list, alphas, methods
+            Grid axes. See expand_grid.
+
+        factor : float
+            Input scaling factor
+
+        null_kwargs : dict
+            {null_model: kwargs} passed to nulls.construct_null_model
+
+        io_kwargs : dict
+            {task: kwargs} passed to io.get_io_data
+
+        sim_kwargs, coding_kwargs : dict
+            Passed to sim_lnm.run_sim and coding.encoder respectively
+
+        n_jobs : int
+            Number of worker processes. If None, all the available cpus are
+            used.
+
+        seed : int
+            Base seed. Every null network, io dataset and simulation derives
+            its own independent stream from it.
+
+        store_dir : str
+            Directory of a dataset store (see tasks.store). If given, the io
+            datasets are materialized there once, before the workers start,
+            and every worker memory maps them read-only.
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            All the results in out_dir
+    """
+
+    check_parquet_engine()
+    os.makedirs(out_dir, exist_ok=True)
+
+    cells = expand_grid(networks, null_models, n_samples, task_list, alphas, methods)
+    completed = get_completed_cells(out_dir)
+
+    groups = {}
+    for cell in cells:
+        if get_cell_id(cell) in completed: continue
+        groups.setdefault((cell['network'], cell['null_model'], cell['sample']), []).append(cell)
+
+    profiling.progress('run_experiment.completed', n_completed=len(cells)-sum(len(g) for g in groups.values()), n_cells=len(cells))
+
+    if store_dir is not None:
+        for sample, task, task_ref in sorted(set((c['sample'], c['task'], c['task_ref']) for g in groups.values() for c in g)):
+            store.materialize(store_dir, task, task_ref, get_seed(seed, sample, task, task_ref), **(io_kwargs or {}).get(task, {}))
+
+    jobs = [dict(cells=group,
+                 network=networks[group[0]['network']],
+                 out_dir=out_dir,
+                 factor=factor,
+                 null_kwargs=null_kwargs,
+                 io_kwargs=io_kwargs,
+                 sim_kwargs=sim_kwargs,
+                 coding_kwargs=coding_kwargs,
+                 seed=seed,
+                 store_dir=store_dir) for group in groups.values()]
+
+    if n_jobs == 1:
+        for job in jobs: run_group(**job)
+
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(run_group, **job) for job in jobs]
+            for future in as_completed(futures): future.result()
+
+    return load_results(out_dir)
@@ -4,14 +4,19 @@ Created on Fri Mar  1 09:40:33 2019
 
 @author: Estefany Suarez
 """
+from functools import partial
+
 import numpy as np
 import pandas as pd
 
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
-
+from .. import profiling
+from ..rng import get_rng
 from . import tasks
 
+# number of time steps of the reservoir states read at a time by the
+# avg- and pca-based coding modes
+STREAM_BATCH_SIZE = 1000
+
 
 #%% --------------------------------------------------------------------------------------------------------------------
 # GENERAL METHODS
@@ -19,8 +24,8 @@ from . import tasks
 def encoder(method='basic', **kwargs):
 
     if method == 'basic': scores = basic_encoder(**kwargs)
-    # elif method == 'avg': scores = avg_based_encoder(**kwargs)
-    # elif method == 'pca': scores = pca_based_encoder(**kwargs)
+    elif method == 'avg': scores = avg_based_encoder(**kwargs)
+    elif method == 'pca': scores = pca_based_encoder(**kwargs)
 
     return scores
 
@@ -28,8 +33,8 @@ def encoder(method='basic', **kwargs):
 def decoder(method='basic', **kwargs):
 
     if method == 'basic': scores = basic_decoder(**kwargs)
-    # elif method == 'avg': scores = avg_based_decoder(**kwargs)
-    # elif method == 'pca': scores = pca_based_decoder(**kwargs)
+    elif method == 'avg': scores = avg_based_decoder(**kwargs)
+    elif method == 'pca': scores = pca_based_decoder(**kwargs)
 
     return scores
 
@@ -48,16 +53,18 @@ def coding(task, target, reservoir_states, readout_nodes=None, **kwargs):
                                              )
 
     # get max capacity and performance per alpha value
-    performance, capacity = tasks.get_scores_per_alpha(task=task,
-                                                       performance=res,
-                                                       task_params=task_params,
-                                                       **kwargs
-                                                       )
+    with profiling.stage('get_scores_per_alpha'):
+        performance, capacity = tasks.get_scores_per_alpha(task=task,
+                                                           performance=res,
+                                                           task_params=task_params,
+                                                           **kwargs
+                                                           )
 
-    df_res = pd.DataFrame(data=np.column_stack((alpha, performance, capacity)),
-                          columns=['alpha', 'performance', 'capacity'])
+    with profiling.stage('coding.dataframe'):
+        df_res = pd.DataFrame(data=np.column_stack((alpha, performance, capacity)),
+                              columns=['alpha', 'performance', 'capacity'])
 
-    df_res['n_nodes'] = len(readout_nodes)
+        df_res['n_nodes'] = len(readout_nodes) if readout_nodes is not None else reservoir_states[0][0].shape[-1]
 
     return df_res
 
@@ -82,18 +89,19 @@ def basic_encoder(task, target, reservoir_states, readout_modules=None, **kwargs
 
         encoding = []
         for module in module_ids:
-            print(f'--------------------------- Module : {module} ------------------------------')
+            profiling.progress('encoder.module', module=module)
 
             # get set of output nodes
             readout_nodes = np.where(readout_modules == module)[0]
 
             # create temporal dataframe
-            tmp_df = coding(task=task,
-                            target=target,
-                            reservoir_states=reservoir_states,
-                            readout_nodes=readout_nodes,
-                            **kwargs
-                            )
+            with profiling.labels(module=module):
+                tmp_df = coding(task=task,
+                                target=target,
+                                reservoir_states=reservoir_states,
+                                readout_nodes=readout_nodes,
+                                **kwargs
+                                )
 
             tmp_df['module'] = module
 
@@ -106,17 +114,23 @@ def basic_encoder(task, target, reservoir_states, readout_modules=None, **kwargs
 
 
 def basic_decoder(task, target, reservoir_states, readout_modules, bin_conn, \
-                  exclude_within_nodes=True, **kwargs):
+                  exclude_within_nodes=True, seed=None, reduce=None, **kwargs):
     """
         Given the reservoir_states of the network and the target signal
         for a given task, this method returns the decoding capacity for a given
-        set of readout_modules.
+        set of readout_modules. seed (None, int, SeedSequence or Generator)
+        controls the random draws of readout nodes. If reduce is given, the
+        readout is trained on reduce(readout_nodes) (list of reduced states
+        per alpha, see reduce_states) instead of the states of the readout
+        nodes.
     """
+    rng = get_rng(seed)
+
     module_ids = np.unique(readout_modules)
 
     decoding = []
     for module in module_ids:
-        print(f'--------------------------- Module : {module} ------------------------------')
+        profiling.progress('decoder.module', module=module)
 
         nodes_within  = np.where(readout_modules == module)[0]
         nodes_outside = np.where(readout_modules != module)[0]
@@ -148,28 +162,40 @@ def basic_decoder(task, target, reservoir_states, readout_modules, bin_conn, \
             for i in range(100):
 
                 if i % 20 == 0:
-                    print(f'\t---------- iter No. {i} ----------')
+                    profiling.progress('decoder.iter', module=module, iter=i)
 
                 # get set of output nodes
-                readout_nodes = []
-                for num_nodes, mapp in zip(new_conn_profile, unique_mapps):
-                    tmp_set_mapp = np.logical_and((readout_modules == mapp), (bin_conn_profile_module == 1))
-                    if exclude_within_nodes: tmp_set_mapp[nodes_within] = False
-                    readout_nodes.extend(np.random.choice(np.where(tmp_set_mapp)[0], num_nodes, replace=False))
-
-                tmp_df = coding(task=task,
-                                target=target,
-                                reservoir_states=reservoir_states,
-                                readout_nodes=readout_nodes,
-                                **kwargs
-                                )
+                with profiling.stage('basic_decoder.select_nodes', module=module):
+                    readout_nodes = []
+                    for num_nodes, mapp in zip(new_conn_profile, unique_mapps):
+                        tmp_set_mapp = np.logical_and((readout_modules == mapp), (bin_conn_profile_module == 1))
+                        if exclude_within_nodes: tmp_set_mapp[nodes_within] = False
+                        readout_nodes.extend(rng.choice(np.where(tmp_set_mapp)[0], num_nodes, replace=False))
+
+                with profiling.labels(module=module):
+                    if reduce is None:
+                        tmp_df = coding(task=task,
+                                        target=target,
+                                        reservoir_states=reservoir_states,
+                                        readout_nodes=readout_nodes,
+                                        **kwargs
+                                        )
+
+                    else:
+                        tmp_df = coding(task=task,
+                                        target=target,
+                                        reservoir_states=reduce(readout_nodes),
+                                        **kwargs
+                                        )
+                        tmp_df['n_nodes'] = len(readout_nodes)
 
                 tmp.append(tmp_df.values)
 
-            tmp_df = pd.DataFrame(data=np.dstack(tmp).mean(axis=2),
-                                  columns=['alpha', 'performance', 'capacity', 'n_nodes']
-                                  )
-            tmp_df['module'] = module
+            with profiling.stage('coding.dataframe', module=module):
+                tmp_df = pd.DataFrame(data=np.dstack(tmp).mean(axis=2),
+                                      columns=['alpha', 'performance', 'capacity', 'n_nodes']
+                                      )
+                tmp_df['module'] = module
 
             decoding.append(tmp_df)
 
@@ -178,7 +204,209 @@ def basic_decoder(task, target, reservoir_states, readout_modules, bin_conn, \
 
     df_decoding = pd.concat(decoding)
 
-    print(df_decoding.head)
+    return df_decoding
+
 
+#%% --------------------------------------------------------------------------------------------------------------------
+# AVERAGE- AND PCA-BASED CODING MODES
+# ----------------------------------------------------------------------------------------------------------------------
+def iter_time_chunks(n_steps, batch_size=STREAM_BATCH_SIZE):
+    """
+        Slices of (about) batch_size consecutive time steps covering n_steps.
+        Chunks are never shorter than batch_size (unless n_steps is).
+    """
 
-    return df_decoding
+    for chunk in np.array_split(np.arange(n_steps), max(1, n_steps // batch_size)):
+        yield slice(chunk[0], chunk[-1]+1)
+
+
+def get_avg_features(x, nodes, batch_size=STREAM_BATCH_SIZE):
+    """
+        Average state of nodes.
+
+        Parameters
+        ----------
+        x : (n_sets, t, N) numpy.ndarray or numpy.memmap
+            Reservoir states (e.g., training and test sets). Sets of different
+            lengths are given as a sequence of (t, N) arrays.
+
+        nodes : (n_nodes,) numpy.ndarray
+            Nodes of the module
+
+        Returns
+        -------
+        features : (n_sets, t, 1) numpy.ndarray
+            Same floating dtype as the states. A list of (t, 1) arrays if x
+            is a sequence.
+    """
+
+    features = []
+    for x_set in x:
+        set_features = np.zeros((len(x_set), 1), dtype=np.result_type(x_set.dtype, np.float32))
+        for chunk in iter_time_chunks(len(x_set), batch_size):
+            set_features[chunk, 0] = np.mean(x_set[chunk][:, nodes], axis=-1)
+
+        features.append(set_features)
+
+    return np.stack(features) if isinstance(x, np.ndarray) else features
+
+
+def get_pca_features(x, nodes, n_components=1, batch_size=STREAM_BATCH_SIZE, standardize=False):
+    """
+        First n_components principal components of the states of nodes.
+        Principal axes are fitted to the training set (x[0]) only, with an
+        incremental PCA that reads batch_size time steps at a time, so
+        memory-mapped states are never loaded whole. If standardize, states
+        are first z-scored with the (also streamed) mean and standard
+        deviation of the training set.
+
+        Parameters
+        ----------
+        x : (n_sets, t, N) numpy.ndarray or numpy.memmap
+            Reservoir states. x[0] is the training set. Sets of different
+            lengths are given as a sequence of (t, N) arrays.
+
+        nodes : (n_nodes,) numpy.ndarray
+            Nodes of the module
+
+        n_components : int
+            Number of principal components (at most n_nodes)
+
+        Returns
+        -------
+        features : (n_sets, t, n_components) numpy.ndarray
+            Same floating dtype as the states. A list of (t, n_components)
+            arrays if x is a sequence.
+    """
+    from sklearn.decomposition import IncrementalPCA
+    from sklearn.preprocessing import StandardScaler
+
+    n_components = min(n_components, len(nodes))
+    batch_size = max(batch_size, n_components)
+
+    def read(x_set, chunk):
+        return x_set[chunk][:, nodes]
+
+    if standardize:
+        scaler = StandardScaler()
+        for chunk in iter_time_chunks(len(x[0]), batch_size): scaler.partial_fit(read(x[0], chunk))
+        transform = scaler.transform
+    else:
+        transform = lambda chunk_states: chunk_states
+
+    pca = IncrementalPCA(n_components=n_components)
+    for chunk in iter_time_chunks(len(x[0]), batch_size): pca.partial_fit(transform(read(x[0], chunk)))
+
+    features = []
+    for x_set in x:
+        set_features = np.zeros((len(x_set), n_components), dtype=np.result_type(x_set.dtype, np.float32))
+        for chunk in iter_time_chunks(len(x_set), batch_size):
+            set_features[chunk] = pca.transform(transform(read(x_set, chunk)))
+
+        features.append(set_features)
+
+    return np.stack(features) if isinstance(x, np.ndarray) else features
+
+
+def reduce_states(reservoir_states, nodes, method='avg', n_components=1, batch_size=STREAM_BATCH_SIZE, standardize=False):
+    """
+        Reduces the states of nodes to their average ('avg') or to their
+        first n_components principal components ('pca').
+
+        Returns
+        -------
+        reduced_states : list of (n_sets, t, n_features) numpy.ndarray
+            One per alpha value (a list of (t, n_features) arrays per alpha if
+            its sets have different lengths)
+    """
+
+    nodes = np.asarray(nodes)
+
+    reduced_states = []
+    for x in reservoir_states:
+        with profiling.stage(f'reduce_states.{method}', n_nodes=len(nodes)):
+            if method == 'avg':
+                reduced_states.append(get_avg_features(x, nodes, batch_size))
+
+            elif method == 'pca':
+                reduced_states.append(get_pca_features(x, nodes, n_components, batch_size, standardize))
+
+            else:
+                raise ValueError(f'Unknown reduction method: {method}')
+
+    return reduced_states
+
+
+def reduced_encoder(method, task, target, reservoir_states, readout_modules=None, n_components=1, \
+                    batch_size=STREAM_BATCH_SIZE, standardize=False, **kwargs):
+    """
+        Encoding capacity of every module in readout_modules (of all the
+        nodes if None), with the readout trained on the reduced states of the
+        module (see reduce_states) instead of the states of all its nodes.
+        n_nodes is the number of nodes of the module.
+    """
+
+    n_nodes = reservoir_states[0][0].shape[-1]
+    if readout_modules is None: modules = {None: np.arange(n_nodes)}
+    else: modules = {module: np.where(readout_modules == module)[0] for module in np.unique(readout_modules)}
+
+    encoding = []
+    for module, nodes in modules.items():
+        profiling.progress('encoder.module', module=module)
+
+        with profiling.labels(module=module):
+            states = reduce_states(reservoir_states, nodes, method, n_components, batch_size, standardize)
+
+            tmp_df = coding(task=task,
+                            target=target,
+                            reservoir_states=states,
+                            **kwargs
+                            )
+
+        tmp_df['n_nodes'] = len(nodes)
+        if module is not None: tmp_df['module'] = module
+
+        encoding.append(tmp_df)
+
+    return pd.concat(encoding)
+
+
+def avg_based_encoder(task, target, reservoir_states, readout_modules=None, **kwargs):
+    """
+        Encoding capacity of every module from the average state of its
+        nodes. See reduced_encoder.
+    """
+    return reduced_encoder('avg', task, target, reservoir_states, readout_modules, **kwargs)
+
+
+def pca_based_encoder(task, target, reservoir_states, readout_modules=None, n_components=1, **kwargs):
+    """
+        Encoding capacity of every module from the first n_components
+        principal components of the states of its nodes. See reduced_encoder.
+    """
+    return reduced_encoder('pca', task, target, reservoir_states, readout_modules, n_components, **kwargs)
+
+
+def avg_based_decoder(task, target, reservoir_states, readout_modules, bin_conn, batch_size=STREAM_BATCH_SIZE, **kwargs):
+    """
+        Decoding capacity of every module (see basic_decoder) from the
+        average state of the readout nodes.
+    """
+
+    reduce = partial(reduce_states, reservoir_states, method='avg', batch_size=batch_size)
+
+    return basic_decoder(task, target, reservoir_states, readout_modules, bin_conn, reduce=reduce, **kwargs)
+
+
+def pca_based_decoder(task, target, reservoir_states, readout_modules, bin_conn, n_components=1, \
+                      batch_size=STREAM_BATCH_SIZE, standardize=False, **kwargs):
+    """
+        Decoding capacity of every module (see basic_decoder) from the first
+        n_components principal components of the states of the readout
+        nodes.
+    """
+
+    reduce = partial(reduce_states, reservoir_states, method='pca', n_components=n_components,
+                     batch_size=batch_size, standardize=standardize)
+
+    return basic_decoder(task, target, reservoir_states, readout_modules, bin_conn, reduce=reduce, **kwargs)
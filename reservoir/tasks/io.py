@@ -4,12 +4,9 @@ Created on Mon Apr  8 10:50:52 2019
 
 @author: Estefany Suarez
 """
-import random
-random.seed(370)
-
-import matplotlib.colors as mcolors
 import numpy as np
-from scipy.signal import sweep_poly
+
+from ..rng import get_rng
 
 #%% --------------------------------------------------------------------------------------------------------------------
 # TASKS INPUTS/OUTPUTS
@@ -25,149 +22,223 @@ def get_io_data(task, task_ref, **kwargs):
     return inputs, outputs
 
 
-def get_sgnl_recon_IO(task_ref='T1', time_len=1000, step_len=20, bias=0.5, n_repeats=3, **kwargs):
+def get_sgnl_recon_IO(task_ref='T1', time_len=1000, step_len=20, bias=0.5, n_repeats=3, seed=None, **kwargs):
+
+    rng = get_rng(seed)
 
     if task_ref == 'T1':
-        input_train = np.random.uniform(-1, 1, (time_len))[:, np.newaxis]
-        input_test  = np.random.uniform(-1, 1, (time_len))[:, np.newaxis]
+        input_train = rng.uniform(-1, 1, (time_len))[:, np.newaxis]
+        input_test  = rng.uniform(-1, 1, (time_len))[:, np.newaxis]
 
     if task_ref == 'T2':
+        input_train = get_step_seq(n_repeats, step_len, bias, rng)
+        input_test  = get_step_seq(n_repeats, step_len, bias, rng)
 
-        def get_seq(step_duration):
-            pos_step = (bias + np.random.uniform(-0.5, 0.5, step_len))#[:, np.newaxis]
-            neg_step = (-bias + np.random.uniform(-0.5, 0.5, step_len))#[:, np.newaxis]
-            return np.hstack([pos_step, np.zeros(step_len), \
-                              neg_step, np.zeros(step_len)]
-                             )
+    return (input_train, input_test), (input_train.copy(), input_test.copy())
 
-        input_train = np.hstack([get_seq(step_len) for _ in range(n_repeats)])
-        input_test  = np.hstack([get_seq(step_len) for _ in range(n_repeats)])
 
-    return (input_train, input_test), (input_train.copy(), input_test.copy())
+def iter_sgnl_recon_IO(task_ref='T1', time_len=1000, step_len=20, bias=0.5, n_repeats=3, chunk_len=10000, seed=None, **kwargs):
+    """
+        Streaming version of get_sgnl_recon_IO. Yields a single input sequence
+        (time_len steps for 'T1', n_repeats cycles of 4*step_len steps for
+        'T2') in chunks of chunk_len steps, so sequences of any length can be
+        generated in constant memory. For 'T2', chunk_len is rounded down to a
+        whole number of cycles.
+
+        Consecutive chunks are drawn from the same stream, so passing the same
+        Generator to two calls yields the train and then the test sequence of
+        get_sgnl_recon_IO with that Generator.
+
+        Yields
+        ------
+        inputs, targets : (chunk_len, 1) numpy.ndarray
+            targets is a view of inputs (signal reconstruction)
+    """
+
+    rng = get_rng(seed)
+
+    if task_ref == 'T1':
+        for start in range(0, time_len, chunk_len):
+            inputs = rng.uniform(-1, 1, (min(chunk_len, time_len-start)))[:, np.newaxis]
+            yield inputs, inputs.view()
+
+    if task_ref == 'T2':
+        cycles_per_chunk = max(1, chunk_len//(4*step_len))
+        for start in range(0, n_repeats, cycles_per_chunk):
+            inputs = get_step_seq(min(cycles_per_chunk, n_repeats-start), step_len, bias, rng)[:, np.newaxis]
+            yield inputs, inputs.view()
+
+
+def get_step_seq(n_repeats, step_len, bias, rng=None):
+    """
+        Returns n_repeats cycles of a noisy positive step, zeros, a noisy
+        negative step and zeros, each of step_len time steps.
+    """
+
+    rng = get_rng(rng)
+
+    # same draws as generating every step one after the other
+    steps = rng.uniform(-0.5, 0.5, (n_repeats, 2, step_len))
+
+    seq = np.zeros((n_repeats, 4, step_len))
+    seq[:, 0] = bias + steps[:, 0]
+    seq[:, 2] = -bias + steps[:, 1]
 
+    return seq.ravel()
 
-def get_pattrn_rec_IO(task_ref='T2', n_input_nodes=10, gain=3, n_patterns=10, n_repeats=100, time_len=50, **kwargs):
 
-    if task_ref == 'T1': #spike trains
-        "Generates random patterns of single spikes"
-        # create original patterns and labels
-        time_lens=time_len*np.ones(n_patterns, dtype=np.int16)
-        sections = [np.sum(time_lens[:idx]) for idx in range(1,len(time_lens))]
-        patterns = np.split(np.random.randint(0, n_input_nodes, (np.sum(time_lens))),
-                            sections,
-                            axis=0)
+def get_pattrn_rec_IO(task_ref='T2', n_input_nodes=10, gain=3, n_patterns=10, n_repeats=100, time_len=50, seed=None, **kwargs):
+    """
+        Generates the inputs and targets for the pattern recognition task.
+        All samples are drawn at once with array operations.
 
-        labels = list(range(n_patterns))
+        Parameters
+        ----------
+        task_ref : {'T1', 'T2'}
+            'T1': random patterns of single spikes (one-hot inputs across
+            n_input_nodes), jittered in n_jitters time steps (default: 10% of
+            time_len) in every repeat except the first one.
+            'T2': noisy, random sinusoidal patterns with variable frequency.
 
-        # add noise to original patterns
-        def add_noisy_samples(patterns, labels, n_input_nodes, n_repeats, n_jitters=None, **kwargs):
-            noisy_patt = [*patterns]
-            new_labels = [*labels]
+        n_repeats : int
+            Number of samples per pattern. The first half goes to the
+            training set.
 
-            for _ in range(n_repeats-1):
-                new_repeat = []
-                for patt in patterns:
-                    tmp_pattern = patt.copy()
-                    if n_jitters is None: n_jitters = int(0.1*len(patt))
-                    rnd_idx = np.random.choice(len(patt), n_jitters, replace=False)
-                    tmp_pattern[rnd_idx] = np.random.randint(0, n_input_nodes, n_jitters)
-                    new_repeat.append(tmp_pattern)
+        seed : None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Seed of the random number generator (see rng.get_rng)
 
-                noisy_patt.extend(new_repeat)
-                new_labels.extend(labels)
+        Returns
+        -------
+        (x_train, x_test), (y_train, y_test) : tuples of numpy.ndarray
+            Inputs are (n_samples*time_len, n_inputs) arrays and targets are
+            (n_samples*time_len, n_patterns) arrays with 1 in the column of
+            the sample's label and -1 elsewhere.
+    """
 
-            return noisy_patt, new_labels
+    rng = get_rng(seed)
+    prototypes = get_pattrn_prototypes(task_ref, n_input_nodes, gain, n_patterns, time_len, rng)
 
-        samples, targets = add_noisy_samples(patterns=patterns,
-                                             labels=labels,
-                                             n_input_nodes=n_input_nodes,
-                                             n_repeats=n_repeats,
-                                             **kwargs)
+    return get_pattrn_rec_samples(task_ref, prototypes, n_repeats, n_input_nodes, gain, rng=rng, **kwargs)
 
-        # create inputs and outputs
-        inputs = []
-        outputs = []
-        for sample, target in zip(samples, targets):
 
-            out_seq = -1*np.ones((len(sample), n_patterns), dtype=np.int16)
-            out_seq[:, target] = 1
+def iter_pattrn_rec_IO(task_ref='T2', n_input_nodes=10, gain=3, n_patterns=10, n_repeats=100, time_len=50, batch_size=10, train_frac=0.5, seed=None, **kwargs):
+    """
+        Generator version of get_pattrn_rec_IO. Patterns are drawn once and
+        the n_repeats samples per pattern are yielded in batches of about
+        batch_size repeats each, without holding the whole dataset in memory.
+        The training repeats are decided once for the whole dataset (as in
+        get_pattrn_rec_IO) and spread evenly across the batches, together
+        with the test repeats.
 
-            in_seq = np.zeros((len(sample), n_input_nodes))#, dtype=np.int16)
-            for idx_time, val in enumerate(sample):
-                # idx_input_node = input_nodes[val]
-                in_seq[idx_time, val] = gain
+        Yields
+        ------
+        (x_train, x_test), (y_train, y_test) : tuples of numpy.ndarray
+    """
 
+    rng = get_rng(seed)
+    prototypes = get_pattrn_prototypes(task_ref, n_input_nodes, gain, n_patterns, time_len, rng)
 
-            inputs.append(in_seq)
-            outputs.append(out_seq)
+    n_train_repeats = get_n_train_repeats(task_ref, n_repeats, train_frac)
+    n_batches = -(-n_repeats // batch_size)
 
-        # split training/test sets
-        train_frac = 0.5
-        n_train_samples = int(round(n_repeats * train_frac)) * n_patterns
+    train_sizes = [len(split) for split in np.array_split(np.arange(n_train_repeats), n_batches)]
+    test_sizes = [len(split) for split in np.array_split(np.arange(n_repeats-n_train_repeats), n_batches)]
 
-        x_train = np.vstack(inputs[:n_train_samples])
-        x_test  = np.vstack(inputs[n_train_samples:])
+    for batch, (n_train, n_test) in enumerate(zip(train_sizes, test_sizes)):
+        yield get_pattrn_rec_samples(task_ref,
+                                     prototypes,
+                                     n_train+n_test,
+                                     n_input_nodes,
+                                     gain,
+                                     include_prototypes=(batch == 0),
+                                     n_train_repeats=n_train,
+                                     rng=rng,
+                                     **kwargs
+                                     )
 
-        y_train = np.vstack(outputs[:n_train_samples])
-        y_test  = np.vstack(outputs[n_train_samples:])
+
+def get_pattrn_prototypes(task_ref, n_input_nodes, gain, n_patterns, time_len, rng=None):
+    """
+        Returns the (n_patterns, time_len) original patterns: spiking input
+        node per time step for 'T1', noiseless waveform for 'T2'.
+    """
+
+    rng = get_rng(rng)
+
+    if task_ref == 'T1':
+        prototypes = rng.integers(0, n_input_nodes, (n_patterns, time_len))
 
     if task_ref == 'T2':
-        "Generates noisy, random sinusoidal patterns with variable frequency"
+        from scipy.signal import sweep_poly
 
-        coeffs = [np.random.uniform(-2, 2, size=4) for _ in range(n_patterns)]
+        coeffs = rng.uniform(-2, 2, size=(n_patterns, 4))
         t = np.linspace(0, 10, time_len)
 
-        patterns = []
-        labels = []
-        for _ in range(n_repeats):
-            for label in range(n_patterns):
-                coeff = coeffs[label]
-                poly = np.poly1d([coeff[0], coeff[1], coeff[2], coeff[3]])
-                w = gain*sweep_poly(t, poly)
-                w += np.random.normal(0, 0.1, len(w))
+        # the waveform of a pattern is the same for all its samples
+        prototypes = np.vstack([gain*sweep_poly(t, np.poly1d(coeff)) for coeff in coeffs])
+
+    return prototypes
 
-                labels.append(label)
-                patterns.append(w)
 
-        data = list(zip(patterns, labels))
+def get_n_train_repeats(task_ref, n_repeats, train_frac=0.5):
+    """
+        Number of the n_repeats samples per pattern that go to the training
+        set.
+    """
 
-        # split training/test sets
-        train_frac = 0.5
-        n_train_samples = int(train_frac*n_repeats)*n_patterns
+    if task_ref == 'T1': return int(round(n_repeats * train_frac))
+    if task_ref == 'T2': return int(train_frac*n_repeats)
 
-        train_data = data[:n_train_samples]
-        test_data = data[n_train_samples:]
 
-        # shuffle data
-        random.shuffle(train_data)
-        random.shuffle(test_data)
+def get_pattrn_rec_samples(task_ref, prototypes, n_repeats, n_input_nodes, gain, include_prototypes=True, n_jitters=None, train_frac=0.5, \
+                           n_train_repeats=None, rng=None, **kwargs):
 
-        train_patterns, train_labels = zip(*train_data)
-        test_patterns, test_labels = zip(*test_data)
+    rng = get_rng(rng)
 
-        x_train = []
-        y_train = []
-        for pattern, label in zip(train_patterns, train_labels):
-            new_label = -1*np.ones((len(pattern), n_patterns), dtype=np.int16)
-            new_label[:, label] = 1
+    if n_train_repeats is None: n_train_repeats = get_n_train_repeats(task_ref, n_repeats, train_frac)
+
+    n_patterns, time_len = prototypes.shape
+    n_samples = n_repeats*n_patterns
+    n_train_samples = n_train_repeats*n_patterns
+
+    labels = np.tile(np.arange(n_patterns), n_repeats)
+    samples = np.tile(prototypes, (n_repeats, 1))
+
+    if task_ref == 'T1':
+        # jitter n_jitters different time steps of every sample
+        if n_jitters is None: n_jitters = int(0.1*time_len)
 
-            x_train.append(pattern[:,np.newaxis])
-            y_train.append(new_label)
+        first = n_patterns if include_prototypes else 0
+        n_noisy = n_samples-first
 
-        x_test = []
-        y_test = []
-        for pattern, label in zip(test_patterns, test_labels):
-            new_label = -1*np.ones((len(pattern), n_patterns), dtype=np.int16)
-            new_label[:, label] = 1
+        rnd_idx = np.argsort(rng.random((n_noisy, time_len)), axis=1)[:, :n_jitters]
+        samples[first + np.arange(n_noisy)[:, np.newaxis], rnd_idx] = rng.integers(0, n_input_nodes, (n_noisy, n_jitters))
 
-            x_test.append(pattern[:,np.newaxis])
-            y_test.append(new_label)
+        order = np.arange(n_samples)
+
+    if task_ref == 'T2':
+        samples = samples + rng.normal(0, 0.1, samples.shape)
+
+        # shuffle training and test samples separately
+        order = np.concatenate((rng.permutation(n_train_samples),
+                                n_train_samples + rng.permutation(n_samples-n_train_samples)))
+
+    samples = samples[order]
+    labels = labels[order]
+
+    # create inputs and outputs
+    if task_ref == 'T1':
+        inputs = np.zeros((n_samples*time_len, n_input_nodes))
+        inputs[np.arange(n_samples*time_len), samples.ravel()] = gain
+
+    if task_ref == 'T2':
+        inputs = samples.reshape(-1, 1)
 
-        # concatenate data
-        x_train = np.vstack(x_train)
-        y_train = np.vstack(y_train)
+    outputs = np.where(labels[:, np.newaxis] == np.arange(n_patterns), 1, -1).astype(np.int16)
+    outputs = np.repeat(outputs, time_len, axis=0)
 
-        x_test = np.vstack(x_test)
-        y_test = np.vstack(y_test)
+    # split training/test sets
+    x_train, x_test = inputs[:n_train_samples*time_len], inputs[n_train_samples*time_len:]
+    y_train, y_test = outputs[:n_train_samples*time_len], outputs[n_train_samples*time_len:]
 
     return (x_train, x_test), (y_train, y_test)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Task-independent quality metrics of the reservoir state space.
+
+For every alpha value (and readout module) the states are summarized by
+the spectrum of their (T, N) matrix X:
+
+    kernel_rank         : numerical rank of X (states driven by different
+                          inputs: the training and test sets)
+    generalization_rank : numerical rank of the states driven by noisy
+                          versions of the same input, if given
+    effective_dim       : number of principal components needed to explain
+                          var_thres of the variance of the states
+    participation_ratio : (sum of the eigenvalues)^2 / sum of the squared
+                          eigenvalues of the state covariance
+
+The spectrum is obtained without an SVD of X: X'X and the sums of the
+columns of X are accumulated in a single pass over the states, read
+STREAM_BATCH_SIZE time steps at a time (so memory-mapped states are never
+loaded whole), and the singular values of X and of the centered X follow
+from the eigenvalues of the (N, N) Gram and covariance matrices. The Gram
+matrix of every module is a block of the Gram matrix of the network, so all
+modules share the same pass.
+"""
+import numpy as np
+import pandas as pd
+
+from .. import profiling
+from . import tasks
+from .coding import (STREAM_BATCH_SIZE, iter_time_chunks)
+
+METRICS = ['kernel_rank', 'generalization_rank', 'effective_dim', 'participation_ratio']
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# STREAMED MOMENTS
+# ----------------------------------------------------------------------------------------------------------------------
+def get_moments(x, batch_size=STREAM_BATCH_SIZE):
+    """
+        Parameters
+        ----------
+        x : (n_sets, t, N) or (t, N) numpy.ndarray or numpy.memmap
+            Reservoir states. Sets (e.g., training and test) are stacked in
+            time.
+
+        Returns
+        -------
+        moments : dict
+            'gram' : (N, N) X'X
+            'sum' : (N,) sum of every column of X
+            'n' : number of time steps
+            'eps' : machine precision of the states
+    """
+
+    if x.ndim == 2: x = x[np.newaxis]
+
+    N = x.shape[-1]
+    gram, total = np.zeros((N, N)), np.zeros(N)
+
+    for n in range(x.shape[0]):
+        for chunk in iter_time_chunks(x.shape[-2], batch_size):
+            chunk_states = np.asarray(x[n, chunk], dtype=float)
+            gram += chunk_states.T @ chunk_states
+            total += np.sum(chunk_states, axis=0)
+
+    return {'gram': gram,
+            'sum': total,
+            'n': x.shape[0]*x.shape[-2],
+            'eps': np.finfo(x.dtype).eps if np.issubdtype(x.dtype, np.floating) else np.finfo(float).eps
+            }
+
+
+def get_block(moments, nodes):
+    """
+        Moments of the states of nodes only.
+    """
+
+    return {**moments,
+            'gram': moments['gram'][np.ix_(nodes, nodes)],
+            'sum': moments['sum'][nodes]
+            }
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# METRICS
+# ----------------------------------------------------------------------------------------------------------------------
+def get_singular_values(moments):
+    """
+        Singular values of X, from the eigenvalues of X'X.
+    """
+    ew = np.linalg.eigvalsh(moments['gram'])[::-1]
+    return np.sqrt(np.clip(ew, 0, None))
+
+
+def get_covariance_eigenvalues(moments):
+    """
+        Eigenvalues of the covariance of the states, in decreasing order.
+    """
+
+    mean = moments['sum']/moments['n']
+    cov = (moments['gram'] - moments['n']*np.outer(mean, mean))/max(moments['n']-1, 1)
+
+    return np.clip(np.linalg.eigvalsh(cov)[::-1], 0, None)
+
+
+def rank(moments, tol=None):
+    """
+        Numerical rank of X: number of singular values above tol. If None,
+        tol is the threshold of numpy.linalg.matrix_rank for the precision
+        of the states, but never below the rounding noise of singular values
+        obtained from the eigenvalues of X'X (about S[0]*sqrt(N*eps) for
+        float64 eps).
+    """
+
+    S = get_singular_values(moments)
+    if len(S) == 0: return 0
+
+    if tol is None:
+        tol = S[0] * max(max(moments['n'], len(S)) * moments['eps'], np.sqrt(len(S) * np.finfo(float).eps))
+
+    return int(np.sum(S > tol))
+
+
+def effective_dim(ew, var_thres=0.95):
+    if np.sum(ew) == 0: return 0
+    return int(np.searchsorted(np.cumsum(ew)/np.sum(ew), var_thres) + 1)
+
+
+def participation_ratio(ew):
+    if np.sum(ew) == 0: return 0.0
+    return float(np.square(np.sum(ew))/np.sum(np.square(ew)))
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# GENERAL METHODS
+# ----------------------------------------------------------------------------------------------------------------------
+def state_metrics(reservoir_states, readout_modules=None, alphas=None, generalization_states=None, var_thres=0.95, \
+                  tol=None, batch_size=STREAM_BATCH_SIZE):
+    """
+        Quality metrics of the reservoir state space per alpha value (and
+        per module of readout_modules, if given).
+
+        Parameters
+        ----------
+        reservoir_states : list of (n_sets, t, N) numpy.ndarray
+            Reservoir states per alpha value (as in coding.encoder)
+
+        readout_modules : (N,) numpy.ndarray
+            Module of every node. If None, metrics are computed for all the
+            nodes.
+
+        alphas : list
+            Alpha values of reservoir_states (as in tasks.run_task)
+
+        generalization_states : list of (n_sets, t, N) numpy.ndarray
+            Reservoir states per alpha value driven by noisy versions of the
+            same input. If None, generalization_rank is NaN.
+
+        var_thres : float
+            Fraction of the variance explained by effective_dim components
+
+        tol : float
+            Threshold of the singular values for the ranks, see rank
+
+        Returns
+        -------
+        df_metrics : pandas.DataFrame
+            One row per alpha value (and module) with columns alpha, METRICS,
+            n_nodes (and module), aligned with the output of coding.coding
+    """
+
+    if alphas is None: alphas = tasks.get_default_alpha_values()
+
+    N = reservoir_states[0].shape[-1]
+    if readout_modules is None: modules = {None: np.arange(N)}
+    else: modules = {module: np.where(readout_modules == module)[0] for module in np.unique(readout_modules)}
+
+    res = []
+    for idx, x in enumerate(reservoir_states):
+        alpha = alphas[idx] if idx < len(alphas) else idx
+
+        with profiling.stage('state_metrics.moments', alpha=alpha):
+            moments = get_moments(x, batch_size)
+            if generalization_states is not None: gen_moments = get_moments(generalization_states[idx], batch_size)
+
+        for module, nodes in modules.items():
+            profiling.progress('state_metrics.module', alpha=alpha, module=module)
+
+            with profiling.stage('state_metrics.spectrum', alpha=alpha, module=module):
+                block = get_block(moments, nodes)
+                ew = get_covariance_eigenvalues(block)
+
+                row = {'alpha': alpha,
+                       'kernel_rank': rank(block, tol),
+                       'generalization_rank': rank(get_block(gen_moments, nodes), tol) if generalization_states is not None else np.nan,
+                       'effective_dim': effective_dim(ew, var_thres),
+                       'participation_ratio': participation_ratio(ew),
+                       'n_nodes': len(nodes)
+                       }
+                if module is not None: row['module'] = module
+
+            res.append(row)
+
+    return pd.DataFrame(res)
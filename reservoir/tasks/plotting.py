@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+Optional plots of the task results. Requires matplotlib and seaborn, which
+the rest of the toolbox does not import.
+"""
+import seaborn as sns
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# TASKS
+# ----------------------------------------------------------------------------------------------------------------------
+def plot_pred_vs_target(y_pred, y_test, label, ax):
+    sns.regplot(x=y_test,
+                y=y_pred,
+                label=label,
+                fit_reg=True,
+                scatter=True,
+                scatter_kws={"s": 40},
+                ci=None,
+                # linewidths=0.3,
+                # edgecolors='dimgrey',
+                ax=ax
+                )
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk store of task datasets.
+
+Every (task, task_ref, parameters, seed) dataset generated by io.get_io_data
+is materialized once as .npy files in its own directory of the store, and
+opened read-only with memory mapping afterwards. Worker processes that load
+the same dataset therefore share a single copy in the page cache instead of
+each holding a private copy.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+from . import io
+
+ARRAY_NAMES = ['x_train', 'x_test', 'y_train', 'y_test']
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# KEYS
+# ----------------------------------------------------------------------------------------------------------------------
+def get_params(task, task_ref, seed, **kwargs):
+    """
+        Returns the json-serializable parameters that identify a dataset.
+        seed must be an int or a numpy.random.SeedSequence; datasets drawn
+        with seed=None are not reproducible and cannot be stored.
+    """
+
+    if seed is None:
+        raise ValueError('A seed is required to store a dataset')
+
+    if isinstance(seed, np.random.SeedSequence):
+        seed = {'entropy': seed.entropy, 'spawn_key': list(seed.spawn_key)}
+    else:
+        seed = int(seed)
+
+    return {'task': task, 'task_ref': task_ref, 'seed': seed, 'kwargs': kwargs}
+
+
+def get_key(params):
+    params = json.dumps(params, sort_keys=True, default=repr)
+    return hashlib.md5(params.encode()).hexdigest()
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# STORE
+# ----------------------------------------------------------------------------------------------------------------------
+def materialize(store_dir, task, task_ref, seed, **kwargs):
+    """
+        Generates the dataset and saves it in the store, unless it already
+        exists.
+
+        The dataset is written into a temporary directory that is renamed
+        once complete, so concurrent workers never read a partial dataset. If
+        two workers materialize the same dataset at the same time, the first
+        rename wins and the other copy is discarded.
+
+        Returns
+        -------
+        path : str
+            Directory of the dataset
+    """
+
+    params = get_params(task, task_ref, seed, **kwargs)
+    path = os.path.join(store_dir, get_key(params))
+    if os.path.isdir(path): return path
+
+    os.makedirs(store_dir, exist_ok=True)
+
+    (x_train, x_test), (y_train, y_test) = io.get_io_data(task, task_ref, seed=seed, **kwargs)
+    arrays = dict(zip(ARRAY_NAMES, [x_train, x_test, y_train, y_test]))
+
+    tmp_path = tempfile.mkdtemp(prefix='.tmp_', dir=store_dir)
+    try:
+        files = {}
+        for name, array in arrays.items():
+            array = np.asarray(array)
+
+            # targets identical to the inputs (e.g., signal reconstruction)
+            # point to the file of the inputs instead of being saved twice
+            same_as = [other for other in files if (arrays[other].shape == array.shape) and np.array_equal(arrays[other], array)]
+            if same_as:
+                files[name] = files[same_as[0]]
+                continue
+
+            files[name] = f'{name}.npy'
+            np.save(os.path.join(tmp_path, files[name]), array)
+
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+            json.dump({'params': params, 'files': files}, f, indent=2, default=repr)
+
+        os.rename(tmp_path, path)
+
+    except OSError:
+        # another worker stored the same dataset first
+        if not os.path.isdir(path): raise
+
+    finally:
+        if os.path.isdir(tmp_path): shutil.rmtree(tmp_path)
+
+    return path
+
+
+def load(path, mmap_mode='r'):
+    """
+        Opens a stored dataset. With mmap_mode='r' (default) the arrays are
+        read-only memory maps and no data is copied into the process.
+
+        Returns
+        -------
+        (x_train, x_test), (y_train, y_test) : tuples of numpy.ndarray
+    """
+
+    with open(os.path.join(path, 'manifest.json')) as f:
+        files = json.load(f)['files']
+
+    arrays = {}
+    for name in ARRAY_NAMES:
+        if files[name] not in arrays:
+            arrays[files[name]] = np.load(os.path.join(path, files[name]), mmap_mode=mmap_mode)
+
+    x_train, x_test, y_train, y_test = [arrays[files[name]] for name in ARRAY_NAMES]
+
+    return (x_train, x_test), (y_train, y_test)
+
+
+def get_io_data(store_dir, task, task_ref, seed, mmap_mode='r', **kwargs):
+    """
+        Drop-in replacement of io.get_io_data backed by the store: the dataset
+        is generated the first time it is requested and memory mapped
+        afterwards.
+    """
+
+    path = materialize(store_dir, task, task_ref, seed, **kwargs)
+
+    return load(path, mmap_mode)
+
+
+def list_datasets(store_dir):
+    """
+        Returns {key: params} of all the datasets in the store.
+    """
+
+    datasets = {}
+    if not os.path.isdir(store_dir): return datasets
+
+    for key in sorted(os.listdir(store_dir)):
+        manifest = os.path.join(store_dir, key, 'manifest.json')
+        if key.startswith('.') or not os.path.isfile(manifest): continue
+
+        with open(manifest) as f:
+            datasets[key] = json.load(f)['params']
+
+    return datasets
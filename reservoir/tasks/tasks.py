@@ -5,42 +5,24 @@ Created on Sat Feb 16 11:46:05 2019
 @author: Estefany Suarez
 """
 
-import os
 import numpy as np
-import pandas as pd
-import scipy as sp
-import mdp
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn import metrics
-from sklearn.model_selection import ParameterGrid
-from sklearn.linear_model import Ridge, LinearRegression
-from sklearn.multioutput import MultiOutputRegressor
-from sklearn import preprocessing
+
+from .. import profiling
+
+# sklearn is imported by the readouts that use it, so that importing tasks
+# (e.g., in every worker of a sweep) stays cheap. Plots are in tasks.plotting.
 
 
 #%% --------------------------------------------------------------------------------------------------------------------
 # TASKS
 # ----------------------------------------------------------------------------------------------------------------------
-def plot_pred_vs_target(y_pred, y_test, label, ax):
-    sns.regplot(x=y_test,
-                y=y_pred,
-                label=label,
-                fit_reg=True,
-                scatter=True,
-                scatter_kws={"s": 40},
-                ci=None,
-                # linewidths=0.3,
-                # edgecolors='dimgrey',
-                ax=ax
-                )
-
-
 def run_mem_cap(X, Y, TAU=None, normalize=False, ax=None, **kwargs):
     """
     In this task, the linear readout is required to replay a delayed version of
     the input sequence s.
     """
+    from sklearn.linear_model import LinearRegression
+
     # TAU: memory capacity required by the task
     if TAU is None: TAU = get_default_task_params('mem_cap')
 
@@ -90,6 +72,9 @@ def run_mem_cap(X, Y, TAU=None, normalize=False, ax=None, **kwargs):
 
 
 def run_pttn_recog(X, Y, time_lens, normalize=False, **kwargs):
+    from sklearn import metrics
+    from sklearn.linear_model import Ridge
+    from sklearn.multioutput import MultiOutputRegressor
 
     # get train and test sets
     x_train, x_test = X
@@ -115,10 +100,10 @@ def run_pttn_recog(X, Y, time_lens, normalize=False, **kwargs):
     #lr_multi_regr = MultiOutputRegressor(LinearRegression(fit_intercept=True, normalize=False, copy_X = True))
     #y_pred = np.split(lr_multi_regr.fit(x_train, y_train).predict(x_test), np.array(pattern_lens[train_samples:-1]), axis=0)
 
-    y_test_mean = sp.array([sp.argmax(mdp.numx.atleast_2d(mdp.numx.mean(sample, axis=0))) for sample in y_test])
+    y_test_mean = np.array([np.argmax(np.atleast_2d(np.mean(sample, axis=0))) for sample in y_test])
     # print(y_test_mean)
 
-    y_pred_mean = sp.array([sp.argmax(mdp.numx.atleast_2d(mdp.numx.mean(sample, axis=0))) for sample in y_pred])
+    y_pred_mean = np.array([np.argmax(np.atleast_2d(np.mean(sample, axis=0))) for sample in y_pred])
     # print(y_pred_mean)
 
     with np.errstate(divide='ignore', invalid='ignore'):
@@ -138,31 +123,38 @@ def run_task(task, target, reservoir_states, readout_nodes, alphas=None, **kwarg
         Given a target and a set of reservoir states(corresponding to different
         values of ALPHA), this method performs multiple trials (one for each
         ALPHA) of the task specified by 'task', and returns a PERF estimate
-        across the different alpha values.
+        across the different alpha values. The states of every alpha (and the
+        target) are either a (2, t, N) array or a (train, test) pair of
+        arrays, as when the training and test sets have different lengths.
     """
 
+    # all alpha values at which the network was simulated
+    if alphas is None: alphas = get_default_alpha_values(task)
+
     # perform task for different reservoir states corresponding to different alpha values
     res = []
-    for x in reservoir_states:
+    for idx, x in enumerate(reservoir_states):
+        alpha = alphas[idx] if idx < len(alphas) else idx
 
         # define x and y
-        if readout_nodes is not None: x = x.squeeze()[:, :, readout_nodes]
-        else: x = x.squeeze()
-        y = target.squeeze()
+        with profiling.stage('run_task.slice_states', alpha=alpha):
+            if not isinstance(x, np.ndarray):
+                x = [x_set[:, readout_nodes] if readout_nodes is not None else x_set for x_set in x]
+            elif readout_nodes is not None: x = x.squeeze()[:, :, readout_nodes]
+            else: x = x.squeeze()
+            y = target.squeeze() if isinstance(target, np.ndarray) else target
 
         # perform task
-        if task == 'mem_cap':
-            perf, task_params = run_mem_cap(x, y, **kwargs)
+        with profiling.stage('run_task.fit', alpha=alpha):
+            if task == 'mem_cap':
+                perf, task_params = run_mem_cap(x, y, **kwargs)
 
-        elif task == 'pttn_recog':
-           perf = run_pttn_recog(x, y, **kwargs)
-           task_params = None
+            elif task == 'pttn_recog':
+               perf = run_pttn_recog(x, y, **kwargs)
+               task_params = None
 
         res.append(perf) # across task parameters
 
-    # all alpha values at which the network was simulated
-    if alphas is None: alphas = get_default_alpha_values(task)
-
     return res, task_params, alphas # across task parameters and alpha values
 
 
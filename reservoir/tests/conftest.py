@@ -0,0 +1,45 @@
+import numpy as np
+
+
+def get_network(N=40, density=0.3, seed=0):
+    """
+        Random weighted undirected network. A ring backbone keeps it
+        connected.
+    """
+    rs = np.random.RandomState(seed)
+    conn = np.triu(rs.rand(N, N)*(rs.rand(N, N) < density), 1)
+    conn = conn + conn.T
+
+    ring = np.arange(N)
+    conn[ring, np.roll(ring, 1)] = conn[np.roll(ring, 1), ring] = rs.rand(N)
+
+    return conn
+
+
+def get_modular_network(n_modules=3, size=15, p_within=0.6, p_between=0.1, seed=0):
+    """
+        Random weighted undirected network of n_modules modules of size
+        nodes, with a ring backbone.
+
+        Returns
+        -------
+        conn : (N, N) numpy.ndarray
+
+        class_mapping : (N,) numpy.ndarray
+            Module of every node
+    """
+    rs = np.random.RandomState(seed)
+    N = n_modules*size
+
+    classes_sorted = np.array(['VIS', 'SM', 'DMN', 'FP'][:n_modules])
+    class_mapping = np.repeat(classes_sorted, size)
+
+    same = class_mapping[:, None] == class_mapping[None, :]
+    mask = rs.rand(N, N) < np.where(same, p_within, p_between)
+    conn = np.triu(rs.rand(N, N)*mask, 1)
+
+    ring = np.arange(N)
+    conn[ring, np.roll(ring, 1)] = rs.rand(N)
+    conn = np.triu(conn + conn.T, 1)
+
+    return conn + conn.T, class_mapping
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+import networkx as nx
+from networkx.algorithms import clique
+
+from reservoir.network import cliques, network_properties
+
+from conftest import get_network
+
+
+def reference_counts(conn):
+    # per-node counts of the cliques of every size, enumerated with networkx
+    all_cliques = list(clique.enumerate_all_cliques(nx.from_numpy_array(conn)))
+
+    counts = np.zeros((len(conn), len(all_cliques[-1])), dtype=int)
+    for c in all_cliques:
+        counts[c, len(c)-1] += 1
+
+    return counts
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_count_cliques_equals_networkx(seed):
+    conn = get_network(density=0.2 + 0.1*seed, seed=seed)
+    expected = reference_counts(conn)
+
+    assert np.array_equal(cliques.count_cliques(conn), expected)
+    assert np.array_equal(cliques.count_cliques(sparse.csr_matrix(conn)), expected)
+
+
+def test_count_cliques_n_jobs():
+    conn = get_network(density=0.5)
+    assert np.array_equal(cliques.count_cliques(conn, n_jobs=2), cliques.count_cliques(conn))
+
+
+def test_get_cliques_local():
+    conn = get_network(density=0.4)
+    expected = reference_counts(conn)
+
+    v_counts, clique_names = network_properties.get_cliques_local(conn)
+
+    assert clique_names == [f'{k}-clique' for k in range(3, expected.shape[1]+1)]
+    for k, counts in zip(range(3, expected.shape[1]+1), v_counts):
+        assert np.array_equal(counts, expected[:,k-1])
+
+
+def test_get_cliques_modular():
+    conn = get_network(N=40, density=0.4)
+    classes_sorted = np.array(['VIS', 'SM', 'DMN'])
+    class_mapping = classes_sorted[np.arange(40) % 3]
+
+    degree_frequency, degree_names = network_properties.get_cliques_modular(conn, class_mapping, classes_sorted)
+
+    expected = []
+    for clase in classes_sorted:
+        idx = np.where(class_mapping == clase)[0]
+        sizes = [len(c) for c in clique.enumerate_all_cliques(nx.from_numpy_array(conn[np.ix_(idx, idx)]))]
+        expected.append(np.bincount(sizes)[1:])
+
+    max_degree = max(len(f) for f in expected)
+    assert degree_names == [f'{k}-clique' for k in range(3, max_degree+1)]
+    for f, g in zip(degree_frequency, expected):
+        assert np.array_equal(f, np.pad(g, (0, max_degree-len(g))))
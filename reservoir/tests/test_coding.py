@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from reservoir.simulator import sim_lnm
+from reservoir.tasks import coding, io
+
+
+def get_states(N=6, time_len=300, seed=0):
+    rs = np.random.RandomState(seed)
+
+    w = rs.randn(N, N)
+    w = 0.9*w/np.max(np.abs(np.linalg.eigvals(w)))
+    w_in = sim_lnm.get_input_conn(1, N, np.arange(N), factor=0.5)
+
+    (x_train, x_test), (y_train, y_test) = io.get_sgnl_recon_IO('T1', time_len=time_len, seed=seed)
+    states = np.stack((sim_lnm.sim(w_in, w, x_train), sim_lnm.sim(w_in, w, x_test)))
+
+    return states, np.stack((y_train, y_test))
+
+
+def test_avg_encoder_single_node_modules_equals_basic():
+    # the average state of a single node is the node itself: same readout fit
+    # as the unreduced encoder, in the dtype of the states
+    states, target = get_states()
+    modules = np.arange(states.shape[-1])
+
+    kwargs = dict(task='mem_cap', target=target, reservoir_states=[states], readout_modules=modules, alphas=[1.0])
+    df_basic = coding.encoder('basic', **kwargs)
+    df_avg = coding.encoder('avg', **kwargs)
+
+    assert coding.get_avg_features(states, [0]).dtype == states.dtype
+    pd.testing.assert_frame_equal(df_avg.reset_index(drop=True), df_basic.reset_index(drop=True))
+
+
+def test_decoder_reduce_none_equals_unreduced_states():
+    states, target = get_states()
+    modules = np.repeat([0, 1, 2], 2)
+    bin_conn = np.ones((6, 6), dtype=int) - np.eye(6, dtype=int)
+
+    kwargs = dict(task='mem_cap', target=target, reservoir_states=[states], readout_modules=modules, bin_conn=bin_conn,
+                  alphas=[1.0])
+    df = coding.decoder('basic', seed=0, **kwargs)
+    df_reduced = coding.basic_decoder(seed=0, reduce=lambda nodes: [states[:, :, nodes]], **kwargs)
+
+    pd.testing.assert_frame_equal(df, df_reduced)
+
+
+@pytest.mark.parametrize('n_components, rank', [(4, 4), (2, 2)])
+@pytest.mark.parametrize('standardize', [False, True])
+def test_pca_features_equal_sklearn(n_components, rank, standardize):
+    from sklearn.decomposition import PCA
+    from sklearn.preprocessing import StandardScaler
+
+    rs = np.random.RandomState(0)
+    states = rs.randn(2, 400, rank) @ rs.randn(rank, 6)
+    nodes = np.array([0, 2, 3, 5])
+
+    features = coding.get_pca_features(states, nodes, n_components, batch_size=64, standardize=standardize)
+
+    x_train = states[0][:, nodes]
+    scaler = StandardScaler().fit(x_train) if standardize else None
+    transform = scaler.transform if standardize else (lambda x: x)
+
+    pca = PCA(n_components).fit(transform(x_train))
+    for n in range(2):
+        expected = pca.transform(transform(states[n][:, nodes]))
+
+        # components are defined up to their sign
+        signs = np.sign(np.sum(features[n]*expected, axis=0))
+        assert np.allclose(features[n], expected*signs, atol=1e-6)
+
+    assert features.dtype == states.dtype
+
+
+def test_features_of_unequal_sets():
+    # training and test sets of different lengths are given as a pair
+    states, _ = get_states()
+    pair = (states[0], states[1][:-50])
+    nodes = np.array([1, 2, 4])
+
+    for features, expected in [(coding.get_avg_features(pair, nodes, batch_size=64), coding.get_avg_features(states, nodes, batch_size=64)),
+                               (coding.get_pca_features(pair, nodes, 2, batch_size=64), coding.get_pca_features(states, nodes, 2, batch_size=64))]:
+        assert [len(f) for f in features] == [len(x) for x in pair]
+        assert np.allclose(features[0], expected[0])
+        assert np.allclose(features[1], expected[1][:-50])
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from reservoir.network import ensemble
+
+from conftest import get_network
+
+
+def generate(out_dir, output='memmap', n_jobs=1):
+    return ensemble.generate(str(out_dir), 'rand_mio', n_nulls=5, seed=0, output=output, n_jobs=n_jobs,
+                             conn=get_network(N=30), swaps=1)
+
+
+def as_stack(networks):
+    return np.stack([network.toarray() if sparse.issparse(network) else network for network in networks])
+
+
+@pytest.mark.parametrize('output', ['memmap', 'edges'])
+def test_generate_n_jobs(tmp_path, output):
+    stack = as_stack(ensemble.load(generate(tmp_path / 'serial', output)))
+
+    assert np.array_equal(as_stack(ensemble.load(generate(tmp_path / 'parallel', output, n_jobs=2))), stack)
+    assert np.array_equal(as_stack(ensemble.iter_networks(str(tmp_path / 'serial'))), stack)
+    assert not any(np.array_equal(stack[0], network) for network in stack[1:])
+
+
+@pytest.mark.parametrize('output', ['memmap', 'edges'])
+def test_generate_resumes_pending(tmp_path, output, monkeypatch):
+    out_dir = generate(tmp_path, output)
+    stack = as_stack(ensemble.load(out_dir))
+
+    # interrupt: nulls 1 and 3 are not on disk
+    if output == 'memmap':
+        completed = np.load(os.path.join(out_dir, 'completed.npy'), mmap_mode='r+')
+        completed[[1, 3]] = False
+        completed.flush()
+        del completed
+
+    else:
+        for index in [1, 3]: os.remove(ensemble.get_edge_file(out_dir, index))
+
+    with pytest.raises(ValueError):
+        ensemble.load(out_dir)
+    assert len(list(ensemble.iter_networks(out_dir))) == 3
+
+    drawn = []
+    generate_null = ensemble.generate_null
+
+    def record(out_dir, index, *args, **kwargs):
+        drawn.append(index)
+        return generate_null(out_dir, index, *args, **kwargs)
+
+    monkeypatch.setattr(ensemble, 'generate_null', record)
+    generate(tmp_path, output)
+
+    assert drawn == [1, 3]
+    assert np.array_equal(as_stack(ensemble.load(out_dir)), stack)
+
+
+def test_edges_equal_memmap(tmp_path):
+    stack = ensemble.load(generate(tmp_path / 'memmap'))
+    assert np.array_equal(as_stack(ensemble.load(generate(tmp_path / 'edges', 'edges'))), stack)
+
+
+def test_generate_other_params(tmp_path):
+    generate(tmp_path)
+
+    with pytest.raises(ValueError):
+        ensemble.generate(str(tmp_path), 'rand_mio', n_nulls=5, seed=1, conn=get_network(N=30), swaps=1)
+
+
+@pytest.mark.parametrize('symmetric', [True, False])
+@pytest.mark.parametrize('to_sparse', [False, True])
+def test_edges_round_trip(tmp_path, symmetric, to_sparse):
+    rs = np.random.RandomState(0)
+    network = rs.rand(20, 20)*(rs.rand(20, 20) < 0.3)
+    if symmetric: network = network + network.T
+    diagonal = np.arange(0, 20, 3)
+    network[diagonal, diagonal] = rs.rand(len(diagonal))
+
+    os.makedirs(tmp_path / 'edges')
+    ensemble.save_edges(str(tmp_path), 0, sparse.csr_matrix(network) if to_sparse else network)
+
+    loaded = ensemble.load_edges(str(tmp_path), 0)
+    assert sparse.issparse(loaded)
+    assert np.array_equal(loaded.toarray(), network)
+
+    with np.load(ensemble.get_edge_file(str(tmp_path), 0)) as f:
+        assert bool(f['symmetric']) == symmetric
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from scipy.sparse import csgraph
+
+from reservoir.network import nulls
+
+from conftest import get_network
+
+
+def test_geometry_preserving():
+    conn = get_network(N=80, density=0.15)
+    coords = np.random.RandomState(1).rand(len(conn), 3)
+    bins = nulls.get_distance_bins(coords, n_bins=5)
+
+    new_conn = nulls.geometry_preserving(conn, coords, n_bins=5, swaps=2, max_attempts=200, seed=0)
+
+    assert np.allclose(new_conn, new_conn.T)
+    assert not np.array_equal(new_conn, conn)
+    assert np.array_equal(np.sum(new_conn != 0, axis=0), np.sum(conn != 0, axis=0))
+    assert np.array_equal(np.sort(new_conn[new_conn != 0]), np.sort(conn[conn != 0]))
+    assert np.array_equal(np.bincount(bins[conn != 0], minlength=5), np.bincount(bins[new_conn != 0], minlength=5))
+    assert csgraph.connected_components(new_conn, directed=False)[0] == 1
+
+    # most edges are rewired (some are drawn again by chance)
+    assert np.mean(new_conn[np.triu(conn, 1) != 0] == 0) > 0.6
+
+    assert np.array_equal(new_conn, nulls.geometry_preserving(conn, coords, n_bins=5, swaps=2, max_attempts=200, seed=0))
+
+
+def test_geometry_preserving_max_attempts():
+    conn = get_network(N=80, density=0.15)
+    coords = np.random.RandomState(1).rand(len(conn), 3)
+
+    # every swap gets its own max_attempts proposals
+    with pytest.warns(UserWarning, match=r'of 1164 swaps done'):
+        new_conn = nulls.geometry_preserving(conn, coords, n_bins=5, swaps=2, max_attempts=2, seed=0)
+
+    assert np.array_equal(np.sum(new_conn != 0, axis=0), np.sum(conn != 0, axis=0))
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from reservoir.tasks import io
+
+
+def concatenate_batches(batches):
+    x_train, x_test, y_train, y_test = zip(*[(*x, *y) for x, y in batches])
+    return (np.vstack(x_train), np.vstack(x_test)), (np.vstack(y_train), np.vstack(y_test))
+
+
+@pytest.mark.parametrize('task_ref', ['T1', 'T2'])
+def test_iter_pattrn_rec_single_batch(task_ref):
+    (x_train, x_test), (y_train, y_test) = io.get_pattrn_rec_IO(task_ref, n_repeats=7, time_len=20, seed=0)
+    batches = list(io.iter_pattrn_rec_IO(task_ref, n_repeats=7, time_len=20, batch_size=10, seed=0))
+
+    assert len(batches) == 1
+    (bx_train, bx_test), (by_train, by_test) = batches[0]
+    for a, b in [(x_train, bx_train), (x_test, bx_test), (y_train, by_train), (y_test, by_test)]:
+        assert np.array_equal(a, b)
+
+
+@pytest.mark.parametrize('task_ref', ['T1', 'T2'])
+@pytest.mark.parametrize('n_repeats', [11, 21, 35])
+def test_iter_pattrn_rec_split(task_ref, n_repeats):
+    n_patterns, time_len = 4, 20
+    (x_train, x_test), (y_train, y_test) = io.get_pattrn_rec_IO(task_ref, n_patterns=n_patterns, n_repeats=n_repeats,
+                                                                time_len=time_len, seed=0)
+    batches = list(io.iter_pattrn_rec_IO(task_ref, n_patterns=n_patterns, n_repeats=n_repeats, time_len=time_len,
+                                         batch_size=10, seed=0))
+
+    # every batch, including a trailing one with few repeats, has training samples
+    assert len(batches) == -(-n_repeats // 10)
+    for (bx_train, bx_test), _ in batches:
+        assert len(bx_train) > 0 and len(bx_test) > 0
+
+    (bx_train, bx_test), (by_train, by_test) = concatenate_batches(batches)
+    assert bx_train.shape == x_train.shape and bx_test.shape == x_test.shape
+    assert np.array_equal(np.sort(by_train, axis=0), np.sort(y_train, axis=0))
+    assert np.array_equal(np.sort(by_test, axis=0), np.sort(y_test, axis=0))
+
+    if task_ref == 'T1':
+        # same prototypes, first in the training set
+        assert np.array_equal(bx_train[:n_patterns*time_len], x_train[:n_patterns*time_len])
+
+
+@pytest.mark.parametrize('n_repeats', [10, 11])
+def test_pattrn_rec_T1_structure(n_repeats):
+    # as the original per-sample generation: the first repeat is the
+    # prototypes, every other sample jitters 10% of the time steps of its
+    # prototype, and round(n_repeats/2) repeats go to training
+    n_input_nodes, gain, n_patterns, time_len = 10, 3, 5, 40
+    (x_train, x_test), (y_train, y_test) = io.get_pattrn_rec_IO('T1', n_input_nodes, gain, n_patterns, n_repeats, time_len, seed=0)
+    prototypes = io.get_pattrn_prototypes('T1', n_input_nodes, gain, n_patterns, time_len, np.random.default_rng(0))
+
+    assert len(x_train) == int(round(n_repeats*0.5))*n_patterns*time_len
+    assert len(x_train) + len(x_test) == n_repeats*n_patterns*time_len
+
+    x, y = np.vstack((x_train, x_test)), np.vstack((y_train, y_test))
+    assert np.all(np.sum(x != 0, axis=1) == 1) and np.all(x[x != 0] == gain)
+    assert np.all(np.sum(y == 1, axis=1) == 1) and np.all(np.abs(y) == 1)
+
+    samples = np.argmax(x, axis=1).reshape(-1, time_len)
+    labels = np.argmax(y, axis=1).reshape(-1, time_len)[:, 0]
+
+    assert np.array_equal(labels, np.tile(np.arange(n_patterns), n_repeats))
+    assert np.array_equal(samples[:n_patterns], prototypes)
+    assert np.all(np.sum(samples[n_patterns:] != prototypes[labels[n_patterns:]], axis=1) <= int(0.1*time_len))
+
+
+def test_pattrn_rec_T2_structure():
+    # noisy waveforms of the prototypes, shuffled within the training and the
+    # test sets, int(n_repeats/2) repeats for training
+    n_patterns, n_repeats, time_len = 5, 11, 40
+    (x_train, x_test), (y_train, y_test) = io.get_pattrn_rec_IO('T2', 10, 3, n_patterns, n_repeats, time_len, seed=0)
+    prototypes = io.get_pattrn_prototypes('T2', 10, 3, n_patterns, time_len, np.random.default_rng(0))
+
+    assert len(x_train) == int(n_repeats*0.5)*n_patterns*time_len
+    assert len(x_train) + len(x_test) == n_repeats*n_patterns*time_len
+
+    for x, y in [(x_train, y_train), (x_test, y_test)]:
+        labels = np.argmax(y, axis=1).reshape(-1, time_len)[:, 0]
+        noise = x.reshape(-1, time_len) - prototypes[labels]
+
+        assert np.array_equal(np.bincount(labels), np.full(n_patterns, len(labels)//n_patterns))
+        assert np.std(noise) == pytest.approx(0.1, rel=0.1)
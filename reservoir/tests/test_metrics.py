@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from reservoir.tasks import metrics
+
+
+def get_low_rank_states(n_sets, t, N, rank, dtype, seed=0):
+    rs = np.random.RandomState(seed)
+    return (rs.randn(n_sets, t, rank) @ rs.randn(rank, N)).astype(dtype)
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('rank', [1, 7, 40])
+def test_rank_matches_matrix_rank(dtype, rank):
+    x = get_low_rank_states(2, 500, 40, rank, dtype)
+
+    moments = metrics.get_moments(x, batch_size=128)
+
+    assert metrics.rank(moments) == np.linalg.matrix_rank(x.reshape(-1, 40)) == rank
+
+
+def test_state_metrics_match_svd():
+    x = get_low_rank_states(2, 600, 30, 10, np.float64) + 1e-2*np.random.RandomState(1).randn(2, 600, 30)
+    modules = np.repeat([0, 1, 2], 10)
+
+    df = metrics.state_metrics([x], readout_modules=modules, alphas=[1.0], generalization_states=[x], batch_size=100)
+
+    for module in range(3):
+        X = x[:, :, modules == module].reshape(-1, 10)
+        ew = np.square(np.linalg.svd(X - X.mean(axis=0), compute_uv=False))/(len(X)-1)
+
+        row = df[df['module'] == module].iloc[0]
+        assert row['kernel_rank'] == row['generalization_rank'] == np.linalg.matrix_rank(X)
+        assert row['participation_ratio'] == pytest.approx(np.sum(ew)**2/np.sum(ew**2))
+        assert row['effective_dim'] == np.searchsorted(np.cumsum(ew)/np.sum(ew), 0.95) + 1
+        assert row['n_nodes'] == 10
+
+
+def test_state_metrics_memmap(tmp_path):
+    x = get_low_rank_states(2, 300, 20, 5, np.float32)
+
+    states = np.lib.format.open_memmap(tmp_path / 'states.npy', mode='w+', dtype=x.dtype, shape=x.shape)
+    states[:] = x
+    states.flush()
+
+    df = metrics.state_metrics([np.load(tmp_path / 'states.npy', mmap_mode='r'), x], alphas=[0.5, 1.0], batch_size=64)
+
+    assert list(df['alpha']) == [0.5, 1.0]
+    assert 'module' not in df
+    assert df['generalization_rank'].isna().all()
+    assert np.all(df['kernel_rank'] == 5)
+    assert np.allclose(df[metrics.METRICS[2:]].iloc[0].values, df[metrics.METRICS[2:]].iloc[1].values)
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from reservoir.network import nulls
+
+
+@pytest.mark.parametrize('n', [2, 3, 10, 101])
+def test_triu_pairs_equal_numpy(n):
+    i, j = nulls.get_triu_pairs(n, np.arange(n*(n-1)//2))
+    expected_i, expected_j = np.triu_indices(n, 1)
+
+    assert np.array_equal(i, expected_i) and np.array_equal(j, expected_j)
+
+
+def test_triu_pairs_large_n():
+    # first and last index of random rows, where rounding errors would show
+    n = 2_000_000
+    rows = np.random.RandomState(0).randint(0, n-1, 1000)
+    row_start = rows*(2*n-rows-1)//2
+    row_end = row_start + (n-rows-1) - 1
+
+    for k, j in [(row_start, rows+1), (row_end, np.full(len(rows), n-1))]:
+        i_k, j_k = nulls.get_triu_pairs(n, k)
+        assert np.array_equal(i_k, rows) and np.array_equal(j_k, j)
+
+
+@pytest.mark.parametrize('as_sparse', [False, True])
+def test_erdos_renyi_density(as_sparse):
+    n, density, n_networks = 300, 0.05, 20
+    networks = nulls.erdos_renyi(n=n, density=density, n_networks=n_networks, as_sparse=as_sparse, seed=0)
+    if as_sparse: networks = np.stack([network.toarray() for network in networks], axis=2)
+
+    n_pairs = n*(n-1)//2
+    n_edges = np.count_nonzero(networks, axis=(0, 1))/2
+
+    for b in range(n_networks):
+        assert np.array_equal(networks[:,:,b], networks[:,:,b].T)
+        assert not np.any(np.diagonal(networks[:,:,b]))
+
+    # binomial number of edges
+    assert np.mean(n_edges) == pytest.approx(density*n_pairs, abs=4*np.sqrt(density*(1-density)*n_pairs/n_networks))
+    assert np.std(n_edges) == pytest.approx(np.sqrt(density*(1-density)*n_pairs), rel=0.5)
+
+
+def test_erdos_renyi_extreme_density():
+    assert not np.any(nulls.erdos_renyi(n=50, density=0, seed=0))
+    assert np.count_nonzero(nulls.erdos_renyi(n=50, density=1, seed=0)) == 50*49
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_rewire_lattice_keeps_every_edge(seed):
+    n, k = 30, 8
+    u, v = nulls.get_ring_lattice(n, k)
+
+    # few rounds: some edges are kept unresolved
+    targets = nulls.rewire_lattice(n, u, v, [0.3, 0.9, 1.0], np.random.default_rng(seed), max_rounds=2)
+
+    for target in targets:
+        assert not np.any(target == u)
+        assert len(set(zip(np.minimum(u, target), np.maximum(u, target)))) == len(u)
+
+
+def test_watts_and_strogatz_edge_count():
+    rs = np.random.RandomState(0)
+    conn = np.triu(rs.rand(60, 60)*(rs.rand(60, 60) < 0.2), 1)
+    conn = conn + conn.T
+
+    networks = nulls.watts_and_strogatz(conn, p_conn=[0.1, 0.5, 1.0], bin=True, seed=1)
+    n_edges = len(nulls.get_ring_lattice(60, int(np.mean(np.sum(conn != 0, axis=0))))[0])
+
+    for b in range(networks.shape[2]):
+        assert np.array_equal(networks[:,:,b], networks[:,:,b].T)
+        assert np.sum(networks[:,:,b] != 0) == 2*n_edges
+
+
+@pytest.mark.parametrize('frac', [0, -0.5, 1.5])
+def test_strength_preserving_invalid_frac(frac):
+    conn = np.ones((10, 10)) - np.eye(10)
+    with pytest.raises(ValueError, match='frac'):
+        nulls.strength_preserving_rand_sa(conn, frac=frac, seed=0)
+
+    with pytest.raises(ValueError, match='frac'):
+        nulls.anneal_weights(*np.triu_indices(10, 1), np.ones(45), np.full(10, 9.0), frac=frac, rng=0)
+
+
+def test_anneal_weights_energy():
+    rs = np.random.RandomState(0)
+    N, n_edges = 20, 60
+    i, j = rs.randint(0, N, n_edges), rs.randint(0, N, n_edges)
+    i, j = i[i != j], j[i != j]
+    w, target = rs.rand(len(i)), rs.rand(N)*3
+
+    new_w, energy = nulls.anneal_weights(i, j, w, target, n_stages=5, n_iter=500, rng=0)
+
+    strengths = np.bincount(i, new_w, N) + np.bincount(j, new_w, N)
+    assert np.array_equal(np.sort(new_w), np.sort(w))
+    assert energy == pytest.approx(np.sum(np.square(strengths-target)))
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+import bct
+
+from reservoir.network import paths
+
+from conftest import get_network
+
+
+def test_distance_equals_bct():
+    conn = get_network(density=0.2)
+    D = paths.get_shortest_paths(conn, cache=False)['distance']
+
+    with np.errstate(divide='ignore'):
+        assert np.allclose(D, bct.distance_wei(1/conn)[0])
+
+
+def test_predecessors_give_shortest_paths():
+    conn = get_network(density=0.2)
+    sp = paths.get_shortest_paths(conn, cache=False)
+    L = sp['lengths'].toarray()
+
+    for source, target in [(0, 5), (3, 27), (39, 11)]:
+        path = paths.get_path(sp['predecessors'], source, target)
+        assert path[0] == source and path[-1] == target
+        assert np.isclose(np.sum(L[path[:-1], path[1:]]), sp['distance'][source, target])
+
+
+def test_cache_is_keyed_by_content():
+    paths.clear_cache()
+    conn = get_network(density=0.2)
+
+    first = paths.get_shortest_paths(conn, return_predecessors=False)
+    assert paths.get_shortest_paths(conn.copy(), return_predecessors=False) is first
+    assert 'predecessors' in paths.get_shortest_paths(conn)
+    assert paths.get_shortest_paths(sparse.csr_matrix(conn))['distance'] is not first['distance']
+
+    paths.clear_cache()
+
+
+def test_charpath_equals_bct():
+    conn = get_network(density=0.2)
+    conn[:, 0] = conn[0, :] = 0 # one isolated node: infinite distances
+    D = paths.get_shortest_paths(conn, cache=False)['distance']
+
+    char_path, efficiency = paths.charpath(D)
+
+    # infinite distances are excluded from the path length and count as zero
+    # efficiency
+    assert char_path == pytest.approx(bct.charpath(D, include_infinite=False)[0])
+    assert efficiency == pytest.approx(bct.charpath(D, include_infinite=True)[1])
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_betweenness_wei_equals_bct(seed):
+    conn = get_network(seed=seed)
+    with np.errstate(divide='ignore'):
+        expected = bct.betweenness_wei(1/conn)
+
+    L = paths.get_lengths(conn)
+    D = paths.get_shortest_paths(conn, cache=False)['distance']
+
+    assert np.allclose(paths.betweenness_wei(L), expected)
+    assert np.allclose(paths.betweenness_wei(L, D=D), expected)
+    with np.errstate(divide='ignore'):
+        assert np.allclose(paths.betweenness_wei(1/conn), expected)
+
+
+def test_betweenness_wei_ties_equal_bct():
+    # unit lengths: many shortest paths of the same length
+    conn_bin = (get_network(density=0.1) != 0).astype(int)
+    assert np.allclose(paths.betweenness_wei(paths.get_lengths(conn_bin)), bct.betweenness_bin(conn_bin))
+
+
+def test_betweenness_wei_small_batches(monkeypatch):
+    conn = get_network(density=0.2)
+    expected = paths.betweenness_wei(paths.get_lengths(conn))
+
+    monkeypatch.setattr(paths, 'MAX_BATCH_ELEMENTS', 1)
+    assert np.allclose(paths.betweenness_wei(paths.get_lengths(conn)), expected)
+
+
+def test_betweenness_wei_n_jobs():
+    conn = get_network(density=0.2)
+    L = paths.get_lengths(conn)
+    assert np.allclose(paths.betweenness_wei(L, n_jobs=2), paths.betweenness_wei(L))
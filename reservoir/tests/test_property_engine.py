@@ -0,0 +1,187 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+import bct
+from netneurotools import modularity as lmodularity
+
+from reservoir.network import network_properties, property_engine
+
+from conftest import get_network
+
+LOCAL = ['node_strength', 'node_degree', 'wei_clustering_coeff', 'bin_clustering_coeff', 'wei_centrality',
+         'bin_centrality', 'wei_participation_coeff', 'bin_participation_coeff', 'wei_diversity_coeff']
+GLOBAL = ['path_length', 'clustering', 'modularity', 'assortativity_wei', 'assortativity_bin']
+MODULAR = ['modularity', 'segregation']
+
+
+def get_partition(N=40, n_modules=4):
+    classes_sorted = np.array(['VIS', 'SM', 'DMN', 'FP'][:n_modules])
+    class_mapping = classes_sorted[np.arange(N) % n_modules]
+    return class_mapping, classes_sorted
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# REFERENCE: bct and netneurotools, as in the original network_properties
+# ----------------------------------------------------------------------------------------------------------------------
+def reference_local(conn, class_mapping):
+    N = len(conn)
+    conn_bin = conn.astype(bool).astype(int)
+
+    with np.errstate(divide='ignore'):
+        wei_centrality = bct.betweenness_wei(1/conn)/((N-1)*(N-2))
+
+    return {'node_strength': bct.strengths_und(conn),
+            'node_degree': bct.degrees_und(conn_bin),
+            'wei_clustering_coeff': bct.clustering_coef_wu(conn),
+            'bin_clustering_coeff': bct.clustering_coef_bu(conn_bin),
+            'wei_centrality': wei_centrality,
+            'bin_centrality': bct.betweenness_bin(conn_bin)/((N-1)*(N-2)),
+            'wei_participation_coeff': bct.participation_coef(conn, ci=class_mapping),
+            'bin_participation_coeff': bct.participation_coef(conn_bin, ci=class_mapping),
+            'wei_diversity_coeff': bct.diversity_coef_sign(conn, ci=class_mapping)[0],
+            }
+
+
+def reference_global(conn, class_mapping):
+    with np.errstate(divide='ignore'):
+        dist, _ = bct.distance_wei(1/conn)
+
+    return {'path_length': bct.charpath(dist, include_infinite=False)[0],
+            'clustering': bct.transitivity_wu(conn),
+            'modularity': bct.modularity_und(conn, kci=class_mapping)[1],
+            'assortativity_wei': bct.assortativity_wei(conn, flag=0),
+            'assortativity_bin': bct.assortativity_bin(conn.astype(bool).astype(int), flag=0),
+            }
+
+
+def reference_modular(conn, class_mapping, classes_sorted):
+    def segregation(clase):
+        inside, outside = np.where(class_mapping == clase)[0], np.where(class_mapping != clase)[0]
+
+        within = conn[np.ix_(inside, inside)]
+        within = within[np.tril_indices_from(within, -1)]
+        between = conn[np.ix_(inside, outside)]
+
+        z_within = (within-np.mean(within[np.nonzero(within)]))/np.std(within[np.nonzero(within)])
+        z_between = (between-np.mean(between[np.nonzero(between)]))/np.std(between[np.nonzero(between)])
+
+        return (np.mean(z_within[np.nonzero(z_within)])-np.mean(z_between[np.nonzero(z_between)]))/np.mean(z_within[np.nonzero(z_within)])
+
+    class_mapping_int = np.array([np.where(classes_sorted == mapp)[0][0] for mapp in class_mapping])
+
+    return {'modularity': lmodularity.get_modularity(conn, class_mapping_int),
+            'segregation': np.array([segregation(clase) for clase in classes_sorted]),
+            }
+
+
+def assert_properties_equal(properties, expected):
+    assert list(properties) == list(expected)
+    for prop, value in expected.items():
+        assert np.allclose(properties[prop], value), prop
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# SINGLE NETWORKS
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize('to_sparse', [False, True])
+def test_local_equals_bct(to_sparse):
+    conn = get_network()
+    class_mapping, _ = get_partition()
+    class_mapping_int = np.unique(class_mapping, return_inverse=True)[1] + 1
+
+    expected = reference_local(conn, class_mapping_int)
+    if to_sparse: conn = sparse.csr_matrix(conn)
+
+    properties = property_engine.compute(conn, LOCAL, 'local', class_mapping=class_mapping, cache=False)
+    assert_properties_equal(properties, {prop: expected[prop] for prop in LOCAL})
+
+
+@pytest.mark.parametrize('to_sparse', [False, True])
+def test_global_equals_bct(to_sparse):
+    conn = get_network()
+    class_mapping, _ = get_partition()
+    class_mapping_int = np.unique(class_mapping, return_inverse=True)[1] + 1
+
+    expected = reference_global(conn, class_mapping_int)
+    if to_sparse: conn = sparse.csr_matrix(conn)
+
+    properties = property_engine.compute(conn, GLOBAL, 'global', class_mapping=class_mapping, cache=False)
+    assert_properties_equal(properties, expected)
+
+
+@pytest.mark.parametrize('to_sparse', [False, True])
+def test_modular_equals_netneurotools(to_sparse):
+    conn = get_network()
+    class_mapping, classes_sorted = get_partition()
+
+    expected = reference_modular(conn, class_mapping, classes_sorted)
+    if to_sparse: conn = sparse.csr_matrix(conn)
+
+    properties = property_engine.compute(conn, MODULAR, 'modular', class_mapping=class_mapping,
+                                         classes_sorted=classes_sorted, cache=False)
+    assert_properties_equal(properties, expected)
+
+
+def test_cache_is_shared_and_bounded():
+    property_engine.clear_cache()
+    conn = get_network()
+    class_mapping, _ = get_partition()
+
+    first = property_engine.compute(conn, ['wei_centrality'], 'local', class_mapping=class_mapping)
+    second = property_engine.compute(conn.copy(), ['path_length'], 'global', class_mapping=class_mapping)
+    assert len(property_engine._cache) == 1
+
+    values = next(iter(property_engine._cache.values()))
+    assert 'predecessors' not in values['shortest_paths']
+    assert np.allclose(first['wei_centrality'], property_engine.compute(conn, ['wei_centrality'], 'local', cache=False)['wei_centrality'])
+    assert second['path_length'] == property_engine.compute(conn, ['path_length'], 'global', cache=False)['path_length']
+
+    property_engine.compute(get_network(seed=1), ['node_strength'], 'local')
+    assert len(property_engine._cache) == 1
+
+    property_engine.clear_cache()
+
+
+def test_unknown_property():
+    with pytest.raises(ValueError):
+        property_engine.compute(get_network(), ['node_size'], 'local', cache=False)
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# ENSEMBLES
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize('scope, property_list', [('local', LOCAL), ('global', GLOBAL)])
+def test_compute_batch_equals_compute(scope, property_list):
+    stack = np.stack([get_network(seed=seed) for seed in range(3)])
+    class_mapping, _ = get_partition()
+
+    batched = property_engine.compute_batch(stack, property_list, scope, class_mapping=class_mapping)
+    sparse_batched = property_engine.compute_batch([sparse.csr_matrix(conn) for conn in stack], property_list, scope,
+                                                   class_mapping=class_mapping)
+
+    for b, conn in enumerate(stack):
+        properties = property_engine.compute(conn, property_list, scope, class_mapping=class_mapping, cache=False)
+        for prop in property_list:
+            assert np.allclose(batched[prop][b], properties[prop]), prop
+            assert np.allclose(sparse_batched[prop][b], properties[prop]), prop
+
+
+def test_ensemble_properties():
+    networks = np.stack([get_network(seed=seed) for seed in range(5)], axis=2)
+    class_mapping, _ = get_partition()
+    cortical = np.arange(40) < 30
+
+    df_local = network_properties.get_local_ensemble_properties(networks, cortical, class_mapping, include_subctx=False,
+                                                                axis=2, batch_size=2, n_jobs=2)
+    df_global = network_properties.get_global_ensemble_properties(networks, cortical, class_mapping, axis=2, batch_size=2)
+
+    assert df_local.shape == (5*30, len(network_properties.LOCAL_PROPERTY_LIST))
+    assert df_global.shape == (5, len(network_properties.GLOBAL_PROPERTY_LIST))
+
+    for b in range(5):
+        df = network_properties.get_local_network_properties(networks[:,:,b], cortical, class_mapping, include_subctx=False)
+        assert np.allclose(df_local.loc[b].values, df.values)
+
+        properties, _ = network_properties.get_global_network_properties(networks[:,:,b], cortical, class_mapping)
+        assert np.allclose(df_global.loc[b].values, properties)
@@ -0,0 +1,159 @@
+import numpy as np
+import pytest
+from scipy.sparse import csgraph
+
+from reservoir.network import nulls, property_engine, rewiring
+
+from conftest import get_modular_network
+
+
+def is_connected(conn):
+    return csgraph.connected_components(conn != 0, directed=False)[0] == 1
+
+
+def get_modularity(conn, class_mapping):
+    return property_engine.compute(conn, ['modularity'], 'global', class_mapping=class_mapping, cache=False)['modularity']
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# METRIC TRACKER
+# ----------------------------------------------------------------------------------------------------------------------
+def test_tracker_equals_recompute():
+    rs = np.random.RandomState(0)
+    conn, class_mapping = get_modular_network()
+    tracker = rewiring.get_tracker(conn, class_mapping)
+
+    for _ in range(50):
+        u, v = rs.choice(len(conn), 2, replace=False)
+        old, new = conn[u, v], rs.rand()*(rs.rand() < 0.5)
+
+        conn[u, v] = conn[v, u] = new
+        rewiring.update(tracker, [(u, v, old, new)])
+
+    expected = rewiring.get_tracker(conn, class_mapping)
+    for key in ['strengths', 'degrees', 'blocks', 'module_strengths', 'total']:
+        assert np.allclose(tracker[key], expected[key]), key
+
+    modular = property_engine.compute(conn, ['modularity'], 'modular', class_mapping=class_mapping,
+                                      classes_sorted=tracker['modules'], cache=False)['modularity']
+    assert np.allclose(rewiring.get_modularity(tracker), modular)
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# EDGE-LIST ENGINE
+# ----------------------------------------------------------------------------------------------------------------------
+def test_stays_connected_equals_recompute():
+    rs = np.random.RandomState(1)
+    conn, _ = get_modular_network(p_within=0.15, p_between=0.02)
+    neighbors = rewiring.get_neighbor_sets(conn)
+    i, j = np.where(np.triu(conn))
+
+    n_tested = 0
+    for e1, e2 in rs.randint(len(i), size=(500, 2)):
+        a, b, c, d = i[e1], j[e1], i[e2], j[e2]
+        if len({a, b, c, d}) < 4 or (d in neighbors[a]) or (b in neighbors[c]): continue
+        if (c in neighbors[a]) or (d in neighbors[b]): continue
+
+        new_conn = conn.copy()
+        rewiring.swap_edges(new_conn, rewiring.get_neighbor_sets(conn), [(a, b), (c, d)], [(a, d), (c, b)])
+
+        assert rewiring.stays_connected(neighbors, a, b, c, d) == is_connected(new_conn)
+        n_tested += 1
+
+    assert n_tested > 0
+
+
+def test_swap_edges_roll_back():
+    conn, _ = get_modular_network()
+    new_conn = conn.copy()
+    neighbors = rewiring.get_neighbor_sets(new_conn)
+
+    i, j = np.where(np.triu(conn))
+    a, b, c, d = next((i[e1], j[e1], i[e2], j[e2]) for e1 in range(len(i)) for e2 in range(len(i))
+                      if len({i[e1], j[e1], i[e2], j[e2]}) == 4 and not (conn[i[e1], j[e2]] or conn[i[e2], j[e1]]))
+
+    rewiring.swap_edges(new_conn, neighbors, [(a, b), (c, d)], [(a, d), (c, b)])
+    assert new_conn[a, d] == new_conn[d, a] == conn[a, b] and new_conn[a, b] == 0
+    assert (d in neighbors[a]) and (b not in neighbors[a])
+
+    rewiring.swap_edges(new_conn, neighbors, [(a, d), (c, b)], [(a, b), (c, d)])
+    assert np.array_equal(new_conn, conn)
+    assert neighbors == rewiring.get_neighbor_sets(conn)
+
+
+def test_pool():
+    rng = np.random.default_rng(0)
+    pool = rewiring.get_pool(range(10))
+
+    for item in [3, 9, 0, 3]: rewiring.pool_remove(pool, item)
+    rewiring.pool_add(pool, 4)
+
+    assert sorted(pool['items']) == [1, 2, 4, 5, 6, 7, 8]
+    assert all(pool['items'][pos] == item for item, pos in pool['pos'].items())
+    assert {rewiring.pool_sample(rng, pool) for _ in range(200)} == set(pool['items'])
+
+
+#%% --------------------------------------------------------------------------------------------------------------------
+# NULLS
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize('seed', range(3))
+def test_randmio_but_unperturbed(seed):
+    conn, class_mapping = get_modular_network(seed=seed)
+    unperturbed = class_mapping == 'SM'
+
+    new_conn = nulls.randmio_but_unperturbed(conn, class_mapping, swaps=2, unperturbed='SM', seed=seed)
+
+    assert not np.array_equal(new_conn, conn)
+    assert np.array_equal(new_conn, new_conn.T)
+    assert is_connected(new_conn)
+    assert np.array_equal(np.sum(new_conn != 0, axis=0), np.sum(conn != 0, axis=0))
+    assert np.array_equal(np.sort(new_conn[new_conn != 0]), np.sort(conn[conn != 0]))
+    assert np.array_equal(new_conn[np.ix_(unperturbed, unperturbed)], conn[np.ix_(unperturbed, unperturbed)])
+
+
+# edges are swapped within weight bins (50 per module): modules need many
+# edges to other modules
+@pytest.mark.parametrize('null, sign', [(nulls.increase_modularity, 1), (nulls.decrease_modularity, -1)])
+def test_modularity_nulls(null, sign):
+    conn, class_mapping = get_modular_network(size=30, p_within=0.5, p_between=0.3)
+    norm_conn = (conn-conn.min())/(conn.max()-conn.min())
+
+    new_conn, eff, trajectory = null(conn, class_mapping, swaps=100, seed=0, track=True)
+
+    assert eff > 0
+    assert np.allclose(new_conn, new_conn.T)
+    assert is_connected(new_conn)
+    assert np.array_equal(np.sum(new_conn != 0, axis=0), np.sum(norm_conn != 0, axis=0))
+    assert np.allclose(np.sort(new_conn[new_conn != 0]), np.sort(norm_conn[norm_conn != 0]))
+    assert sign*(get_modularity(new_conn, class_mapping) - get_modularity(norm_conn, class_mapping)) > 0
+
+    # the tracked trajectory matches the metrics recomputed from the matrices
+    assert len(trajectory) == eff+1
+    assert trajectory['modularity'].iloc[0] == pytest.approx(get_modularity(norm_conn, class_mapping))
+    assert trajectory['modularity'].iloc[-1] == pytest.approx(get_modularity(new_conn, class_mapping))
+
+
+def test_modularity_nulls_track_off():
+    conn, class_mapping = get_modular_network(size=30, p_within=0.5, p_between=0.3)
+
+    tracked, eff, _ = nulls.increase_modularity(conn, class_mapping, swaps=100, seed=0, track=True)
+    untracked, untracked_eff = nulls.increase_modularity(conn, class_mapping, swaps=100, seed=0)
+
+    assert eff == untracked_eff
+    assert np.array_equal(tracked, untracked)
+
+
+@pytest.mark.parametrize('null', [nulls.increase_modularity, nulls.decrease_modularity])
+@pytest.mark.parametrize('swaps', [5, 100])
+def test_modularity_nulls_binary(null, swaps):
+    # every weight is tied: a single weight bin
+    conn, class_mapping = get_modular_network(size=30, p_within=0.5, p_between=0.3)
+    bin_conn = (conn != 0).astype(float)
+
+    new_conn, eff = null(bin_conn, class_mapping, swaps=swaps, seed=0)
+
+    assert eff > 0
+    assert np.array_equal(new_conn, new_conn.T)
+    assert is_connected(new_conn)
+    assert np.array_equal(np.unique(new_conn), [0, 1])
+    assert np.array_equal(np.sum(new_conn, axis=0), np.sum(bin_conn, axis=0))
@@ -0,0 +1,22 @@
+import numpy as np
+
+from reservoir import rng
+
+
+def test_spawn_generator_matches_seed():
+    from_int = rng.spawn(42, 3)
+    from_gen = rng.spawn(rng.get_rng(42), 3)
+    from_seq = rng.spawn(np.random.SeedSequence(42), 3)
+
+    for a, b, c in zip(from_int, from_gen, from_seq):
+        assert a.entropy == b.entropy == c.entropy
+        assert a.spawn_key == b.spawn_key == c.spawn_key
+        assert np.array_equal(rng.get_rng(a).random(5), rng.get_rng(b).random(5))
+
+
+def test_spawn_consecutive_calls_are_independent():
+    gen = rng.get_rng(0)
+    first, second = rng.spawn(gen, 2), rng.spawn(gen, 2)
+
+    keys = [child.spawn_key for child in first + second]
+    assert len(set(keys)) == 4
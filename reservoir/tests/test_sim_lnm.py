@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from reservoir.simulator import sim_lnm
+from reservoir.tasks import io
+
+
+def get_reservoir(N=30, n_inputs=2, seed=0):
+    rs = np.random.RandomState(seed)
+
+    w = rs.randn(N, N)*(rs.rand(N, N) < 0.3)
+    w = w/np.max(np.abs(np.linalg.eigvals(w)))
+
+    w_in = sim_lnm.get_input_conn(n_inputs, N, np.arange(n_inputs), factor=0.5)
+    stimulus = rs.uniform(-1, 1, (250, n_inputs))
+
+    return w_in, w, stimulus
+
+
+def iter_chunks(stimulus, chunk_len):
+    for start in range(0, len(stimulus), chunk_len):
+        yield stimulus[start:start+chunk_len]
+
+
+@pytest.mark.parametrize('activation', ['tanh', 'piecewise'])
+@pytest.mark.parametrize('chunk_len', [1, 7, 100, 250, 1000])
+def test_sim_stream_equals_sim(activation, chunk_len):
+    w_in, w, stimulus = get_reservoir()
+    ic = np.random.RandomState(1).uniform(-1, 1, len(w))
+
+    x = sim_lnm.sim(w_in, w, stimulus, ic=ic, activation=activation)
+    x_stream = np.vstack(list(sim_lnm.sim_stream(w_in, w, iter_chunks(stimulus, chunk_len), ic=ic, activation=activation)))
+
+    assert np.array_equal(x_stream, x)
+
+
+@pytest.mark.parametrize('t_perturb', [1, 99, 100, 101, 200, 249])
+def test_sim_stream_perturbation(t_perturb):
+    w_in, w, stimulus = get_reservoir()
+
+    x = sim_lnm.sim(w_in, w, stimulus, add_perturb=True, t_perturb=t_perturb, seed=3)
+    x_stream = np.vstack(list(sim_lnm.sim_stream(w_in, w, iter_chunks(stimulus, 100), add_perturb=True,
+                                                 t_perturb=t_perturb, seed=3)))
+
+    assert not np.array_equal(x, sim_lnm.sim(w_in, w, stimulus))
+    assert np.array_equal(x_stream, x)
+
+
+def test_sim_stream_io_chunks():
+    w_in, w, _ = get_reservoir(n_inputs=1)
+
+    (input_train, _), _ = io.get_sgnl_recon_IO('T1', time_len=500, seed=4)
+    chunks = io.iter_sgnl_recon_IO('T1', time_len=500, chunk_len=64, seed=4)
+
+    x = sim_lnm.sim(w_in, w, input_train)
+    assert np.array_equal(np.vstack(list(sim_lnm.sim_stream(w_in, w, chunks))), x)
+
+
+@pytest.mark.parametrize('task_ref', ['T1', 'T2'])
+def test_iter_sgnl_recon_equals_get(task_ref):
+    rng = np.random.default_rng(5)
+    chunks = [inputs for inputs, _ in io.iter_sgnl_recon_IO(task_ref, time_len=500, step_len=10, n_repeats=7, chunk_len=64, seed=rng)]
+    test_chunks = [inputs for inputs, _ in io.iter_sgnl_recon_IO(task_ref, time_len=500, step_len=10, n_repeats=7, chunk_len=64, seed=rng)]
+
+    (input_train, input_test), _ = io.get_sgnl_recon_IO(task_ref, time_len=500, step_len=10, n_repeats=7, seed=5)
+
+    assert np.array_equal(np.vstack(chunks).ravel(), np.ravel(input_train))
+    assert np.array_equal(np.vstack(test_chunks).ravel(), np.ravel(input_test))
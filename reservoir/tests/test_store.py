@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pytest
+
+from reservoir.tasks import io, store
+
+
+@pytest.mark.parametrize('task, task_ref, kwargs', [('sgnl_recon', 'T1', {'time_len': 100}),
+                                                    ('pttn_recog', 'T2', {'n_repeats': 5, 'time_len': 10})])
+def test_load_equals_io(tmp_path, task, task_ref, kwargs):
+    seed = np.random.SeedSequence(0, spawn_key=(1,))
+    path = store.materialize(str(tmp_path), task, task_ref, seed, **kwargs)
+
+    (x_train, x_test), (y_train, y_test) = io.get_io_data(task, task_ref, seed=seed, **kwargs)
+    (sx_train, sx_test), (sy_train, sy_test) = store.load(path)
+
+    for a, b in [(x_train, sx_train), (x_test, sx_test), (y_train, sy_train), (y_test, sy_test)]:
+        assert isinstance(b, np.memmap) and not b.flags.writeable
+        assert np.array_equal(a, b)
+
+
+def test_targets_deduplicated(tmp_path):
+    # signal reconstruction: the targets are the inputs
+    path = store.materialize(str(tmp_path), 'sgnl_recon', 'T1', 0, time_len=100)
+
+    assert sorted(os.listdir(path)) == ['manifest.json', 'x_test.npy', 'x_train.npy']
+
+    (x_train, x_test), (y_train, y_test) = store.load(path)
+    assert y_train is x_train and y_test is x_test
+
+
+def test_materialize_existing_is_noop(tmp_path):
+    store_dir = str(tmp_path)
+    path = store.materialize(store_dir, 'sgnl_recon', 'T1', 0, time_len=100)
+    mtimes = {f: os.stat(os.path.join(path, f)).st_mtime_ns for f in os.listdir(path)}
+
+    assert store.materialize(store_dir, 'sgnl_recon', 'T1', 0, time_len=100) == path
+    assert {f: os.stat(os.path.join(path, f)).st_mtime_ns for f in os.listdir(path)} == mtimes
+
+    # no temporary directory left behind
+    assert os.listdir(store_dir) == [os.path.basename(path)]
+    assert list(store.list_datasets(store_dir)) == [os.path.basename(path)]
+
+
+def test_materialize_concurrent_discards_copy(tmp_path, monkeypatch):
+    # another worker stores the same dataset while this one generates it
+    store_dir = str(tmp_path)
+    path = os.path.join(store_dir, store.get_key(store.get_params('sgnl_recon', 'T1', 0, time_len=100)))
+    get_io_data = io.get_io_data
+
+    def racing_get_io_data(*args, **kwargs):
+        monkeypatch.setattr(io, 'get_io_data', get_io_data)
+        store.materialize(store_dir, 'sgnl_recon', 'T1', 0, time_len=100)
+        return get_io_data(*args, **kwargs)
+
+    monkeypatch.setattr(io, 'get_io_data', racing_get_io_data)
+
+    assert store.materialize(store_dir, 'sgnl_recon', 'T1', 0, time_len=100) == path
+    assert os.listdir(store_dir) == [os.path.basename(path)]
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from reservoir import sweep
+
+from conftest import get_network
+
+
+def get_networks(N=20):
+    return {'net': {'conn': get_network(N),
+                    'input_nodes': np.array([0, 1]),
+                    'readout_modules': np.repeat([0, 1], N//2)
+                    }
+            }
+
+
+def run_experiment(out_dir, store_dir):
+    # an odd number of repeats splits pttn_recog into training and test sets
+    # of different lengths
+    io_kwargs = {'sgnl_recon': {'time_len': 200},
+                 'pttn_recog': {'n_input_nodes': 2, 'n_patterns': 3, 'n_repeats': 5, 'time_len': 10}
+                 }
+
+    return sweep.run_experiment(get_networks(), out_dir, n_samples=2, task_list=[('sgnl_recon', 'T1'), ('pttn_recog', 'T1')],
+                                alphas=[0.5, 1.0], methods=['basic', 'avg'], io_kwargs=io_kwargs, n_jobs=2, seed=0,
+                                store_dir=store_dir)
+
+
+def sort_results(df):
+    return df.sort_values(sweep.CELL_KEYS + ['module']).reset_index(drop=True)
+
+
+def test_run_experiment_resume(tmp_path):
+    out_dir, store_dir = str(tmp_path / 'results'), str(tmp_path / 'store')
+
+    df = run_experiment(out_dir, store_dir)
+    assert len(df[sweep.CELL_KEYS].drop_duplicates()) == 16
+    assert set(df['task']) == {'sgnl_recon', 'pttn_recog'}
+
+    # interrupt: drop some checkpoints and leave a partially written one
+    files = sorted(f for f in os.listdir(out_dir) if f.endswith('.parquet'))
+    for f in files[::3]: os.remove(os.path.join(out_dir, f))
+    open(os.path.join(out_dir, f'.{files[0]}.tmp'), 'w').close()
+
+    kept = {f: os.stat(os.path.join(out_dir, f)).st_mtime_ns for f in files if os.path.exists(os.path.join(out_dir, f))}
+
+    df_resumed = run_experiment(out_dir, store_dir)
+
+    # only the missing cells are run again, with the same results
+    assert {f: os.stat(os.path.join(out_dir, f)).st_mtime_ns for f in kept} == kept
+    assert sorted(f for f in os.listdir(out_dir) if f.endswith('.parquet')) == files
+    pd.testing.assert_frame_equal(sort_results(df_resumed), sort_results(df))